@@ -12,8 +12,15 @@ TODO: This needs a way to work with CMR in UAT. Currently requests for
 """
 
 import time
-import cmr
+import opendap_cmr as cmr
+import cmr_cache
+import cmr_cassette
+import cmr_flight
+import cmr_limiter
+import cmr_metrics
+import cmr_profile
 import errLog
+import granule_catalog
 
 
 def main():
@@ -24,6 +31,38 @@ def main():
     parser.add_argument("-v", "--verbose", help="Increase output verbosity.", action="store_true")
     parser.add_argument("-P", "--pretty", help="Request pretty responses from CMR.", action="store_true")
     parser.add_argument("-t", "--time", help="Time responses from CMR.", action="store_true")
+    parser.add_argument("-F", "--fan-out", help="Read the number of hits from the first page of a response and get"
+                        " the remaining pages using this many concurrent requests (default: 0, one page at a time).",
+                        type=int, default=0)
+    parser.add_argument("--cache", help="Cache CMR responses in this SQLite file. Given without a file, use"
+                        " logs/cmr_cache.sqlite.", nargs="?", const="logs/cmr_cache.sqlite", default=None)
+    parser.add_argument("--revalidate", help="With --cache, ask CMR if expired responses have changed"
+                        " before getting them again.", action="store_true")
+    parser.add_argument("-A", "--adaptive", help="Adapt the number of requests made to CMR at once to how quickly"
+                        " it answers.", action="store_true")
+    parser.add_argument("--single-flight", help="Make identical CMR queries asked at the same time share one"
+                        " request.", action="store_true")
+    parser.add_argument("--catalog", help="Look up granule URLs (-r, -R) in this granule catalog before asking CMR."
+                        " See granule_catalog.py.")
+    parser.add_argument("--metrics", help="Record each request's latency, size and status and write them, at the end,"
+                        " to <METRICS>.prom (Prometheus text) and <METRICS>.json. Given without a name, use"
+                        " logs/metrics.", nargs="?", const="logs/metrics", default=None)
+    parser.add_argument("--record", help="Record every request made and its response to this cassette file."
+                        " Given without a file, use logs/cassette.jsonl.gz.", nargs="?",
+                        const="logs/cassette.jsonl.gz", default=None)
+    parser.add_argument("--replay", help="Answer every request with the response recorded for it in this cassette"
+                        " file, without the network. Given without a file, use logs/cassette.jsonl.gz.", nargs="?",
+                        const="logs/cassette.jsonl.gz", default=None)
+    parser.add_argument("--replay-timing", help="With --replay, wait this many times as long as each recorded request"
+                        " took (default: 0, answer right away). Given without a value, use 1, the recorded timings.",
+                        nargs="?", type=float, const=1.0, default=0.0)
+    parser.add_argument("--profile", help="Profile the run with cProfile, writing a profile for each stage (listing,"
+                        " resolve, ...) to <PROFILE>-<stage>.prof, and print the functions that took the most time."
+                        " Given without a name, use logs/profile.", nargs="?", const="logs/profile", default=None)
+    parser.add_argument("-w", "--workers", help="With -B, check this many collections at once (default: 64).",
+                        type=int, default=64)
+    parser.add_argument("--decode-processes", help="Decode and process large CMR pages in this many processes"
+                        " (default: 0, decode them in the thread that read them).", type=int, default=0)
 
     group = parser.add_mutually_exclusive_group() # only one option in 'group' is allowed at a time
     group.add_argument("-p", "--provider", help="Given a provider id, by itself, print all the providers collections.")
@@ -55,6 +94,30 @@ def main():
     args = parser.parse_args()
 
     cmr.verbose = True if args.verbose else False
+    cmr.page_fan_out = args.fan_out
+    if args.cache:
+        cmr.response_cache = cmr_cache.ResponseCache(args.cache, revalidate=args.revalidate)
+    if args.adaptive:
+        cmr.limiter = cmr_limiter.AIMDLimiter()
+    if args.single_flight:
+        cmr.flights = cmr_flight.SingleFlight()
+    if args.catalog:
+        cmr.catalog = granule_catalog.GranuleCatalog(args.catalog)
+    if args.metrics:
+        cmr.metrics = cmr_metrics.Metrics()
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together")
+    if args.record:
+        cmr.cassette = cmr_cassette.Cassette(args.record, 'record')
+    elif args.replay:
+        cmr.cassette = cmr_cassette.Cassette(args.replay, 'replay', timing=args.replay_timing)
+    if args.profile:
+        cmr.profiler = cmr_profile.StageProfiler()
+        cmr.profiler.start()
+    if args.decode_processes > 0:
+        from concurrent.futures import ProcessPoolExecutor
+        cmr.decode_pool = ProcessPoolExecutor(max_workers=args.decode_processes)
+    cmr.set_pool_size(max(args.workers if args.opendap_brutishly else 1, args.fan_out))
     pretty = True if args.pretty else False
     opendap = True if args.opendap else False
     granules = True if args.granules else False
@@ -62,32 +125,40 @@ def main():
 
     try:
         start = time.time()
-        if args.collection and granules:
-            if args.date_range:
-                entries = cmr.get_collection_granules_temporal(args.collection, args.date_range, pretty=pretty,
-                                                               descending=args.descending)
+        # The profile's stage (--profile) for the query and reading its entries
+        with cmr.trace_span('resolve' if args.resty_path or args.collection_and_title else 'listing'):
+            if args.collection and granules:
+                # Granule listings are printed as the pages arrive
+                entries = cmr.iter_collection_granules(args.collection, descending=args.descending,
+                                                       time_range=args.date_range or '',
+                                                       json_processor=cmr.collection_granules_dict, pretty=pretty)
+            elif args.collection and first_last:
+                entries = cmr.get_collection_granules_umm_first_last(args.collection, pretty=pretty)
+            elif args.collection:
+                entries = cmr.get_collection_entry(args.collection, pretty=pretty, count=args.count)
+            elif args.resty_path:
+                entries = cmr.decompose_resty_url(args.resty_path, pretty=pretty)
+            elif args.collection_and_title:
+                collection, title = args.collection_and_title.split(':')
+                entries = cmr.get_related_urls(collection, title, pretty=pretty)
+            elif args.provider and args.opendap_brutishly:
+                entries = cmr.get_provider_opendap_collections_brutishly(args.provider, workers=args.workers)
             else:
-                entries = cmr.get_collection_granules(args.collection, pretty=pretty, descending=args.descending)
-        elif args.collection and first_last:
-            entries = cmr.get_collection_granules_umm_first_last(args.collection, pretty=pretty)
-        elif args.collection:
-            entries = cmr.get_collection_entry(args.collection, pretty=pretty, count=args.count)
-        elif args.resty_path:
-            entries = cmr.decompose_resty_url(args.resty_path, pretty=pretty)
-        elif args.collection_and_title:
-            collection, title = args.collection_and_title.split(':')
-            entries = cmr.get_related_urls(collection, title, pretty=pretty)
-        elif args.provider and args.opendap_brutishly:
-            entries = cmr.get_provider_opendap_collections_brutishly(args.provider)
-        else:
-            entries = cmr.get_provider_collections(args.provider, opendap, pretty=pretty)
-        duration = time.time() - start
+                entries = cmr.get_provider_collections(args.provider, opendap, pretty=pretty)
 
-        for key, value in entries.items():
-            print(f'{key}: {value}')
+            total = 0
+            for key, value in entries.items() if type(entries) is dict else entries:
+                print(f'{key}: {value}')
+                total += 1
+        duration = time.time() - start
 
-        print(f'Total entries: {len(entries)}') if len(entries) > 1 else ''
+        print(f'Total entries: {total}') if total > 1 else ''
         print(f'Request time: {duration:.1f}s') if args.time else ''
+        print(cmr.limiter.summary()) if cmr.limiter and args.time else ''
+        print(cmr.pool_stats()) if args.time else ''
+        print(cmr.flights.summary()) if cmr.flights and args.time else ''
+        print(cmr.metrics.summary()) if cmr.metrics and args.time else ''
+        print(cmr.cassette.summary()) if cmr.cassette and args.time else ''
 
     except cmr.CMRException as e:
         err = "/////////////////////////////////////////////////////\n"
@@ -95,6 +166,18 @@ def main():
         errLog.output_errlog(err)
         print(e)
 
+    finally:
+        if cmr.decode_pool:
+            cmr.decode_pool.shutdown()
+        if cmr.metrics:
+            cmr.metrics.write(args.metrics)
+        if cmr.cassette:
+            cmr.cassette.close()
+        if cmr.profiler:
+            cmr.profiler.stop()
+            print(f'Profiles: {", ".join(cmr.profiler.write(args.profile))}')
+            print(cmr.profiler.summary())
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""
+Compare the brute-force OPeNDAP collection scan using a fixed 64 threads with
+the same scan using the adaptive (AIMD) concurrency limiter. The CMR stand-in
+is set up to slow down when more than 'capacity' requests are in flight and to
+refuse requests with 429 beyond 'throttle', like a busy CMR.
+
+The scan is the one get_provider_opendap_collections_brutishly() makes, except
+that a collection whose request was refused is counted as an error instead of
+stopping the scan. Refused requests are not retried, so the errors show how
+often each approach is throttled. The stand-in runs in its own process.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_adaptive_concurrency -c 2000 -l 0.05 -C 24 -T 48
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cmr_limiter
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+def scan(ccids: list, workers: int, service: str) -> list:
+    def check(ccid: str):
+        try:
+            return opendap_cmr.collection_has_opendap(ccid, service=service)
+        except opendap_cmr.CMRException:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [result for result in executor.map(check, ccids) if result is not None]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark a fixed number of threads against the adaptive "
+                                                 "concurrency limiter using a local CMR stand-in.")
+    parser.add_argument("-c", "--collections", help="number of collections to scan (default: 2000)", type=int,
+                        default=2000)
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0.05)",
+                        type=float, default=0.05)
+    parser.add_argument("-C", "--capacity", help="requests in flight before the stand-in slows down (default: 24)",
+                        type=int, default=24)
+    parser.add_argument("-T", "--throttle", help="requests in flight before the stand-in returns 429 (default: 48)",
+                        type=int, default=48)
+    parser.add_argument("-w", "--workers", help="threads (default: 64)", type=int, default=64)
+    args = parser.parse_args()
+
+    standin = CMRStandIn(collections=args.collections, granules=10, latency=args.latency, capacity=args.capacity,
+                         throttle=args.throttle).start(process=True)
+    opendap_cmr.max_retries = 0
+    try:
+        ccids = [f'C{n}-POCLOUD' for n in range(1, args.collections + 1)]
+        print(f'{len(ccids)} collections, {args.latency * 1000:.0f}ms latency, capacity {args.capacity}, '
+              f'throttle {args.throttle}, {args.workers} workers')
+
+        for name, limiter in (('fixed', None), ('adaptive', cmr_limiter.AIMDLimiter(maximum=args.workers))):
+            opendap_cmr.limiter = limiter
+            start = time.time()
+            results = scan(ccids, args.workers, standin.url)
+            duration = time.time() - start
+            print(f'{name:>10}: {duration:6.2f}s, {len(results) / duration:7.1f} collections/s, '
+                  f'{len(ccids) - len(results)} errors')
+            print(f'{"":>10}  {limiter.summary()}') if limiter else ''
+
+    finally:
+        opendap_cmr.limiter = None
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""
+Compare the wall-clock time needed to list the granules of many collections
+using the thread-per-request approach (opendap_cmr in a ThreadPoolExecutor)
+and the asyncio client (cmr_async). Both run against the local CMR stand-in
+so the results are not swamped by the variability of the production CMR.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_async_cmr -c 20 -g 5000 -l 0.05
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import cmr_async
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+def threaded(ccids: list, workers: int, service: str) -> dict:
+    get_ids = partial(opendap_cmr.get_collection_granule_ids, service=service)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(ccids, executor.map(get_ids, ccids)))
+
+
+def asynchronous(ccids: list, workers: int, service: str) -> dict:
+    return cmr_async.get_collections_granule_ids(ccids, connections=workers, service=service)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the threaded and asyncio CMR clients against a local "
+                                                 "CMR stand-in.")
+    parser.add_argument("-c", "--collections", help="number of collections to list (default: 20)", type=int,
+                        default=20)
+    parser.add_argument("-g", "--granules", help="granules per collection (default: 5000)", type=int, default=5000)
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0.05)",
+                        type=float, default=0.05)
+    parser.add_argument("-w", "--workers", help="threads, or connections for asyncio (default: 16)", type=int,
+                        default=16)
+    args = parser.parse_args()
+
+    with CMRStandIn(collections=args.collections, granules=args.granules, latency=args.latency) as standin:
+        ccids = [f'C{n}-POCLOUD' for n in range(1, args.collections + 1)]
+        print(f'{len(ccids)} collections x {args.granules} granules, {args.latency * 1000:.0f}ms latency, '
+              f'{args.workers} workers')
+
+        for name, lister in (('thread-per-request', threaded), ('asyncio', asynchronous)):
+            requests_before = standin.requests
+            start = time.time()
+            results = lister(ccids, args.workers, standin.url)
+            duration = time.time() - start
+            granules = sum(len(ids) for ids in results.values())
+            print(f'{name:>20}: {duration:6.2f}s, {granules} granules, {standin.requests - requests_before} requests')
+
+
+if __name__ == "__main__":
+    main()
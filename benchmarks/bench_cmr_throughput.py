@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+"""
+Measure the throughput of the main opendap_cmr operations against the local CMR
+stand-in: granules/sec and requests/sec for get_collection_granule_ids(),
+collections/sec and requests/sec for get_provider_opendap_collections_brutishly()
+and granules/sec for s3_driver.query_cmr(). The requests are counted with
+cmr_metrics, so retries of injected errors are included.
+
+The stand-in runs in its own process so that it does not compete with the client
+for the GIL. Use -r for responses the size of CMR's, and -j, -e and -x to add
+jitter, errors and cut-short responses. s3_driver needs earthaccess and boto3;
+without them, query_cmr() is skipped.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_cmr_throughput -g 20000 -c 200 -l 0.02 -r
+    python3 -m benchmarks.bench_cmr_throughput -g 20000 -l 0.02 -j 0.05 -e 0.02 -F 8
+"""
+
+import time
+
+import cmr_metrics
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+CCID = 'C1-POCLOUD'
+
+
+def measure(name: str, unit: str, function: callable, repeat: int):
+    """Run function 'repeat' times and print the fastest run. function returns the number of items it got."""
+    best = None
+    for _ in range(repeat):
+        opendap_cmr.metrics = cmr_metrics.Metrics()
+        start = time.perf_counter()
+        items = function()
+        seconds = time.perf_counter() - start
+        report = opendap_cmr.metrics.report()['endpoints'].values()
+        requests = sum(endpoint['requests'] for endpoint in report)
+        retries = sum(endpoint['retries'] for endpoint in report)
+        size = sum(endpoint['bytes'] for endpoint in report)
+        if best is None or seconds < best[0]:
+            best = (seconds, items, requests, retries, size)
+    opendap_cmr.metrics = None
+
+    seconds, items, requests, retries, size = best
+    print(f'{name:<44}{seconds:8.2f}s{items / seconds:>10.0f} {unit:<12}{requests / seconds:>8.1f} req/s'
+          f'{size / seconds / 1024 ** 2:>8.1f} MB/s  ({requests} requests, {retries} retries)')
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark opendap_cmr throughput against a local CMR stand-in.")
+    parser.add_argument("-g", "--granules", help="granules in each collection (default: 20000)", type=int,
+                        default=20000)
+    parser.add_argument("-c", "--collections", help="collections for the provider (default: 200)", type=int,
+                        default=200)
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0.02)",
+                        type=float, default=0.02)
+    parser.add_argument("-j", "--jitter", help="add up to this many seconds to each response (default: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-e", "--error-rate", help="answer this fraction of the requests with a 5xx (default: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-x", "--truncate-rate", help="cut this fraction of the responses short (default: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-r", "--realistic", help="make the granule entries copies of real ones",
+                        action="store_true")
+    parser.add_argument("-F", "--fan-out", help="get the pages of a response with this many requests at once "
+                                                "(default: 0, one at a time)", type=int, default=0)
+    parser.add_argument("-w", "--workers", help="threads for the brutish provider search (default: 64)", type=int,
+                        default=64)
+    parser.add_argument("-n", "--repeat", help="run each case this many times and report the fastest (default: 3)",
+                        type=int, default=3)
+    args = parser.parse_args()
+
+    opendap_cmr.page_fan_out = args.fan_out
+    opendap_cmr.flights = None  # Each call is measured on its own
+    standin = CMRStandIn(collections=args.collections, granules=args.granules, latency=args.latency,
+                         jitter=args.jitter, error_rate=args.error_rate, truncate_rate=args.truncate_rate,
+                         realistic=args.realistic, seed=1).start(process=True)
+    try:
+        print(f'{args.granules} granules, {args.collections} collections, {args.latency * 1000:.0f}ms latency'
+              f' (+{args.jitter * 1000:.0f}ms jitter), {args.error_rate:.0%} errors, {args.truncate_rate:.0%} cut short,'
+              f' {"realistic" if args.realistic else "small"} entries, fan-out {args.fan_out}')
+
+        measure('get_collection_granule_ids', 'granules/s',
+                lambda: len(opendap_cmr.get_collection_granule_ids(CCID, service=standin.url)), args.repeat)
+        measure('get_provider_opendap_collections_brutishly', 'colls/s',
+                lambda: len(opendap_cmr.get_provider_opendap_collections_brutishly(
+                    'POCLOUD', workers=args.workers, service=standin.url)), args.repeat)
+
+        try:
+            import s3_driver
+        except ImportError as e:
+            print(f'{"s3_driver.query_cmr":<44} skipped: {e}')
+        else:
+            s3_driver.verbose = False
+            measure('s3_driver.query_cmr', 'granules/s',
+                    lambda: len(s3_driver.query_cmr(CCID, service=standin.url)), args.repeat)
+    finally:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""
+Measure how the time and memory used by the response processors and the paging
+functions grow with the number of granules, using collections from a synthetic
+corpus (see cmr_corpus.py) of 10^3 granules and up.
+
+For each size, every response processor decodes and processes all the pages of
+a collection of that many granules, made by the corpus and read directly (not
+over HTTP), and its results are merged the way process_request() merges them.
+The time is per granule; the memory is what the merged results hold, per
+granule, and the peak while processing (including the page being processed).
+With -m, the memory is measured with tracemalloc in a second pass, so that it
+does not slow the first; that pass takes several times as long. Then the paging functions get the same collection from the CMR stand-in,
+serving the corpus from its own process.
+
+If the time or memory per granule grows with the size, a function is doing more
+than linear work. Run this from the top of the repository:
+    python3 -m benchmarks.bench_corpus_scaling -s 1000 10000 100000
+    python3 -m benchmarks.bench_corpus_scaling -s 1000 10000 -m
+    python3 -m benchmarks.bench_corpus_scaling -s 100000 1000000 --no-paging
+"""
+
+import time
+import tracemalloc
+
+import opendap_cmr
+from benchmarks.cmr_corpus import Corpus
+from benchmarks.cmr_standin import CMRStandIn
+
+CCID = 'C1-POCLOUD'
+
+"""The response processors, by the kind of page they read."""
+PROCESSORS = {'umm_json': (opendap_cmr.granule_ur_dict, opendap_cmr.granule_ur_dict_2, opendap_cmr.granule_ur_store,
+                           opendap_cmr.granule_data_url_dict, opendap_cmr.granule_data_urls_by_id,
+                           opendap_cmr.granule_time_dict),
+              'json': (opendap_cmr.collection_granules_dict, opendap_cmr.collection_granules_store,
+                       opendap_cmr.collection_granule_and_url_dict, opendap_cmr.collection_granules_list)}
+
+
+def merge(results, page):
+    """Merge one page's results into the results so far, as process_request() and process_request_list() do."""
+    if isinstance(page, list):
+        results = results if results is not None else []
+        results.extend(page)
+        return results
+    return opendap_cmr.merge_dict(results if results is not None else {}, page)
+
+
+def process_pages(corpus: Corpus, kind: str, processors: tuple, measure: callable) -> dict:
+    """
+    Decode and process each page of the collection with each processor, merging
+    each processor's results, and measure only that.
+
+    :param measure: A function that returns a number, e.g., time.perf_counter
+    :returns: A dictionary like {processor: the sum of the changes in 'measure'}
+    """
+    totals = dict.fromkeys(processors, 0)
+    results = dict.fromkeys(processors)
+    for page in corpus.pages(CCID, kind):
+        for processor in processors:
+            before = measure()
+            results[processor] = merge(results[processor], processor(opendap_cmr.json_decoder(page)))
+            totals[processor] += measure() - before
+    return totals
+
+
+def allocated() -> int:
+    return tracemalloc.get_traced_memory()[0]
+
+
+def traced(function: callable) -> tuple:
+    """
+    Run function with tracemalloc.
+
+    :returns: The tuple (what the function returned, the peak bytes allocated while it ran)
+    """
+    tracemalloc.start()
+    try:
+        before = allocated()
+        result = function()
+        return result, tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def process_retained(function: callable) -> int:
+    """Call function, which must be traced, and return the bytes still allocated for what it returned."""
+    before = allocated()
+    result = function()
+    retained = allocated() - before
+    del result
+    return retained
+
+
+def report(name: str, granules: int, seconds: float, retained=None, peak=None):
+    memory = f'{retained / granules:9.0f}B/g{peak / 1024 ** 2:9.1f}MB peak' if retained is not None else ''
+    print(f'{name:<40}{granules:>10}{seconds:9.2f}s{seconds / granules * 1e6:9.1f}us/g{memory}')
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark how the response processors and the paging functions "
+                                                 "scale with the number of granules.")
+    parser.add_argument("-s", "--sizes", help="the numbers of granules to measure (default: 1000 10000 100000)",
+                        type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-m", "--memory", help="also measure the memory held by the results and the peak memory "
+                        "used", action="store_true")
+    parser.add_argument("--no-paging", help="measure only the response processors", action="store_true")
+    args = parser.parse_args()
+
+    opendap_cmr.flights = None  # Each call is measured on its own
+    memory = f'{"retained":>11}{"peak":>13}' if args.memory else ''
+    print(f'{"":<40}{"granules":>10}{"time":>10}{"per granule":>13}{memory}')
+    for size in args.sizes:
+        # One collection, with cloud OPeNDAP URLs, so every processor finds what it looks for
+        corpus = Corpus(collections=1, granules=size, opendap=1.0, cloud=1.0, associated=1.0)
+        for kind, processors in PROCESSORS.items():
+            times = process_pages(corpus, kind, processors, time.perf_counter)
+            retained, peak = {}, None
+            if args.memory:
+                retained, peak = traced(lambda: process_pages(corpus, kind, processors, allocated))
+            for processor in processors:
+                report(f'{processor.__name__} ({kind})', size, times[processor], retained.get(processor), peak)
+
+        if args.no_paging:
+            continue
+        standin = CMRStandIn(latency=args.latency, corpus=corpus).start(process=True)
+        try:
+            paging = {'process_request (umm_json)': lambda: opendap_cmr.process_request(
+                          f'{standin.url}/search/granules.umm_json?collection_concept_id={CCID}',
+                          opendap_cmr.granule_ur_dict_2, opendap_cmr.get_session(), page_size=2000),
+                      'get_collection_granule_ids (json)': lambda: opendap_cmr.get_collection_granule_ids(
+                          CCID, service=standin.url)}
+            for name, function in paging.items():
+                start = time.perf_counter()
+                function()
+                seconds = time.perf_counter() - start
+                if args.memory:
+                    report(name, size, seconds, *traced(lambda: process_retained(function)))
+                else:
+                    report(name, size, seconds)
+        finally:
+            standin.stop()
+            opendap_cmr.close_sessions()
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""
+Compare the memory and build time of the dict of tuples that
+collection_granules_dict() and granule_ur_dict_2() return with a GranuleStore
+holding the same granules. The granules are made up to look like the ones in
+unit_tests/CMR_Responses, numbered from G2081588885-POCLOUD.
+
+The memory is what tracemalloc sees allocated while the container is built and
+still held, so it includes the keys, tuples and strings of the dict. The build
+time is measured separately, without tracemalloc.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_granule_store -g 1000000
+"""
+
+import gc
+import time
+import tracemalloc
+
+from granule_store import GranuleStore
+
+OPENDAP = 'https://opendap.earthdata.nasa.gov/providers/POCLOUD/collections/ASCATB-L2-25km/granules'
+
+
+def granules(count: int, kind: str):
+    """Yield (concept id, tuple) pairs like those the response processors make"""
+    for n in range(count):
+        title = f'ascat_2012{n % 12 + 1:02}{n % 28 + 1:02}_{n % 240000:06}_metopb_{n:08}_eps_o_250_2101_ovw.l2'
+        if kind == 'titles':
+            yield f'G{2081588885 + n}-POCLOUD', (title, f'{title}.nc')
+        else:
+            yield f'G{2081588885 + n}-POCLOUD', (title, f'{OPENDAP}/{title}')
+
+
+def measure(build) -> tuple:
+    """:returns: The bytes the container build() makes holds and the seconds it took to build"""
+    gc.collect()
+    start = time.perf_counter()
+    build()
+    duration = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    container = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del container
+    return size, duration
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the memory used by a dict of granule tuples and by a "
+                                                 "GranuleStore.")
+    parser.add_argument("-g", "--granules", help="granules (default: 1000000)", type=int, default=1000000)
+    args = parser.parse_args()
+
+    print(f'{args.granules} granules')
+    print(f'{"records":>12} {"container":>12} {"MB":>8} {"bytes/granule":>14} {"build":>8}')
+    for kind, fields in (('titles', ('title', 'producer_granule_id')), ('urls', ('native_id', 'url'))):
+        for name, build in (('dict', lambda: dict(granules(args.granules, kind))),
+                            ('GranuleStore', lambda: GranuleStore(fields, granules(args.granules, kind)))):
+            size, duration = measure(build)
+            print(f'{kind:>12} {name:>12} {size / 1e6:8.1f} {size / args.granules:14.0f} {duration:7.2f}s')
+
+
+if __name__ == "__main__":
+    main()
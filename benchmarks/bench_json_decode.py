@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+"""
+Measure the time to decode and process large pages of CMR responses. The pages
+are made by repeating the granules in unit_tests/CMR_Responses (with unique ids)
+up to the CMR maximum of 2000 granules per page:
+
+    g1  granules.umm_json, processed with granule_data_url_dict()
+    g2  granules.json, processed with collection_granules_dict()
+    g3  granules.json, processed with collection_granules_dict()
+
+First each decoder (json and, if it is installed, orjson) decodes and processes
+every kind of page in this thread. Then a batch of pages is decoded and processed
+one at a time, by a pool of threads and by a pool of processes, which is what
+opendap_cmr.decode_pool does. Threads cannot decode in parallel because of the
+GIL; processes can, but only when there is more than one CPU.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_json_decode -p 64 -w 4
+"""
+
+import copy
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import opendap_cmr
+from unit_tests import CMR_Responses
+
+PROCESSORS = {'g1': opendap_cmr.granule_data_url_dict,
+              'g2': opendap_cmr.collection_granules_dict,
+              'g3': opendap_cmr.collection_granules_dict}
+
+
+def scaled_page(name: str, size: int) -> bytes:
+    """Make a page of 'size' granules from one of the CMR_Responses and encode it"""
+    page = copy.deepcopy(getattr(CMR_Responses, name))
+    entries = page['items'] if 'items' in page else page['feed']['entry']
+    template = entries[0]
+    entries.clear()
+    for n in range(size):
+        entry = copy.deepcopy(template)
+        if 'meta' in entry:
+            entry['meta']['concept-id'] = f'G{n}-POCLOUD'
+            entry['umm']['GranuleUR'] = f'{entry["umm"]["GranuleUR"]}.{n}'
+            for url in entry['umm']['RelatedUrls']:
+                url['URL'] = f'{url["URL"]}.{n}'
+        else:
+            entry['id'] = f'G{n}-POCLOUD'
+            entry['title'] = f'{entry["title"]}.{n}'
+        entries.append(entry)
+    return json.dumps(page).encode()
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def best_of(repeat: int, function, *args) -> float:
+    return min(timed(function, *args) for _ in range(repeat))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark decoding and processing large CMR pages.")
+    parser.add_argument("-s", "--page-size", help="granules per page (default: 2000)", type=int, default=2000)
+    parser.add_argument("-p", "--pages", help="pages in the batch (default: 64)", type=int, default=64)
+    parser.add_argument("-w", "--workers", help="threads or processes (default: 4)", type=int, default=4)
+    parser.add_argument("-r", "--repeat", help="report the best of this many runs (default: 5)", type=int,
+                        default=5)
+    args = parser.parse_args()
+
+    pages = {name: scaled_page(name, args.page_size) for name in PROCESSORS}
+    decoders = {'json': json.loads}
+    if opendap_cmr.orjson is not None:
+        decoders['orjson'] = opendap_cmr.orjson.loads
+
+    print(f'{args.page_size} granules per page, {os.cpu_count()} CPUs')
+    print(f'{"page":>6} {"MB":>6} ' + ' '.join(f'{name:>16}' for name in decoders))
+    for name, body in pages.items():
+        times = []
+        for decoder in decoders.values():
+            opendap_cmr.json_decoder = decoder
+            times.append(best_of(args.repeat, opendap_cmr.decode_and_process, body, PROCESSORS[name]))
+        print(f'{name:>6} {len(body) / 1e6:6.2f} '
+              + ' '.join(f'{t * 1000:8.1f}ms {len(body) / t / 1e6:4.0f}MB/s' for t in times))
+
+    opendap_cmr.json_decoder = list(decoders.values())[-1]
+    body = pages['g1']
+    batch = [body] * args.pages
+    processor = PROCESSORS['g1']
+    print(f'\n{args.pages} g1 pages ({len(body) * args.pages / 1e6:.0f}MB), {args.workers} workers, '
+          f'{list(decoders)[-1]}')
+
+    def one_at_a_time():
+        for b in batch:
+            opendap_cmr.decode_and_process(b, processor)
+
+    with ThreadPoolExecutor(max_workers=args.workers) as threads, \
+            ProcessPoolExecutor(max_workers=args.workers) as processes:
+        list(processes.map(opendap_cmr.decode_and_process, batch[:args.workers], [processor] * args.workers))
+        for name, run in (('single', one_at_a_time),
+                          ('threads', lambda: list(threads.map(opendap_cmr.decode_and_process, batch,
+                                                               [processor] * len(batch)))),
+                          ('processes', lambda: list(processes.map(opendap_cmr.decode_and_process, batch,
+                                                                   [processor] * len(batch))))):
+            duration = best_of(args.repeat, run)
+            print(f'{name:>10}: {duration:6.2f}s, {args.pages / duration:6.1f} pages/s')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+"""
+Compare searching a list of providers for OPeNDAP collections one provider at a
+time, each with its own pool of threads (what find_collections.py used to do),
+with searching them all at once in one shared pool of the same size
+(opendap_cmr.iter_providers_opendap_collections()).
+
+The providers are like the real ones: one has many collections, a few have
+some and most have a handful. The stand-in runs in its own process.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_providers -l 0.05 -w 64
+"""
+
+import time
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+PROVIDERS = {'POCLOUD': 1500, 'GES_DISC': 400, 'LPCLOUD': 150, 'NSIDC_ECS': 80, 'ORNL_CLOUD': 60,
+             **{f'SMALL_{n}': n % 7 + 1 for n in range(40)}}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark searching providers one at a time and all at once.")
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0.05)",
+                        type=float, default=0.05)
+    parser.add_argument("-w", "--workers", help="threads (default: 64)", type=int, default=64)
+    args = parser.parse_args()
+
+    standin = CMRStandIn(collections=PROVIDERS, granules=1, latency=args.latency).start(process=True)
+    try:
+        print(f'{len(PROVIDERS)} providers, {sum(PROVIDERS.values())} collections, '
+              f'{args.latency * 1000:.0f}ms latency, {args.workers} workers')
+
+        start = time.time()
+        for provider in PROVIDERS:
+            opendap_cmr.get_provider_opendap_collections_brutishly(provider, workers=args.workers,
+                                                                   service=standin.url)
+        sequential = time.time() - start
+        print(f'{"one at a time":>15}: {sequential:6.2f}s')
+
+        start = time.time()
+        first = None
+        for _ in opendap_cmr.iter_providers_opendap_collections(list(PROVIDERS), workers=args.workers,
+                                                                service=standin.url):
+            first = first or time.time() - start
+        shared = time.time() - start
+        print(f'{"all at once":>15}: {shared:6.2f}s, first provider done after {first:.2f}s '
+              f'({sequential / shared:.1f}x)')
+    finally:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
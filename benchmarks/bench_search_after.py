@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""
+Measure how the time to get one page of granules changes as the walk through
+a large collection gets deeper, for page_num paging and for CMR-Search-After
+paging. The local CMR stand-in charges page_num requests for the results they
+skip, which is how CMR behaves.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_search_after -g 200000 -d 0.02
+"""
+
+import time
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+def page_latencies(cmr_query_url: str, page_size: int) -> list:
+    """Walk all the pages of a response and return the time each page took"""
+    latencies = []
+    start = time.perf_counter()
+    for _ in opendap_cmr.cmr_pages(cmr_query_url, opendap_cmr.get_session(), page_size):
+        now = time.perf_counter()
+        latencies.append(now - start)
+        start = now
+    return latencies
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark page_num and CMR-Search-After paging against a local "
+                                                 "CMR stand-in.")
+    parser.add_argument("-g", "--granules", help="granules in the collection (default: 200000)", type=int,
+                        default=200000)
+    parser.add_argument("-s", "--page-size", help="granules per page (default: 2000)", type=int, default=2000)
+    parser.add_argument("-d", "--paging-cost", help="seconds the stand-in adds to a page_num request for every "
+                                                    "10,000 results it skips (default: 0.02)", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with CMRStandIn(collections=1, granules=args.granules, paging_cost=args.paging_cost) as standin:
+        cmr_query_url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        print(f'{args.granules} granules, {args.page_size} per page')
+        print(f'{"paging":>14} {"total":>8} {"first":>8} {"25%":>8} {"50%":>8} {"75%":>8} {"last":>8}')
+
+        for name, search_after in (('page_num', False), ('search-after', True)):
+            opendap_cmr.use_search_after = search_after
+            latencies = page_latencies(cmr_query_url, args.page_size)
+            n = len(latencies) - 1
+            depths = [latencies[int(n * f)] * 1000 for f in (0, 0.25, 0.5, 0.75, 1)]
+            print(f'{name:>14} {sum(latencies):7.2f}s ' + ' '.join(f'{ms:6.1f}ms' for ms in depths))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Measure the cold-start time of each command line tool: how long a new Python
+interpreter takes to import it, which every run (even '--help') and every test
+that imports it pays before any work is done.
+
+Each module is imported in a new interpreter with 'python -X importtime', a few
+times, and the median wall time is reported, less the time the interpreter
+takes to start and do nothing. The imports that took the most time themselves
+are listed for each module. A module that cannot be imported here (e.g., when
+boto3 is not installed) is reported with its error, and the run fails (exit
+status 1).
+
+To catch regressions, save the times and compare later runs with them; the run
+also fails if any module got slower by more than the tolerance:
+
+    python3 -m benchmarks.bench_startup --save logs/startup.json
+    python3 -m benchmarks.bench_startup --baseline logs/startup.json -t 0.25
+
+Run this from the top of the repository.
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+"""The command line tools, and opendap_cmr, which they all import."""
+ENTRY_POINTS = ('opendap_cmr', 'ask_cmr', 'find_collections', 'opendap_providers', 's3_driver', 'cmr_trace',
+                'cmr_sampler')
+
+"""Seconds a module's time may grow, whatever the tolerance, before it is a regression; less is noise."""
+NOISE = 0.010
+
+
+def import_once(module: str) -> tuple:
+    """
+    Import a module in a new interpreter.
+
+    :returns: The tuple (wall seconds, the interpreter's stderr, its exit status)
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}' if module else 'pass'],
+                            capture_output=True, text=True, cwd=os.getcwd())
+    return time.perf_counter() - start, result.stderr, result.returncode
+
+
+def self_times(importtime: str) -> dict:
+    """
+    Read the output of 'python -X importtime'.
+
+    :returns: A dictionary like {module: microseconds spent importing it, not counting the modules it imported}
+    """
+    times = {}
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(own)
+    return times
+
+
+def measure(module: str, runs: int, startup=()) -> dict:
+    """
+    :param startup: The modules the interpreter imports when it starts, left out of 'slowest'
+    :returns: A dictionary with the median 'seconds' of 'runs' imports and the 'slowest' imports,
+     or the 'error' the import failed with
+    """
+    seconds, imports = [], None
+    for _ in range(runs):
+        elapsed, stderr, status = import_once(module)
+        if status != 0:
+            return {'error': stderr.strip().splitlines()[-1]}
+        seconds.append(elapsed)
+        imports = imports or self_times(stderr)
+    slowest = sorted(((name, own) for name, own in imports.items() if name not in startup),
+                     key=lambda item: item[1], reverse=True)
+    return {'seconds': statistics.median(seconds), 'slowest': slowest}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Measure how long each command line tool takes to import.")
+    parser.add_argument("-r", "--runs", help="the number of times each module is imported (default: 5)", type=int,
+                        default=5)
+    parser.add_argument("-n", "--top", help="the number of slowest imports to list for each module (default: 5)",
+                        type=int, default=5)
+    parser.add_argument("-m", "--modules", help="the modules to import (default: all the tools)", nargs="+",
+                        default=ENTRY_POINTS)
+    parser.add_argument("--save", help="write the times to this JSON file")
+    parser.add_argument("--baseline", help="compare the times with those saved in this JSON file")
+    parser.add_argument("-t", "--tolerance", help="with --baseline, the fraction a time may grow before it is a"
+                        " regression (default: 0.25)", type=float, default=0.25)
+    args = parser.parse_args()
+
+    starts = [import_once('') for _ in range(args.runs)]
+    interpreter = statistics.median(seconds for seconds, _, _ in starts)
+    startup = set(self_times(starts[0][1]))
+    print(f'Interpreter start: {interpreter * 1e3:.0f}ms (not counted below)')
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    times, regressions, failures = {}, [], []
+    for module in args.modules:
+        result = measure(module, args.runs, startup)
+        if 'error' in result:
+            print(f'{module:<20} {result["error"]}')
+            failures.append(module)
+            continue
+        times[module] = max(result['seconds'] - interpreter, 0.0)
+        change = ''
+        if module in baseline:
+            growth = times[module] / baseline[module] - 1 if baseline[module] > 0 else 0.0
+            change = f'{growth:+8.0%} vs {baseline[module] * 1e3:.0f}ms'
+            if growth > args.tolerance and times[module] - baseline[module] > NOISE:
+                regressions.append(module)
+                change += ' REGRESSION'
+        print(f'{module:<20}{times[module] * 1e3:7.0f}ms {change}')
+        for name, microseconds in result['slowest'][:args.top]:
+            print(f'{"":<24}{microseconds / 1e3:7.1f}ms  {name}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(times, f, indent=2)
+    if regressions:
+        print(f'Slower than the baseline: {", ".join(regressions)}')
+    if failures:
+        print(f'Could not be imported: {", ".join(failures)}')
+    if regressions or failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+"""
+Compare finding a collection's granules one month at a time from 1970 to now,
+as s3_driver.process_ccid() used to, with planning windows of about the same
+number of granules from the collection's temporal extent
+(temporal_plan.plan_collection()) and listing the windows concurrently.
+
+It also compares the requests and bytes it takes to count the granules by
+month for the fileOutput summary by listing them all and by hits-only queries
+(temporal_plan.collection_monthly_hits()).
+
+The stand-in's granules are one a day from 2000-01-01, so '-g 1500' is a
+collection with about four years of data. 
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_temporal_plan -g 1500 -l 0.05
+"""
+
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import opendap_cmr
+import temporal_plan
+from benchmarks.cmr_standin import CMRStandIn
+
+CCID = 'C1-POCLOUD'
+
+
+def list_granules(url: str, start: datetime.datetime, end: datetime.datetime) -> dict:
+    query = f'{url}/search/granules.umm_json?collection_concept_id={CCID}' \
+            f'&temporal={temporal_plan.cmr_range(start, end)}'
+    return opendap_cmr.process_request(query, opendap_cmr.granule_ur_dict_2, opendap_cmr.get_session(),
+                                       page_size=2000)
+
+
+def by_month(url: str) -> int:
+    granules = {}
+    for year in range(1970, datetime.date.today().year + 1):
+        for month in range(1, 13):
+            start = datetime.datetime(year, month, 1)
+            end = datetime.datetime(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(seconds=1)
+            granules.update(list_granules(url, start, end))
+    return len(granules)
+
+
+def by_plan(url: str, target: int, workers: int) -> tuple:
+    windows = temporal_plan.plan_collection(CCID, target=target, workers=workers, service=url)
+    granules = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for found in executor.map(lambda window: list_granules(url, window[0], window[1]), windows):
+            granules.update(found)
+    return len(granules), len(windows)
+
+
+def summary_by_listing(url: str) -> dict:
+    query = f'{url}/search/granules.umm_json?collection_concept_id={CCID}'
+    times = opendap_cmr.process_request(query, opendap_cmr.granule_time_dict, opendap_cmr.get_session(),
+                                        page_size=2000)
+    months = {}
+    for beginning, _ in times.values():
+        month = (int(beginning[:4]), int(beginning[5:7]))
+        months[month] = months.get(month, 0) + 1
+    return months
+
+
+def measure(standin: CMRStandIn, name: str, function: callable):
+    requests, sent = standin.requests, standin.bytes_sent
+    start = time.time()
+    months = function()
+    print(f'{name:>10}: {time.time() - start:6.2f}s, {standin.requests - requests} requests, '
+          f'{(standin.bytes_sent - sent) / 1000:.0f}kB, {sum(months.values())} granules')
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark month-by-month and planned granule discovery.")
+    parser.add_argument("-g", "--granules", help="granules in the collection, one a day (default: 1500)",
+                        type=int, default=1500)
+    parser.add_argument("-l", "--latency", help="seconds the stand-in adds to each response (default: 0.05)",
+                        type=float, default=0.05)
+    parser.add_argument("-s", "--window-size", help="the most granules in a window (default: 2000)",
+                        type=int, default=2000)
+    parser.add_argument("-w", "--workers", help="threads (default: 8)", type=int, default=8)
+    args = parser.parse_args()
+
+    # Flights are off so that each query is a request, as with earthaccess
+    opendap_cmr.flights = None
+    standin = CMRStandIn(collections=1, granules=args.granules, latency=args.latency).start()
+    try:
+        print(f'{args.granules} granules, {args.latency * 1000:.0f}ms latency, {args.workers} workers')
+
+        start = time.time()
+        found = by_month(standin.url)
+        monthly = time.time() - start
+        print(f'{"by month":>10}: {monthly:6.2f}s, {found} granules')
+
+        start = time.time()
+        found, windows = by_plan(standin.url, args.window_size, args.workers)
+        planned = time.time() - start
+        print(f'{"planned":>10}: {planned:6.2f}s, {found} granules in {windows} windows ({monthly / planned:.0f}x)')
+
+        print('Monthly summary')
+        measure(standin, 'listing', lambda: summary_by_listing(standin.url))
+        measure(standin, 'hits', lambda: temporal_plan.collection_monthly_hits(CCID, workers=args.workers,
+                                                                               service=standin.url))
+    finally:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
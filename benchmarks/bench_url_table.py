@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+"""
+Compare a list of granule URL strings (what s3_driver.query_cmr() used to
+return) with a URLTable holding the same URLs and granule ids: the memory each
+takes, and the time to build, iterate over, save and load the table.
+
+The URLs are made up to look like a PO.DAAC collection's: one S3 prefix and
+granule names that hold the time of an orbit, about 101 minutes apart.
+
+Run this from the top of the repository:
+    python3 -m benchmarks.bench_url_table -g 1000000
+"""
+
+import datetime
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from url_table import URLTable
+
+S3 = 's3://podaac-ops-cumulus-protected/ASCATB-L2-25km'
+
+
+def granule_urls(count: int) -> list:
+    start = datetime.datetime(2012, 10, 29)
+    return [(f'G{2081588885 + n * 7}-POCLOUD',
+             f'{S3}/ascat_{start + datetime.timedelta(minutes=101 * n):%Y%m%d_%H%M%S}_metopb_{n:05}'
+             f'_eps_o_250_2101_ovw.l2.nc') for n in range(count)]
+
+
+def traced(build) -> tuple:
+    """:returns: What build() makes and the bytes it holds"""
+    gc.collect()
+    tracemalloc.start()
+    container = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return container, size
+
+
+def timed(function) -> tuple:
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the URLTable against a list of URL strings.")
+    parser.add_argument("-g", "--granules", help="granules (default: 1000000)", type=int, default=1000000)
+    args = parser.parse_args()
+
+    rows = granule_urls(args.granules)
+    print(f'{args.granules} URLs')
+    _, size = traced(lambda: [url for _, url in granule_urls(args.granules)])
+    print(f'{"list of str":>16}: {size / 1e6:7.1f}MB, the URLs only')
+
+    table = URLTable()
+    _, duration = timed(lambda: table.extend(rows))
+    del rows
+    print(f'{"URLTable":>16}: {table.nbytes / 1e6:7.1f}MB, with the granule ids, built in {duration:.2f}s')
+
+    _, duration = timed(lambda: sum(1 for _ in table))
+    print(f'{"iterate":>16}: {duration:7.2f}s')
+    _, duration = timed(lambda: table.urls(''))
+    print(f'{"index granules":>16}: {duration:7.2f}s')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'urls')
+        _, duration = timed(lambda: table.save(path))
+        print(f'{"save":>16}: {duration:7.2f}s, {os.path.getsize(path) / 1e6:.1f}MB file')
+        loaded, duration = timed(lambda: URLTable.load(path))
+        print(f'{"load":>16}: {duration:7.2f}s')
+
+    granule_id = loaded.granule(len(loaded) // 2)
+    _, duration = timed(lambda: [loaded.urls(granule_id) for _ in range(1000)])
+    print(f'{"lookup":>16}: {duration:7.3f}ms each')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+"""
+A synthetic CMR holding as many providers, collections and granules as a test
+needs, up to the millions of granules production has, made from a few numbers
+and a seed. Nothing is stored: each collection is described by a few fields and
+each granule record is made from its concept ID when it is asked for, so a
+corpus of 10^7 granules costs no more memory than one of 10^3.
+
+The granule records are copies of the real ones in unit_tests/CMR_Responses.py
+(the granules.json entry and the granules.umm_json item), so they are the size
+CMR's are, with their own IDs, names, dates and Related URLs. Each collection is
+one of three kinds:
+
+    cloud    Its granules have s3:// and https:// data URLs and an OPeNDAP URL at
+             opendap.earthdata.nasa.gov
+    on-prem  Its granules have the data URLs and an OPeNDAP URL on the provider's
+             own Hyrax server
+    none     Its granules have only the data URLs
+
+Most collections with OPeNDAP URLs are associated with an OPeNDAP UMM-S record
+(these are the collections CMR finds with has_opendap_url=true), but, as in
+production, not all of them. How many granules each collection has is set by the
+'distribution': 'even' gives each the same number, 'zipf' and 'lognormal' give a
+few collections most of the granules, as real providers do.
+
+The corpus feeds the CMR stand-in, which then answers searches from it, and the
+processor benchmarks, which read its pages directly:
+
+    corpus = Corpus(collections=50, granules=20000, distribution='zipf', seed=1)
+    with CMRStandIn(corpus=corpus) as cmr:
+        opendap_cmr.get_provider_opendap_collections_brutishly('POCLOUD', service=cmr.url)
+    for page in corpus.pages('C1-POCLOUD', 'umm_json'):
+        opendap_cmr.granule_ur_dict_2(json.loads(page))
+
+Run this file to describe a corpus or to serve it:
+    python3 -m benchmarks.cmr_corpus -c 100 -g 100000 -d zipf
+    python3 -m benchmarks.cmr_corpus -c 100 -g 100000 -d zipf --serve 3003
+"""
+
+import copy
+import datetime
+import json
+import math
+import random
+
+from benchmarks.cmr_standin import (CMR_MAX_PAGE_SIZE, FIRST_START_DATE, REVISION_DATE, SyntheticIds,
+                                    entry_template)
+from unit_tests import CMR_Responses
+
+DISTRIBUTIONS = ('even', 'zipf', 'lognormal')
+KINDS = ('cloud', 'on-prem', 'none')
+
+MAX_GRANULES = 9999999
+"""The most granules a collection can have; the stand-in's granule IDs have seven digits for the granule number."""
+
+CLOUD_OPENDAP = 'https://opendap.earthdata.nasa.gov/collections'
+
+"""
+The values in the real granule records that are made fields of the templates,
+longest first. See cmr_standin.entry_template(). The values added to the records
+are written '@field@'.
+"""
+REAL_FIELDS = {'ascat_20121029_010001_metopb_00588_eps_o_250_2101_ovw.l2': 'name',
+               'G2081588885-POCLOUD': 'gid', 'C2075141559-POCLOUD': 'ccid',
+               'MetOp-B ASCAT Level 2 25.0km Ocean Surface Wind Vectors in Full Orbit Swath': 'title',
+               '2012-10-29T01:00:01.000Z': 'start', '2012-10-29T02:41:59.000Z': 'end',
+               '2021-11-13T15:38:38.955Z': 'revision_date', 'ASCATB-L2-25km': 'short_name', 'POCLOUD': 'provider'}
+
+TEMPLATE_FIELDS = ('name', 'gid', 'ccid', 'title', 'start', 'end', 'revision_date', 'revision_id', 'short_name',
+                   'provider', 'bucket')
+
+
+class CollectionSpec:
+    """What a synthetic collection is made from."""
+    __slots__ = ('ccid', 'provider', 'number', 'granules', 'kind', 'associated', 'interval')
+
+    def __init__(self, ccid: str, provider: str, number: int, granules: int, kind: str, associated: bool,
+                 interval: datetime.timedelta):
+        self.ccid = ccid
+        self.provider = provider
+        self.number = number
+        self.granules = granules
+        self.kind = kind
+        self.associated = associated
+        self.interval = interval
+
+    @property
+    def short_name(self) -> str:
+        return f'SYNTHETIC-{self.provider}-{self.number}'
+
+    @property
+    def title(self) -> str:
+        return f'Synthetic {self.kind} collection {self.number} of {self.provider}'
+
+
+def granule_counts(collections: int, mean: int, distribution: str, rng: random.Random) -> list:
+    """
+    Share 'collections' * 'mean' granules among the collections.
+
+    :returns: A list of the number of granules in each collection; each has at least one
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f'The distribution must be one of {DISTRIBUTIONS}, not {distribution!r}')
+    if distribution == 'even':
+        return [min(mean, MAX_GRANULES)] * collections
+    if distribution == 'zipf':
+        weights = [1 / rank ** 1.1 for rank in range(1, collections + 1)]
+        rng.shuffle(weights)
+    else:
+        weights = [rng.lognormvariate(0, 1.5) for _ in range(collections)]
+    total = sum(weights)
+    return [min(MAX_GRANULES, max(1, round(collections * mean * weight / total))) for weight in weights]
+
+
+def related_urls(kind: str, extra_urls: int) -> list:
+    """The UMM-G RelatedUrls of a granule of a kind of collection, with '@field@' where the values go."""
+    path = '@bucket@-protected/@short_name@/@name@.nc'
+    urls = [{'URL': f's3://{path}', 'Type': 'GET DATA',
+             'Description': 'This link provides direct download access via S3 to the granule.'},
+            {'URL': f'https://archive.@bucket@.example/{path}', 'Type': 'GET DATA',
+             'Description': 'Download @name@.nc'},
+            {'URL': 'https://archive.@bucket@.example/s3credentials', 'Type': 'VIEW RELATED INFORMATION',
+             'Description': 'api endpoint to retrieve temporary credentials valid for same-region direct s3 access'}]
+    if kind == 'cloud':
+        urls.append({'URL': f'{CLOUD_OPENDAP}/@ccid@/granules/@name@', 'Type': 'USE SERVICE API',
+                     'Subtype': 'OPENDAP DATA', 'Description': 'OPeNDAP request URL'})
+    elif kind == 'on-prem':
+        urls.append({'URL': 'https://opendap.@bucket@.example/opendap/hyrax/@short_name@/@name@.nc',
+                     'Type': 'USE SERVICE API', 'Subtype': 'OPENDAP DATA', 'Description': 'OPeNDAP request URL'})
+    for n in range(extra_urls):
+        urls.append({'URL': f'https://archive.@bucket@.example/@bucket@-public/@short_name@/@name@.{n}.png',
+                     'Type': 'GET RELATED VISUALIZATION', 'Subtype': 'DIRECT DOWNLOAD', 'MimeType': 'image/png'})
+    for url in urls:
+        url.setdefault('Format', 'Not provided')
+    return urls
+
+
+def links(kind: str, extra_urls: int) -> list:
+    """The granules.json links of a granule of a kind of collection: its Related URLs as links."""
+    rels = {'GET DATA': 'data', 'VIEW RELATED INFORMATION': 'metadata', 'USE SERVICE API': 'service',
+            'GET RELATED VISUALIZATION': 'browse'}
+    result = []
+    for url in related_urls(kind, extra_urls):
+        link = {'rel': f'http://esipfed.org/ns/fedsearch/1.1/{rels[url["Type"]]}#', 'hreflang': 'en-US',
+                'href': url['URL']}
+        if url['URL'].startswith('s3://'):
+            link['rel'] = 'http://esipfed.org/ns/fedsearch/1.1/s3#'
+        if 'Description' in url:
+            link['title'] = url['Description']
+        result.append(link)
+    return result
+
+
+def templates(kind: str, extra_urls: int) -> tuple:
+    """
+    The str.format() templates of the granules.json entry and the granules.umm_json
+    item of a granule of a kind of collection. See TEMPLATE_FIELDS.
+    """
+    item = copy.deepcopy(CMR_Responses.g1['items'][0])
+    item['umm']['RelatedUrls'] = related_urls(kind, extra_urls)
+    item['meta']['revision-id'] = '@revision_id@'
+
+    entry = copy.deepcopy(CMR_Responses.g3['feed']['entry'][0])
+    entry['producer_granule_id'] = '@name@.nc'
+    entry['links'] = links(kind, extra_urls) + [link for link in entry['links'] if link.get('inherited')]
+
+    fields = {**REAL_FIELDS, **{f'@{field}@': field for field in TEMPLATE_FIELDS}}
+    return (entry_template(entry, fields),
+            entry_template(item, fields).replace('"{revision_id}"', '{revision_id}'))
+
+
+class Corpus:
+    """
+    The providers, collections and granules of a synthetic CMR. See the module
+    documentation; the same arguments make the same corpus.
+    """
+
+    def __init__(self, providers=('POCLOUD',), collections=10, granules=1000, distribution='even', opendap=0.5,
+                 cloud=0.8, associated=0.9, extra_urls=2, years=10, seed=0):
+        """
+        :param providers: The provider IDs
+        :param collections: The number of collections each provider has
+        :param granules: The mean number of granules in a collection
+        :param distribution: How the granules are shared among a provider's collections: 'even',
+            'zipf' or 'lognormal'
+        :param opendap: The fraction of the collections with OPeNDAP URLs
+        :param cloud: The fraction of the collections with OPeNDAP URLs whose URLs are in the cloud
+        :param associated: The fraction of the collections with OPeNDAP URLs that are associated
+            with an OPeNDAP UMM-S record
+        :param extra_urls: The number of browse image URLs each granule has
+        :param years: The time each collection's granules cover; the granules are spaced evenly,
+            at least a second apart, from 2000-01-01
+        :param seed: Seed the random numbers used to make the corpus
+        """
+        self.providers = list(providers)
+        self.distribution = distribution
+        self.extra_urls = extra_urls
+        self._collections = {}  # ccid: CollectionSpec
+        self._by_provider = {}  # provider: [CollectionSpec, ...]
+        self._templates = {}  # kind: (entry template, item template)
+
+        rng = random.Random(seed)
+        span = datetime.timedelta(days=365 * years)
+        for provider in self.providers:
+            specs = []
+            for number, count in enumerate(granule_counts(collections, granules, distribution, rng), start=1):
+                if rng.random() < opendap:
+                    kind = 'cloud' if rng.random() < cloud else 'on-prem'
+                    is_associated = rng.random() < associated
+                else:
+                    kind, is_associated = 'none', False
+                interval = datetime.timedelta(seconds=max(1, math.floor(span.total_seconds() / count)))
+                spec = CollectionSpec(f'C{number}-{provider}', provider, number, count, kind, is_associated, interval)
+                specs.append(spec)
+                self._collections[spec.ccid] = spec
+            self._by_provider[provider] = specs
+
+    def collection(self, ccid: str) -> CollectionSpec:
+        """:raises KeyError: If the corpus has no such collection"""
+        return self._collections[ccid]
+
+    def collections(self, provider: str = None) -> list:
+        """The CollectionSpecs of one provider, or of all of them."""
+        if provider is not None:
+            return self._by_provider.get(provider, [])
+        return list(self._collections.values())
+
+    def collection_ids(self, provider: str, opendap=False) -> list:
+        """
+        :param provider: The provider ID
+        :param opendap: Only the collections associated with an OPeNDAP UMM-S record (has_opendap_url=true)
+        """
+        return [spec.ccid for spec in self.collections(provider) if spec.associated or not opendap]
+
+    def granule_count(self, ccid: str) -> int:
+        spec = self._collections.get(ccid)
+        return spec.granules if spec is not None else 0
+
+    def interval(self, ccid: str) -> datetime.timedelta:
+        """The time between the starts of a collection's granules."""
+        spec = self._collections.get(ccid)
+        return spec.interval if spec is not None else datetime.timedelta(days=1)
+
+    @property
+    def total_granules(self) -> int:
+        return sum(spec.granules for spec in self._collections.values())
+
+    def granule_ids(self, ccid: str) -> SyntheticIds:
+        """A collection's granule IDs, oldest first, made as they are indexed."""
+        spec = self._collections[ccid]
+        return SyntheticIds(f'G{spec.number}', spec.provider, spec.granules)
+
+    def granule_fields(self, gid: str, revision_id=1, revision_date=REVISION_DATE) -> dict:
+        """The values of the template fields for a granule."""
+        number, _, provider = gid.partition('-')
+        spec = self._collections[f'C{number[1:-7]}-{provider}']
+        start = FIRST_START_DATE + spec.interval * (int(number[-7:]) - 1)
+        end = start + min(spec.interval, datetime.timedelta(hours=1))
+        return {'gid': gid, 'ccid': spec.ccid, 'provider': provider, 'bucket': provider.lower(),
+                'short_name': spec.short_name, 'title': spec.title,
+                'name': f'{spec.short_name}_{start:%Y%m%dT%H%M%S}_{gid}',
+                'start': f'{start.isoformat()}.000Z', 'end': f'{end.isoformat()}.000Z',
+                'revision_id': revision_id, 'revision_date': revision_date}
+
+    def _kind_templates(self, ccid: str) -> tuple:
+        kind = self._collections[ccid].kind
+        if kind not in self._templates:
+            self._templates[kind] = templates(kind, self.extra_urls)
+        return self._templates[kind]
+
+    def granule_entry(self, gid: str, **revision) -> str:
+        """A granule's granules.json entry, as JSON text."""
+        fields = self.granule_fields(gid, **revision)
+        return self._kind_templates(fields['ccid'])[0].format(**fields)
+
+    def granule_item(self, gid: str, **revision) -> str:
+        """A granule's granules.umm_json item, as JSON text."""
+        fields = self.granule_fields(gid, **revision)
+        return self._kind_templates(fields['ccid'])[1].format(**fields)
+
+    def collection_entry(self, ccid: str) -> dict:
+        """A collection's collections.json entry, with its UMM-S association, if it has one."""
+        spec = self._collections.get(ccid)
+        if spec is None:
+            return {'id': ccid, 'title': f'Synthetic collection {ccid}'}
+        entry = {'id': ccid, 'title': spec.title, 'short_name': spec.short_name, 'version_id': '1',
+                 'data_center': spec.provider, 'online_access_flag': True,
+                 'has_variables': spec.kind != 'none', 'has_formats': spec.associated,
+                 'has_transforms': spec.associated, 'has_spatial_subsetting': spec.associated}
+        if spec.associated:
+            entry['associations'] = {'services': [f'S{spec.number}-{spec.provider}']}
+            entry['service_features'] = {'opendap': {'has_formats': True, 'has_variables': True,
+                                                     'has_transforms': True, 'has_spatial_subsetting': True,
+                                                     'has_temporal_subsetting': True}}
+        return entry
+
+    def page(self, ccid: str, kind='umm_json', start=0, size=CMR_MAX_PAGE_SIZE) -> bytes:
+        """
+        A page of a collection's granules as CMR would send it.
+
+        :param ccid: The collection concept ID
+        :param kind: 'umm_json' for a granules.umm_json page, 'json' for a granules.json page
+        :param start: The index of the first granule on the page
+        :param size: The number of granules on the page
+        :returns: The body of the response
+        """
+        ids = self.granule_ids(ccid)
+        if kind == 'json':
+            entries = ', '.join(self.granule_entry(gid) for gid in ids[start:start + size])
+            return f'{{"feed": {{"entry": [{entries}]}}}}'.encode()
+        items = ', '.join(self.granule_item(gid) for gid in ids[start:start + size])
+        return f'{{"hits": {len(ids)}, "items": [{items}]}}'.encode()
+
+    def pages(self, ccid: str, kind='umm_json', size=CMR_MAX_PAGE_SIZE):
+        """Yield the pages of all of a collection's granules. See page()."""
+        for start in range(0, self.granule_count(ccid), size):
+            yield self.page(ccid, kind, start, size)
+
+    def summary(self) -> str:
+        lines = [f'{len(self._collections)} collections, {self.total_granules} granules '
+                 f'({self.distribution} distribution)']
+        for provider in self.providers:
+            specs = self.collections(provider)
+            counts = sorted((spec.granules for spec in specs), reverse=True)
+            kinds = {kind: sum(spec.kind == kind for spec in specs) for kind in KINDS}
+            lines.append(f'  {provider}: {len(specs)} collections ({kinds["cloud"]} cloud, {kinds["on-prem"]} '
+                         f'on-prem, {kinds["none"]} without OPeNDAP; {sum(spec.associated for spec in specs)} '
+                         f'with UMM-S), granules: largest {counts[0] if counts else 0}, '
+                         f'median {counts[len(counts) // 2] if counts else 0}, total {sum(counts)}')
+        return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Describe, or serve, a synthetic CMR corpus.")
+    parser.add_argument("-p", "--providers", help="the provider IDs (default: POCLOUD)", nargs="+",
+                        default=['POCLOUD'])
+    parser.add_argument("-c", "--collections", help="collections per provider (default: 10)", type=int, default=10)
+    parser.add_argument("-g", "--granules", help="the mean number of granules in a collection (default: 1000)",
+                        type=int, default=1000)
+    parser.add_argument("-d", "--distribution", help="how the granules are shared among the collections "
+                        "(default: even)", choices=DISTRIBUTIONS, default='even')
+    parser.add_argument("-o", "--opendap", help="the fraction of the collections with OPeNDAP URLs (default: 0.5)",
+                        type=float, default=0.5)
+    parser.add_argument("--cloud", help="the fraction of those whose OPeNDAP URLs are in the cloud (default: 0.8)",
+                        type=float, default=0.8)
+    parser.add_argument("--associated", help="the fraction of those associated with a UMM-S record (default: 0.9)",
+                        type=float, default=0.9)
+    parser.add_argument("-s", "--seed", help="seed the random numbers (default: 0)", type=int, default=0)
+    parser.add_argument("--serve", help="serve the corpus with the CMR stand-in on this port", type=int,
+                        default=None)
+    parser.add_argument("-l", "--latency", help="with --serve, seconds added to each response (default: 0)",
+                        type=float, default=0.0)
+    args = parser.parse_args()
+
+    corpus = Corpus(args.providers, args.collections, args.granules, args.distribution, args.opendap, args.cloud,
+                    args.associated, seed=args.seed)
+    print(corpus.summary())
+    if args.serve is not None:
+        from benchmarks.cmr_standin import CMRStandIn
+        standin = CMRStandIn(port=args.serve, latency=args.latency, corpus=corpus)
+        print(f'CMR stand-in listening at {standin.url}')
+        try:
+            standin._server.serve_forever()
+        except KeyboardInterrupt:
+            standin.stop()
+
+
+if __name__ == "__main__":
+    main()
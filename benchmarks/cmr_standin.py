@@ -0,0 +1,519 @@
+#!/usr/bin/env python3
+
+"""
+A local stand-in for the CMR search API, used to benchmark the functions in
+opendap_cmr (and friends) without hitting production CMR.
+
+The server synthesizes collections and granules on the fly. Each provider has
+'collections' collections named C<n>-<PROVIDER> and each of those has
+'granules' granules named G<collection><n>-<PROVIDER>. The responses follow the
+shapes of the real responses in unit_tests/CMR_Responses.py. The 'page_num' and
+'page_size' parameters, the 'CMR-Hits' header and the 'CMR-Search-After'
+header are supported. Granule n of a collection starts on day n, counting from
+2000-01-01, and the 'temporal' parameter selects the granules by that date. A fixed latency can be added to each response and, like
+CMR, page_num requests can be made to cost more the deeper they go.
+
+To model a loaded server, requests beyond 'capacity' in flight at once are
+slowed down (the latency grows with the square of the overload) and requests
+beyond 'throttle' in flight are refused with 429 Too Many Requests, as CMR does.
+To model a noisy one, 'jitter' adds up to that many seconds to each response at
+random, 'error_rate' of the requests are answered with a 500, 502, 503 or 504
+and 'truncate_rate' of the successful responses are cut short.
+
+By default the entries are small. With 'realistic', the granule entries are
+copies of the real ones in unit_tests/CMR_Responses.py (the granules.json
+entry and the granules.umm_json item), with the IDs, names and dates changed,
+so the responses are the size CMR's are and take as long to decode. There is no
+collections.json response in CMR_Responses.py, so the collection entries are
+small either way.
+
+With a 'corpus' (see cmr_corpus.py), the providers, collections and granules
+are the corpus', which can hold millions of granules with a realistic mix of
+collection sizes, Related URLs and UMM-S associations, and the 'collections',
+'granules' and 'realistic' settings are not used.
+
+Granules can be revised or deleted with revise_granule() and delete_granule();
+the 'updated_since' parameter and the deleted-granules search follow those
+changes.
+
+Example usage:
+    ./benchmarks/cmr_standin.py -p 3003 -l 0.05     # serve until interrupted
+
+    with CMRStandIn(latency=0.05) as cmr:           # in a benchmark or test
+        opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=cmr.url)
+"""
+
+import datetime
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from unit_tests import CMR_Responses
+
+CMR_MAX_PAGE_SIZE = 2000
+CMR_MAX_PAGING_DEPTH = 1000000
+REVISION_DATE = '2021-11-13T15:38:38.955Z'
+FIRST_START_DATE = datetime.datetime(2000, 1, 1)
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def entry_template(entry: dict, fields: dict) -> str:
+    """
+    Make a str.format() template of an entry's JSON, replacing each value in 'fields'
+    with its field name. The values are replaced in order, so give the longer ones first.
+    """
+    text = json.dumps(entry).replace('{', '{{').replace('}', '}}')
+    for value, field in fields.items():
+        text = text.replace(value, f'{{{field}}}')
+    return text
+
+
+GRANULE_ENTRY = entry_template({**CMR_Responses.g3['feed']['entry'][0],
+                                'producer_granule_id': 'ascat_20121029_010001_metopb_00588_eps_o_250_2101_ovw.l2.nc'},
+                               {'G2081588885-POCLOUD': 'gid', 'C2075141559-POCLOUD': 'ccid',
+                                'ascat_20121029_010001_metopb_00588_eps_o_250_2101_ovw.l2': 'name',
+                                '2012-10-29T01:00:01.000Z': 'start', '2012-10-29T02:41:59.000Z': 'end',
+                                'POCLOUD': 'provider'})
+"""The granules.json entry of a real granule, with its IDs, name and dates made fields."""
+
+GRANULE_ITEM = entry_template(CMR_Responses.g1['items'][0],
+                              {'G2081588885-POCLOUD': 'gid', 'C2075141559-POCLOUD': 'ccid',
+                               'ascat_20121029_010001_metopb_00588_eps_o_250_2101_ovw.l2': 'name',
+                               '2012-10-29T01:00:01.000Z': 'start', '2012-10-29T02:41:59.000Z': 'end',
+                               '2021-11-13T15:38:38.955Z': 'revision_date', 'POCLOUD': 'provider'}
+                              ).replace('"revision-id": 4', '"revision-id": {revision_id}')
+"""The granules.umm_json item of a real granule, with its IDs, name and dates made fields."""
+
+INJECTED_ERRORS = (500, 502, 503, 504)
+
+
+def granule_start(gid: str, interval=ONE_DAY) -> datetime.datetime:
+    """
+    The start date of a synthetic granule: granule n starts n - 1 intervals (by
+    default, days) after FIRST_START_DATE.
+    """
+    return FIRST_START_DATE + interval * (int(gid.partition('-')[0][-7:]) - 1)
+
+
+def granule_days(temporal: str, count: int, interval=ONE_DAY, duration=datetime.timedelta(0)) -> tuple:
+    """
+    The numbers of the first and last of 'count' synthetic granules that overlap
+    a CMR 'temporal' range like '2000-01-01T00:00:00Z,2000-02-01T00:00:00Z'. Either
+    end of the range can be left out. The granules start 'interval' apart and
+    each lasts 'duration'.
+    """
+    begin, _, end = temporal.partition(',')
+    first, last = 1, count
+    if begin:
+        steps = (datetime.datetime.fromisoformat(begin.rstrip('Z')) - duration - FIRST_START_DATE) / interval
+        first = max(first, math.ceil(steps) + 1)
+    if end:
+        steps = (datetime.datetime.fromisoformat(end.rstrip('Z')) - FIRST_START_DATE) / interval
+        last = min(last, math.floor(steps) + 1)
+    return first, last
+
+
+class SyntheticIds:
+    """
+    The concept IDs of a synthetic collection, made when they are indexed so
+    that asking for a page does not cost more for a larger collection.
+    """
+
+    def __init__(self, prefix: str, provider: str, count: int, descending=False, first=1):
+        self.prefix = prefix
+        self.provider = provider
+        self.count = count
+        self.descending = descending
+        self.first = first
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[i] for i in range(*item.indices(self.count))]
+        if not 0 <= item < self.count:
+            raise IndexError(item)
+        n = self.first + (self.count - 1 - item if self.descending else item)
+        return f'{self.prefix}{n:07d}-{self.provider}'
+
+
+class CMRStandInHandler(BaseHTTPRequestHandler):
+    """Answer CMR search requests using the settings of the CMRStandIn that owns the server."""
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, like CMR
+    disable_nagle_algorithm = True  # The headers and body are written separately
+
+    def log_message(self, format, *args):
+        pass  # The default writes a line to stderr for every request
+
+    def do_GET(self):
+        standin = self.server.standin
+        in_flight = standin.begin_request()
+        try:
+            self.answer(standin, in_flight)
+        finally:
+            standin.end_request()
+
+    def answer(self, standin, in_flight: int):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+
+        if 0 < standin.throttle < in_flight:
+            standin.count_throttled()
+            return self.send_json(429, {'errors': ['Too many requests']}, {'Retry-After': '1'})
+
+        latency = standin.latency + (standin.random.uniform(0, standin.jitter) if standin.jitter > 0 else 0)
+        if 0 < standin.capacity < in_flight:
+            latency *= (in_flight / standin.capacity) ** 2
+        if latency > 0:
+            time.sleep(latency)
+
+        if standin.error_rate > 0 and standin.random.random() < standin.error_rate:
+            status = standin.random.choice(INJECTED_ERRORS)
+            standin.count_error()
+            if status in (502, 504):  # From the load balancer, not CMR; not JSON
+                return self.send_body(status, f'<html><body><h1>{status} Gateway Error</h1></body></html>'.encode(),
+                                      content_type='text/html')
+            return self.send_json(status, {'errors': ['An Internal Error has occurred.']})
+
+        try:
+            page_size = int(query.get('page_size', ['10'])[0])
+            page_num = int(query.get('page_num', ['1'])[0])
+        except ValueError:
+            return self.send_json(400, {'errors': ['page_size and page_num must be integers']})
+        if page_size > CMR_MAX_PAGE_SIZE:
+            return self.send_json(400, {'errors': [f'page_size must be a number between 0 and {CMR_MAX_PAGE_SIZE}']})
+        if page_num in standin.failing_pages:
+            standin.count_error()
+            return self.send_json(503, {'errors': ['An Internal Error has occurred.']})
+
+        if url.path == '/search/collections.json':
+            ids = standin.collection_ids(query)
+            render = standin.collection_entry
+        elif url.path in ('/search/granules.json', '/search/granules.umm_json', '/search/granules.umm_json_v1_4'):
+            ids = standin.granule_ids(query)
+            render = standin.granule_entry if url.path == '/search/granules.json' else standin.granule_item
+        elif url.path == '/search/deleted-granules.json':
+            if 'collection_concept_id' in query:  # CMR only knows parent_collection_id here
+                return self.send_json(400, {'errors': ['Parameter [collection_concept_id] was not recognized.']})
+            ids = standin.deleted_granule_ids(query)
+            render = standin.deleted_granule_entry
+        else:
+            return self.send_json(404, {'errors': [f'Unknown search path {url.path}']})
+
+        search_after = self.headers.get('CMR-Search-After')
+        if search_after:
+            if 'page_num' in query:
+                return self.send_json(400, {'errors': ['page_num is not allowed with search-after']})
+            start = json.loads(search_after)[0] + 1
+        else:
+            start = (page_num - 1) * page_size
+            if start + page_size > CMR_MAX_PAGING_DEPTH:
+                return self.send_json(400, {'errors': [f'The paging depth (page_num * page_size) of '
+                                                       f'[{start + page_size}] exceeds the limit of '
+                                                       f'{CMR_MAX_PAGING_DEPTH}.']})
+            if standin.paging_cost > 0:
+                time.sleep(standin.paging_cost * start / 10000)
+
+        page = [render(concept_id) for concept_id in ids[start:start + page_size]]
+        # The realistic entries are rendered as JSON text; join them instead of decoding and encoding them again
+        entries = ', '.join(entry if isinstance(entry, str) else json.dumps(entry) for entry in page)
+        if url.path == '/search/deleted-granules.json':
+            data = f'[{entries}]'.encode()
+        elif url.path.endswith('.json'):
+            data = f'{{"feed": {{"entry": [{entries}]}}}}'.encode()
+        else:
+            data = f'{{"hits": {len(ids)}, "items": [{entries}]}}'.encode()
+        headers = {'CMR-Hits': str(len(ids))}
+        if page:
+            headers['CMR-Search-After'] = json.dumps([start + len(page) - 1])
+        if standin.truncate_rate > 0 and standin.random.random() < standin.truncate_rate:
+            standin.count_truncated()
+            data = data[:len(data) // 2]
+        self.send_body(200, data, headers)
+
+    def send_json(self, status: int, body: dict, headers=None):
+        self.send_body(status, json.dumps(body).encode(), headers)
+
+    def send_body(self, status: int, data: bytes, headers=None, content_type='application/json'):
+        self.server.standin.count_bytes(len(data))
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class CMRStandIn:
+    """
+    Run the CMR stand-in on a background thread. The 'url' property can be passed
+    as the 'service' parameter of the opendap_cmr functions.
+    """
+
+    def __init__(self, collections=10, granules=1000, latency=0.0, paging_cost=0.0, port=0, capacity=0, throttle=0,
+                 jitter=0.0, error_rate=0.0, truncate_rate=0.0, realistic=False, seed=None, corpus=None,
+                 duration=0.0):
+        """
+        :param collections: The number of collections each provider has, or a dict of
+            the number for each provider; providers not in the dict have none
+        :param granules: The number of granules in each collection
+        :param latency: Seconds to wait before answering each request
+        :param paging_cost: Seconds added to a page_num request for every 10,000 results it skips
+        :param port: Listen on this port; the default (0) picks a free port
+        :param capacity: Slow down requests when more than this many are in flight (default 0, never)
+        :param throttle: Refuse requests with 429 when more than this many are in flight (default 0, never)
+        :param jitter: Add between 0 and this many seconds, at random, to each response
+        :param error_rate: The fraction of requests to answer with a 500, 502, 503 or 504
+        :param truncate_rate: The fraction of successful responses to cut short
+        :param realistic: Make the granule entries copies of the real ones in CMR_Responses.py
+        :param seed: Seed the random numbers used for the jitter and the errors
+        :param corpus: Serve the providers, collections and granules of this cmr_corpus.Corpus
+        :param duration: The hours each granule lasts (default 0, each is an instant); not for
+            the corpus' or the realistic granules
+        """
+        self.collections = collections
+        self.granules = granules
+        self.latency = latency
+        self.paging_cost = paging_cost
+        self.capacity = capacity
+        self.throttle = throttle
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.truncate_rate = truncate_rate
+        self.realistic = realistic
+        self.corpus = corpus
+        self.duration = datetime.timedelta(hours=duration)
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0  # The errors injected
+        self.truncated = 0  # The responses cut short
+        self.bytes_sent = 0  # The bytes in the response bodies
+        self.in_flight = 0
+        self.revisions = {}  # granule ID: revision date, for the granules changed by revise_granule()
+        self.deleted = {}  # granule ID: revision date, for the granules removed by delete_granule()
+        self.failing_pages = set()  # page_num values always answered with a 503, to test incomplete results
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), CMRStandInHandler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+        self._server.standin = self
+        self._thread = None
+        self._process = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def begin_request(self) -> int:
+        """Count a request. Returns the number of requests in flight, including this one."""
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            return self.in_flight
+
+    def end_request(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count_throttled(self):
+        with self._lock:
+            self.throttled += 1
+
+    def count_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def count_truncated(self):
+        with self._lock:
+            self.truncated += 1
+
+    def count_bytes(self, size: int):
+        with self._lock:
+            self.bytes_sent += size
+
+    @staticmethod
+    def now() -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+
+    def revise_granule(self, gid: str):
+        """Give a granule a new revision, dated now."""
+        with self._lock:
+            self.revisions[gid] = self.now()
+
+    def delete_granule(self, gid: str):
+        """Remove a granule from the searches and list it in the deleted-granules search."""
+        with self._lock:
+            self.deleted[gid] = self.now()
+
+    def collection_ids(self, query: dict) -> list:
+        if query.get('updated_since', [''])[0] > REVISION_DATE:
+            return []  # The synthetic collections never change
+        if 'concept_id' in query:
+            return query['concept_id'][:1]
+        provider = query.get('provider', ['POCLOUD'])[0]
+        if self.corpus is not None:
+            return self.corpus.collection_ids(provider, opendap=query.get('has_opendap_url', [''])[0] == 'true')
+        count = self.collections.get(provider, 0) if isinstance(self.collections, dict) else self.collections
+        return [f'C{n}-{provider}' for n in range(1, count + 1)]
+
+    def granule_ids(self, query: dict):
+        ccid = query.get('collection_concept_id', ['C1-POCLOUD'])[0]
+        number, _, provider = ccid[1:].partition('-')
+        if self.corpus is not None:
+            first, last = granule_days(query.get('temporal', [''])[0], self.corpus.granule_count(ccid),
+                                       self.corpus.interval(ccid))
+        else:
+            first, last = granule_days(query.get('temporal', [''])[0], self.granules, duration=self.duration)
+        ids = SyntheticIds(f'G{number}', provider, max(0, last - first + 1), first=first,
+                           descending=query.get('sort_key', [''])[0] == '-start_date')
+        since = query.get('updated_since', [''])[0]
+        if since > REVISION_DATE:
+            ids = [gid for gid in ids if self.revisions.get(gid, '') >= since]
+        wanted = set(query.get('concept_id', []) + query.get('concept_id[]', []))
+        wanted.update(granule_ur.rpartition('_')[2] for granule_ur in query.get('granule_ur', []))
+        if wanted or 'granule_ur' in query:
+            ids = [gid for gid in ids if gid in wanted]
+        if self.deleted:
+            ids = [gid for gid in ids if gid not in self.deleted]
+        return ids
+
+    def deleted_granule_ids(self, query: dict) -> list:
+        ccid = query.get('parent_collection_id', [''])[0]
+        since = query.get('revision_date', [''])[0]
+        number, _, provider = ccid[1:].partition('-')
+        return sorted(gid for gid, date in self.deleted.items()
+                      if gid.partition('-')[0][:-7] == f'G{number}' and gid.partition('-')[2] == provider
+                      and date >= since)
+
+    def deleted_granule_entry(self, gid: str) -> dict:
+        number, _, provider = gid[1:].partition('-')
+        return {'concept-id': gid, 'parent-collection-id': f'C{int(number[:-7])}-{provider}',
+                'revision-date': self.deleted[gid], 'granule-ur': f'granule_{gid}'}
+
+    def collection_entry(self, ccid: str) -> dict:
+        if self.corpus is not None:
+            return self.corpus.collection_entry(ccid)
+        return {'id': ccid, 'title': f'Synthetic collection {ccid}'}
+
+    def revision(self, gid: str) -> dict:
+        return {'revision_id': 2 if gid in self.revisions else 1,
+                'revision_date': self.revisions.get(gid, REVISION_DATE)}
+
+    def granule_entry(self, gid: str):
+        if self.corpus is not None:
+            return self.corpus.granule_entry(gid, **self.revision(gid))
+        if self.realistic:
+            return GRANULE_ENTRY.format(**self.template_fields(gid))
+        return {'id': gid, 'title': f'granule_{gid}', 'producer_granule_id': f'granule_{gid}.nc',
+                'time_start': f'{granule_start(gid).isoformat()}.000Z'}
+
+    def template_fields(self, gid: str) -> dict:
+        number, _, provider = gid.partition('-')
+        start = granule_start(gid)
+        return {'gid': gid, 'ccid': f'C{number[1:-7]}-{provider}', 'provider': provider, 'name': f'granule_{gid}',
+                'start': f'{start.isoformat()}.000Z',
+                'end': f'{(start + datetime.timedelta(hours=1)).isoformat()}.000Z', **self.revision(gid)}
+
+    def granule_item(self, gid: str):
+        if self.corpus is not None:
+            return self.corpus.granule_item(gid, **self.revision(gid))
+        if self.realistic:
+            return GRANULE_ITEM.format(**self.template_fields(gid))
+        provider = gid.partition('-')[2]
+        start = granule_start(gid)
+        return {'meta': {'concept-type': 'granule', 'concept-id': gid, 'revision-id': 2 if gid in self.revisions else 1,
+                         'native-id': f'granule_{gid}', 'provider-id': provider,
+                         'format': 'application/vnd.nasa.cmr.umm+json',
+                         'revision-date': self.revisions.get(gid, REVISION_DATE)},
+                'umm': {'TemporalExtent': {'RangeDateTime': self.time_range(start)},
+                        'DataGranule': {'ArchiveAndDistributionInformation': [{'Name': f'granule_{gid}.nc',
+                                                                               'SizeInBytes': 1048576}]},
+                        'RelatedUrls': [
+                    {'URL': f's3://{provider.lower()}-protected/SYNTHETIC/granule_{gid}.nc', 'Type': 'GET DATA'},
+                    {'URL': f'https://archive.{provider.lower()}.example/SYNTHETIC/granule_{gid}.nc',
+                     'Type': 'GET DATA'},
+                    {'URL': f'https://opendap.earthdata.nasa.gov/collections/C-{provider}/granules/granule_{gid}',
+                     'Type': 'USE SERVICE API', 'Subtype': 'OPENDAP DATA'}]}}
+
+    def time_range(self, start: datetime.datetime) -> dict:
+        if not self.duration:
+            return {'BeginningDateTime': f'{start.isoformat()}.000Z'}
+        return {'BeginningDateTime': f'{start.isoformat()}.000Z',
+                'EndingDateTime': f'{(start + self.duration).isoformat()}.000Z'}
+
+    def start(self, process=False):
+        """
+        Start serving. With 'process', serve from a separate process so that the
+        server does not compete with the client being measured for the GIL. The
+        request counters are not updated in that case.
+        """
+        if process:
+            self._process = multiprocessing.get_context('fork').Process(target=self._server.serve_forever,
+                                                                        daemon=True)
+            self._process.start()
+        else:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+        else:
+            self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the CMR search API.")
+    parser.add_argument("-p", "--port", help="listen on this port (default: 3003)", type=int, default=3003)
+    parser.add_argument("-c", "--collections", help="collections per provider (default: 10)", type=int, default=10)
+    parser.add_argument("-g", "--granules", help="granules per collection (default: 1000)", type=int, default=1000)
+    parser.add_argument("-l", "--latency", help="seconds added to each response (default: 0)", type=float,
+                        default=0.0)
+    parser.add_argument("-C", "--capacity", help="slow down requests when more than this many are in flight "
+                                                 "(default: 0, never)", type=int, default=0)
+    parser.add_argument("-T", "--throttle", help="refuse requests with 429 when more than this many are in flight "
+                                                 "(default: 0, never)", type=int, default=0)
+    parser.add_argument("-j", "--jitter", help="add up to this many seconds to each response, at random "
+                                               "(default: 0)", type=float, default=0.0)
+    parser.add_argument("-e", "--error-rate", help="answer this fraction of the requests with a 5xx error "
+                                                   "(default: 0)", type=float, default=0.0)
+    parser.add_argument("-x", "--truncate-rate", help="cut this fraction of the responses short (default: 0)",
+                        type=float, default=0.0)
+    parser.add_argument("-r", "--realistic", help="make the granule entries copies of real ones",
+                        action="store_true")
+    parser.add_argument("-d", "--paging-cost", help="seconds added to a page_num request for every 10,000 results "
+                                                    "it skips (default: 0)", type=float, default=0.0)
+    args = parser.parse_args()
+
+    standin = CMRStandIn(args.collections, args.granules, args.latency, args.paging_cost, args.port,
+                         args.capacity, args.throttle, jitter=args.jitter, error_rate=args.error_rate,
+                         truncate_rate=args.truncate_rate, realistic=args.realistic)
+    print(f'CMR stand-in listening at {standin.url}')
+    try:
+        standin._server.serve_forever()
+    except KeyboardInterrupt:
+        standin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Access information about data in NASA's EarthData Cloud system using the
+CMR Web API, with asyncio.
+
+The functions here mirror the paging functions in opendap_cmr and share its
+response processors (collection_granules_list, granule_ur_dict_2,
+provider_collections_dict, ...), but many paging streams, and many collections,
+run concurrently on one event loop. The number of connections to CMR is bounded
+by the aiohttp.ClientSession made with get_session(), so the concurrency can be
+set without creating threads.
+
+Unlike the sync functions, once the first page of a response is read, the
+'CMR-Hits' header is used to request the remaining pages concurrently. Failed
+requests are retried, and pages that still cannot be read are reported, as
+they are by the sync functions: CMRIncompleteResult lists the missing pages
+and its 'partial' holds the results from the pages that were read.
+"""
+import asyncio
+import json
+import math
+import time
+
+import aiohttp
+
+import cmr_metrics
+import errLog
+import opendap_cmr
+from granule_store import GranuleStore
+from opendap_cmr import CMRException, CMRIncompleteResult, count_entries, merge_dict, service_url
+
+"""
+The maximum number of connections a session will open to CMR.
+"""
+max_connections: int = 32
+
+
+def get_session(connections: int = 0) -> aiohttp.ClientSession:
+    """
+    Make an aiohttp session that opens at most 'connections' connections. All the
+    requests made with a session share (and wait for) those connections. This must
+    be called from a coroutine and the session should be closed ('async with')
+    when it is no longer needed.
+
+    :param connections: The connection limit. If not given, use 'max_connections.'
+    :returns: An aiohttp.ClientSession
+    """
+    limit = connections if connections > 0 else max_connections
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit, limit_per_host=limit))
+
+
+"""
+The errors that retrying a request might fix, like opendap_cmr.RETRY_EXCEPTIONS.
+Responses with a status in opendap_cmr.RETRY_STATUS are retried too.
+"""
+RETRY_EXCEPTIONS = (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError,
+                    json.JSONDecodeError)
+
+
+def is_transient(e: Exception) -> bool:
+    """Is this an error that retrying the request might fix?"""
+    return isinstance(e, RETRY_EXCEPTIONS) or (isinstance(e, CMRException) and e.status in opendap_cmr.RETRY_STATUS)
+
+
+def error_message(body: str, reason: str) -> str:
+    """The error message in a CMR error response, or the start of the response if there is none"""
+    try:
+        # JSON returned on error: {'errors': ['Collection-concept-id [ECCO Ocean ...']}
+        return json.loads(body)["errors"][0]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return body[:200] if body else reason
+
+
+async def get_page(cmr_query_url: str, session: aiohttp.ClientSession, page_size: int, page_num: int) -> tuple:
+    """
+    Get one page of a CMR response. Failed requests are retried the way
+    opendap_cmr.get_page() retries them, using opendap_cmr.max_retries and
+    opendap_cmr.retry_delay().
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param session: An aiohttp session
+    :param page_size: The number of entries per page
+    :param page_num: The page to get
+    :returns: A tuple of the decoded JSON and the number of hits; the hits are -1
+        if CMR did not include the 'CMR-Hits' header
+    :raises CMRException: If CMR returns an error
+    :raises aiohttp.ClientError: If the connection fails, after the retries
+    """
+    page_url = f'{cmr_query_url}&page_num={page_num}&page_size={page_size}'
+    endpoint = cmr_metrics.endpoint(cmr_query_url)
+    for attempt in range(opendap_cmr.max_retries + 1):
+        start = time.monotonic()
+        try:
+            async with session.get(page_url) as r:
+                body = await r.read()
+                status, reason, headers = r.status, r.reason, r.headers
+            if opendap_cmr.metrics is not None:
+                opendap_cmr.metrics.record(endpoint, status, time.monotonic() - start, len(body))
+            if status == 200:
+                json_resp = json.loads(body)
+        except RETRY_EXCEPTIONS:
+            if attempt == opendap_cmr.max_retries:
+                raise
+            if opendap_cmr.metrics is not None:
+                opendap_cmr.metrics.retry(endpoint)
+            await asyncio.sleep(opendap_cmr.retry_delay(attempt))
+            continue
+
+        print("-", end="", flush=True) if opendap_cmr.verbose else ''
+        if opendap_cmr.verbose > 0:
+            print(f'CMR Query URL: {cmr_query_url}')
+            print(f'Status code: {status}')
+
+        if status == 200:
+            return json_resp, int(headers.get('CMR-Hits', -1))
+        if status not in opendap_cmr.RETRY_STATUS or attempt == opendap_cmr.max_retries:
+            raise CMRException(status, error_message(body.decode(errors='replace'), reason))
+        if opendap_cmr.metrics is not None:
+            opendap_cmr.metrics.retry(endpoint)
+        await asyncio.sleep(opendap_cmr.retry_delay(attempt, headers.get('Retry-After')))
+
+
+async def get_pages(cmr_query_url: str, session: aiohttp.ClientSession, num_responses=-1, page_size=10,
+                    page_num=0):
+    """
+    An async generator that yields the pages of a CMR response. If CMR returns the
+    number of hits, the pages after the first are requested concurrently. Otherwise,
+    pages are requested one after another until a short page is returned.
+
+    Like opendap_cmr.cmr_pages(), a page that cannot be read, even after retrying it,
+    does not stop the pages requested with it: they are yielded, in order, and then
+    CMRIncompleteResult lists the missing pages.
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param session: An aiohttp session
+    :param num_responses: The number of responses to get. If not given, gets all the responses.
+    :param page_size: The number of entries per page
+    :param page_num: Return an explicit page of the query response. If not given, gets all the pages
+    :returns: An async generator of the decoded JSON pages, in order
+    :raises CMRIncompleteResult: If some pages could not be read
+    """
+    if page_num != 0:
+        try:
+            json_resp, _ = await get_page(cmr_query_url, session, page_size, page_num)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            raise CMRIncompleteResult(cmr_query_url, [(page_num, page_num)], page_size, e) from e
+        yield json_resp
+        return
+
+    try:
+        json_resp, hits = await get_page(cmr_query_url, session, page_size, 1)
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        raise CMRIncompleteResult(cmr_query_url, [(1, -1)], page_size, e) from e
+    yield json_resp
+
+    wanted = hits if num_responses < 0 else min(hits, num_responses)
+    if hits > -1:
+        last_page = math.ceil(wanted / page_size) if page_size > 0 else 1
+        pages = range(2, last_page + 1)
+        results = await asyncio.gather(*[get_page(cmr_query_url, session, page_size, page) for page in pages],
+                                       return_exceptions=True)
+        failed = []
+        for page, result in zip(pages, results):
+            if isinstance(result, BaseException):
+                if not is_transient(result):
+                    raise result
+                failed.append((page, result))
+            else:
+                yield result[0]
+        if failed:
+            raise CMRIncompleteResult(cmr_query_url, opendap_cmr.page_ranges([page for page, _ in failed]),
+                                      page_size, failed[-1][1])
+    else:
+        page = 1
+        entries = last = count_entries(json_resp)
+        while last == page_size and not (-1 < num_responses <= entries):
+            page += 1
+            try:
+                json_resp, _ = await get_page(cmr_query_url, session, page_size, page)
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                raise CMRIncompleteResult(cmr_query_url, [(page, -1)], page_size, e) from e
+            yield json_resp
+            last = count_entries(json_resp)
+            entries += last
+
+
+async def process_request(cmr_query_url: str, response_processor: callable(dict), session: aiohttp.ClientSession,
+                          page_size=10, page_num=0) -> dict:
+    """
+    The asyncio version of opendap_cmr.process_request().
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param response_processor: A function that will process the returned json response
+    :param session: An aiohttp session
+    :param page_size: The number of entries per page from CMR. The default is the CMR default value.
+    :param page_num: Return an explicit page of the query response. If not given, gets all the pages
+    :returns: A dictionary of entries
+    :rtype: dict or set
+    :raises CMRIncompleteResult: If some pages could not be read; 'partial' holds the entries of the others
+    """
+    entries_dict = {}
+    entries_set = set()
+    try:
+        async for json_resp in get_pages(cmr_query_url, session, page_size=page_size, page_num=page_num):
+            if count_entries(json_resp) > 0:
+                entries_page = response_processor(json_resp)  # The response_processor() is passed in
+                if type(entries_page) in (dict, GranuleStore):
+                    entries_dict = merge_dict(entries_dict, entries_page)  # merge is smart if entries is empty
+                elif type(entries_page) is set:
+                    entries_set.update(entries_page)
+
+    except CMRIncompleteResult as e:
+        err = "/////////////////////////////////////////////////////\n"
+        err += "CMRIncompleteResult : cmr_async.py::process_request() - " + e.message + "\n"
+        errLog.output_errlog(err)
+        e.partial = entries_set if len(entries_set) > 0 else entries_dict
+        raise
+
+    if len(entries_dict) > 0:
+        return entries_dict
+    elif len(entries_set) > 0:
+        return entries_set
+    else:
+        return {}
+
+
+async def process_request_list(cmr_query_url: str, response_processor: callable(list),
+                               session: aiohttp.ClientSession, num_responses=-1, page_size=10, page_num=0) -> list:
+    """
+    The asyncio version of opendap_cmr.process_request_list().
+
+    :param cmr_query_url: The whole URL, query params and all.
+    :param response_processor: A function that will process the returned json response returning
+    results in a list.
+    :param session: An aiohttp session
+    :param num_responses: The number of responses to get. If not given, gets all the responses.
+    :param page_size: The number of entries per page from CMR. The default is the CMR default value.
+    :param page_num: Return an explicit page of the query response. If not given, gets all the pages.
+    :returns: A list of entries
+    :rtype: list
+    :raises CMRIncompleteResult: If some pages could not be read; 'partial' holds the entries of the others
+    """
+    # Ensure that if the caller wants fewer responses than the page size, only
+    # that number of responses is retrieved
+    if num_responses > -1 and page_size > num_responses:
+        page_size = num_responses
+
+    entries = []
+    try:
+        async for json_resp in get_pages(cmr_query_url, session, num_responses, page_size, page_num):
+            if count_entries(json_resp) > 0:
+                entries.extend(response_processor(json_resp))  # The response_processor() is passed in
+
+    except CMRIncompleteResult as e:
+        err = "/////////////////////////////////////////////////////\n"
+        err += "CMRIncompleteResult : cmr_async.py::process_request_list() - " + e.message + "\n"
+        errLog.output_errlog(err)
+        e.partial = entries
+        raise
+
+    return entries
+
+
+async def get_provider_collections(session: aiohttp.ClientSession, provider: str, opendap=False,
+                                   service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    The asyncio version of opendap_cmr.get_provider_collections().
+
+    :param session: An aiohttp session
+    :param provider: The string ID for a given EDC provider (e.g., ORNL_CLOUD)
+    :param opendap: If true, return only the collections with OPeNDAP URLS
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A dictionary of CCIDs and titles.
+    """
+    opendap = '&has_opendap_url=true' if opendap else ''
+    cmr_query_url = f'{service_url(service)}/search/collections.json?provider={provider}{opendap}'
+    return await process_request(cmr_query_url, opendap_cmr.provider_collections_dict, session, page_size=500)
+
+
+async def get_collection_granule_ids(session: aiohttp.ClientSession, ccid: str, num=-1, descending=False,
+                                     service='cmr.earthdata.nasa.gov') -> list:
+    """
+    The asyncio version of opendap_cmr.get_collection_granule_ids().
+
+    :param session: An aiohttp session
+    :param ccid: The string Collection Concept ID
+    :param num: Limit the number of granule IDs returned. Default is -1, which returns all granule IDs.
+    :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: The collection's Granule IDs, in a list
+    """
+    sort_key = '&sort_key=-start_date' if descending else ''
+    cmr_query_url = f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}{sort_key}'
+    return await process_request_list(cmr_query_url, opendap_cmr.collection_granules_list, session, num,
+                                      page_size=500)
+
+
+async def collection_has_opendap(session: aiohttp.ClientSession, ccid: str,
+                                 cloud_prefix="https://opendap.earthdata.nasa.gov/",
+                                 json_processor=opendap_cmr.granule_ur_dict_2,
+                                 service='cmr.earthdata.nasa.gov') -> tuple:
+    """
+    The asyncio version of opendap_cmr.collection_has_opendap().
+
+    :param session: An aiohttp session
+    :param ccid: The collection concept ID
+    :param cloud_prefix: Is this a URL to a collection in the cloud?
+    :param json_processor: Use this function to process the returned JSON
+    :param service: Use this endpoint for CMR
+    :return: A tuple of (ccid, True|False, URL) - True if an OPeNDAP is present
+    :raises CMRIncompleteResult: If the granule could not be read; that is not the same as no OPeNDAP URL
+    """
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json_v1_4?collection_concept_id={ccid}'
+    oldest_dict = await process_request(cmr_query_url, json_processor, session, page_size=1, page_num=1)
+
+    if len(oldest_dict) != 1:
+        return ccid, False, ""  # Empty URL if there is none.
+
+    first_key = next(iter(oldest_dict.keys()))
+    url = oldest_dict[first_key][1]  # The value is a tuple, the second element of which is the URL
+    return ccid, url.startswith(cloud_prefix), url
+
+
+async def get_provider_opendap_collections_brutishly(session: aiohttp.ClientSession, provider: str,
+                                                     service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    The asyncio version of opendap_cmr.get_provider_opendap_collections_brutishly().
+    All the collections are tested concurrently, limited by the session's connections.
+
+    :param session: An aiohttp session
+    :param provider: The string ID for a given EDC provider (e.g., ORNL_CLOUD)
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A dictionary
+    """
+    all_collections = await get_provider_collections(session, provider, service=service)
+    results = await asyncio.gather(*[collection_has_opendap(session, ccid, service=service)
+                                     for ccid in all_collections.keys()])
+
+    return {key: (value2, value3) for key, value2, value3 in results}
+
+
+def get_collections_granule_ids(ccids: list, num=-1, descending=False, connections=0,
+                                service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    Get the granule IDs for many collections at once. This runs an event loop and
+    can be called from sync code.
+
+    :param ccids: The Collection Concept IDs
+    :param num: Limit the number of granule IDs returned for each collection.
+    :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param connections: Use at most this many connections to CMR. If not given, use 'max_connections.'
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A dictionary of CCIDs and their Granule IDs, in a list
+    """
+    async def get_all() -> list:
+        async with get_session(connections) as session:
+            return await asyncio.gather(*[get_collection_granule_ids(session, ccid, num, descending, service)
+                                          for ccid in ccids])
+
+    return dict(zip(ccids, asyncio.run(get_all())))
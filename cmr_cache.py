@@ -0,0 +1,219 @@
+"""
+A persistent cache for CMR responses, stored in a SQLite database.
+
+opendap_cmr.get_page() uses the cache when opendap_cmr.response_cache is set:
+
+    opendap_cmr.response_cache = cmr_cache.ResponseCache('logs/cmr_cache.sqlite')
+
+Responses are indexed using a normalized form of the query URL (and the
+CMR-Search-After header, if any) and the bodies are stored compressed. Each
+kind of search (collections, granules, ...) has its own time-to-live. When the
+cache grows beyond its size limit, the least recently used responses are
+removed.
+
+An expired response can, optionally, be revalidated instead of requested again.
+See opendap_cmr.response_unchanged() for how that is done. A query is revalidated
+once per run; the other pages of the query use that verdict.
+"""
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+"""
+Default time-to-live, in seconds, for each kind of search. Collections change
+rarely, granules are added to active collections all the time.
+"""
+DEFAULT_TTLS = {'collections': 24 * 3600, 'granules': 3600}
+DEFAULT_TTL = 3600
+
+"""
+Query parameters that do not change the response.
+"""
+IGNORED_PARAMS = ('pretty',)
+
+"""
+The response headers saved with each response.
+"""
+SAVED_HEADERS = ('CMR-Hits', 'CMR-Search-After')
+
+
+def normalize_url(url: str, search_after: str = '') -> str:
+    """
+    Make the cache key for a query. The query parameters are sorted, so the
+    same query written two ways uses the same cache entry, and parameters that
+    do not change the response are dropped.
+
+    :param url: The whole URL, query params and all. The ask_cmr.py style of
+        URL that uses '&' in place of '?' is understood.
+    :param search_after: The value of the CMR-Search-After header, if any
+    :returns: The key
+    """
+    parts = urlsplit(url)
+    path, _, extra = parts.path.partition('&')  # 'http://host/path&page_num=1' has no '?'
+    params = parse_qsl('&'.join(q for q in (extra, parts.query) if q), keep_blank_values=True)
+    query = urlencode(sorted((k, v) for k, v in params if k not in IGNORED_PARAMS))
+    key = f'{parts.scheme}://{parts.netloc}{path}?{query}'
+    return f'{key}|{search_after}' if search_after else key
+
+
+def endpoint(url: str) -> str:
+    """
+    The kind of search a URL makes, e.g., 'granules' for .../search/granules.umm_json_v1_4?...
+
+    :param url: The whole URL
+    :returns: The name of the search
+    """
+    return urlsplit(url).path.partition('&')[0].rstrip('/').rpartition('/')[2].partition('.')[0]
+
+
+class CachedResponse:
+    """A response read from the cache."""
+    __slots__ = ('key', 'body', 'headers', 'fetched', 'fresh')
+
+    def __init__(self, key: str, body: bytes, headers: dict, fetched: float, fresh: bool):
+        self.key = key
+        self.body = body
+        self.headers = headers
+        self.fetched = fetched
+        self.fresh = fresh
+
+
+class ResponseCache:
+    """
+    A SQLite-backed cache of CMR responses. One instance can be shared by many threads.
+    """
+
+    def __init__(self, path='logs/cmr_cache.sqlite', max_bytes=512 * 1024 * 1024, ttls=None, revalidate=False):
+        """
+        :param path: The SQLite database file
+        :param max_bytes: Remove the least recently used responses when the (compressed) responses
+            take more than this much space
+        :param ttls: A dictionary of time-to-live values, in seconds, for each kind of search. These
+            are added to DEFAULT_TTLS.
+        :param revalidate: If true, ask CMR if an expired response has changed before getting it again
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._verdicts = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, endpoint TEXT, body BLOB,'
+                         ' headers TEXT, size INTEGER, fetched REAL, accessed REAL)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self._size = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def ttl(self, url: str) -> float:
+        return self.ttls.get(endpoint(url), DEFAULT_TTL)
+
+    def get(self, url: str, search_after: str = ''):
+        """
+        Look up a response.
+
+        :param url: The whole URL, query params and all
+        :param search_after: The value of the CMR-Search-After header, if any
+        :returns: A CachedResponse, which may have expired (see 'fresh'), or None
+        """
+        key = normalize_url(url, search_after)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute('SELECT body, headers, fetched FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+
+            body, headers, fetched = row
+            fresh = now - fetched < self.ttl(url)
+            if fresh:
+                self.hits += 1
+
+        return CachedResponse(key, zlib.decompress(body), dict(parse_qsl(headers)), fetched, fresh)
+
+    def put(self, url: str, search_after: str, body: bytes, headers: dict):
+        """
+        Save a response, then make room for it if the cache is too large.
+
+        :param url: The whole URL, query params and all
+        :param search_after: The value of the CMR-Search-After header sent with the request, if any
+        :param body: The response body
+        :param headers: The response headers
+        """
+        key = normalize_url(url, search_after)
+        data = zlib.compress(body)
+        saved = urlencode([(name, headers[name]) for name in SAVED_HEADERS if name in headers])
+        now = time.time()
+        with self._lock:
+            old = self._db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (key, endpoint(url), data, saved, len(data), now, now))
+            self._size += len(data) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def refresh(self, response: CachedResponse):
+        """
+        Mark a revalidated response as fresh, as if it was just fetched.
+        """
+        with self._lock:
+            self._db.execute('UPDATE responses SET fetched = ? WHERE key = ?', (time.time(), response.key))
+            self.revalidated += 1
+
+    def verdict(self, url: str, fetched: float):
+        """
+        Look up what revalidating another page of the same query found, earlier in this run.
+
+        :param url: The query URL, without the page parameters
+        :param fetched: When the page that needs revalidating was fetched
+        :returns: True if the query is unchanged since 'fetched', False if it has changed,
+            or None if that is not known and the query must be revalidated
+        """
+        with self._lock:
+            checked = self._verdicts.get(normalize_url(url))
+        if checked is None:
+            return None
+        since, unchanged = checked
+        # Unchanged since a time before this page was fetched means unchanged since this
+        # page was fetched too; changed is taken to apply to every page of the query.
+        return unchanged if not unchanged or fetched >= since else None
+
+    def remember_verdict(self, url: str, fetched: float, unchanged: bool):
+        """
+        Save the result of revalidating a page for the rest of the run; see verdict().
+
+        :param url: The query URL, without the page parameters
+        :param fetched: When the page that was revalidated was fetched
+        :param unchanged: True if the query had not changed since then
+        """
+        with self._lock:
+            self._verdicts[normalize_url(url)] = (fetched, unchanged)
+
+    def _evict(self):
+        """Remove the least recently used responses until the cache is 90% of max_bytes. Hold the lock."""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall()
+        for key, size in rows:
+            if self._size <= target:
+                break
+            self._db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._size -= size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM responses')
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
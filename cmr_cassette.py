@@ -0,0 +1,276 @@
+"""
+Record the HTTP exchanges a run makes and play them back, so the client side can
+be timed against real CMR and Hyrax responses without the network in the way.
+
+In record mode, every request made with the opendap_cmr sessions (and with any
+other session the cassette is mounted on, like s3_driver's downloads) goes to
+the network as usual, and the request and its response are written to the
+cassette: a gzip'd file with one line of JSON for each exchange. In replay mode
+no connections are made; each request is answered with the response recorded
+for it, right away or after the time the recorded request took (scaled).
+
+    opendap_cmr.cassette = cmr_cassette.Cassette('logs/cassette.jsonl.gz', 'record')
+    ...
+    opendap_cmr.cassette.close()
+
+Requests are matched using their method, URL and the request headers that pick
+a response (e.g., CMR-Search-After). When the same request was recorded more than
+once, the responses are played in the order they were recorded, and the last is
+repeated after that. A request that was not recorded raises CassetteMiss.
+
+Credentials are kept out of the cassette: cookies and authorization headers are
+not recorded, the values of query parameters that carry a token or an OAuth code
+are replaced (in the recorded URLs and redirects, and when matching requests) and
+the exchanges with Earthdata Login itself are not recorded at all.
+
+The aiohttp requests cmr_async makes and the searches earthaccess makes (in
+s3_driver) use their own sessions and are not recorded, so s3_driver only
+replays --summary-only runs, which make no earthaccess searches.
+"""
+import base64
+import datetime
+import gzip
+import io
+import json
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import cmr_http
+
+"""
+The request headers that change the response to a request and so are recorded
+and used to match the requests played back.
+"""
+MATCH_HEADERS = ('CMR-Search-After', 'If-None-Match', 'If-Modified-Since', 'Range')
+
+"""
+Response headers that are not recorded. The bodies are recorded decoded, so they
+do not describe the body that is played back.
+"""
+DROP_HEADERS = ('Content-Encoding', 'Transfer-Encoding', 'Content-Length', 'Connection', 'Keep-Alive',
+                'Set-Cookie', 'Cookie', 'Authorization', 'Proxy-Authorization')
+
+"""
+Query parameters whose values are credentials. Their values are replaced by
+SCRUBBED in the URLs written to a cassette.
+"""
+SECRET_PARAMS = ('code', 'token', 'access_token', 'refresh_token', 'id_token', 'client_secret')
+SCRUBBED = 'scrubbed'
+
+"""
+The Earthdata Login hosts. The exchanges with these are not recorded; their
+responses can hold tokens in the body.
+"""
+EDL_HOSTS = ('urs.earthdata.nasa.gov', 'uat.urs.earthdata.nasa.gov', 'sit.urs.earthdata.nasa.gov')
+
+MODES = ('record', 'replay')
+
+
+class CassetteMiss(requests.exceptions.RequestException):
+    """A request made in replay mode that is not in the cassette."""
+
+
+class RecordedBody(io.BytesIO):
+    """
+    A response body that has been read, as a file object that can be read again
+    (e.g., with shutil.copyfileobj(r.raw, f)). It keeps the urllib3 response's
+    http.client response, if there was one, so requests can still read its cookies.
+    """
+
+    def __init__(self, body: bytes, raw=None):
+        super().__init__(body)
+        self._original_response = getattr(raw, '_original_response', None)
+
+
+def scrub_url(url: str) -> str:
+    """Replace the values of the SECRET_PARAMS in a URL's query."""
+    return re.sub(rf'([?&](?:{"|".join(SECRET_PARAMS)})=)[^&#]*', rf'\g<1>{SCRUBBED}', url)
+
+
+def match_key(method: str, url: str, headers) -> tuple:
+    """The key used to match a request with its recorded response."""
+    return (method.upper(), scrub_url(url)) + tuple(headers.get(name, '') for name in MATCH_HEADERS)
+
+
+class RecordingAdapter(BaseAdapter):
+    """
+    Send requests with another adapter and record each request and its response
+    in a cassette. The response's body is read before it is returned.
+    """
+
+    def __init__(self, cassette, adapter: BaseAdapter):
+        super().__init__()
+        self.cassette = cassette
+        self.adapter = adapter
+        self.stats = getattr(adapter, 'stats', None) or cmr_http.PoolStats()
+
+    def send(self, request, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        r = self.adapter.send(request, **kwargs)
+        body = r.content
+        self.cassette.record(request, r, body, time.perf_counter() - start)
+        r.raw = RecordedBody(body, r.raw)
+        return r
+
+    def close(self):
+        self.adapter.close()
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answer requests with the responses recorded in a cassette. No connections are made."""
+
+    def __init__(self, cassette):
+        super().__init__()
+        self.cassette = cassette
+        self.stats = cmr_http.PoolStats()
+
+    def send(self, request, **kwargs) -> requests.Response:
+        exchange = self.cassette.play(request)
+        if self.cassette.timing > 0:
+            time.sleep(exchange['elapsed'] * self.cassette.timing)
+        body = Cassette.body(exchange)
+
+        r = requests.Response()
+        r.status_code = exchange['status']
+        r.reason = exchange['reason']
+        r.headers = CaseInsensitiveDict(exchange['response_headers'])
+        r.headers['Content-Length'] = str(len(body))
+        r.encoding = get_encoding_from_headers(r.headers)
+        r._content = body
+        r.raw = RecordedBody(body)
+        r.url = request.url
+        r.request = request
+        r.connection = self
+        r.elapsed = datetime.timedelta(seconds=exchange['elapsed'])
+        return r
+
+    def close(self):
+        pass
+
+
+class Cassette:
+    """
+    The HTTP exchanges of a run, recorded to or played back from a file. One
+    instance can be shared by many threads.
+    """
+
+    def __init__(self, path: str, mode='replay', timing=0.0):
+        """
+        :param path: The cassette file, e.g., logs/cassette.jsonl.gz. Recording replaces it.
+        :param mode: 'record' or 'replay'
+        :param timing: In replay mode, wait this many times the time each recorded
+            request took before answering it: 0 to answer right away, 1 for the recorded timings
+        :raises ValueError: If the mode is not 'record' or 'replay'
+        """
+        if mode not in MODES:
+            raise ValueError(f'Cassette mode must be one of {MODES}, not {mode!r}')
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.recorded = 0
+        self.played = 0
+        self.missed = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._exchanges = {}  # match key: [exchange, ...] in the order recorded
+        self._next = {}  # match key: index of the next exchange to play
+        if mode == 'record':
+            self._file = gzip.open(path, 'wt', encoding='utf-8')
+        else:
+            for exchange in self.load(path):
+                self._exchanges.setdefault(tuple(exchange['key']), []).append(exchange)
+
+    @staticmethod
+    def load(path: str) -> list:
+        """
+        Read the exchanges in a cassette file. A cassette whose recording was cut
+        short is read up to the last whole exchange.
+        """
+        exchanges = []
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    if line.endswith('\n'):
+                        exchanges.append(json.loads(line))
+            except EOFError:
+                pass
+        return exchanges
+
+    @staticmethod
+    def body(exchange: dict) -> bytes:
+        """The recorded body of a response, as bytes."""
+        if 'body64' in exchange:
+            return base64.b64decode(exchange['body64'])
+        return exchange['body'].encode('utf-8')
+
+    def adapter(self, adapter: BaseAdapter) -> BaseAdapter:
+        """
+        :param adapter: The adapter that sends the requests when recording
+        :returns: An adapter that records the requests sent with 'adapter,' or one
+            that plays them back
+        """
+        if self.mode == 'record':
+            return RecordingAdapter(self, adapter)
+        return ReplayAdapter(self)
+
+    def mount(self, session: requests.Session) -> requests.Session:
+        """Record (or play back) the HTTP and HTTPS requests made with a session."""
+        for prefix in ('https://', 'http://'):
+            current = session.get_adapter(prefix)
+            if not isinstance(current, (RecordingAdapter, ReplayAdapter)):
+                session.mount(prefix, self.adapter(current))
+        return session
+
+    def record(self, request, r: requests.Response, body: bytes, elapsed: float):
+        """Write a request and its response to the cassette, unless it was made to Earthdata Login."""
+        if urlsplit(request.url).hostname in EDL_HOSTS:
+            return
+        exchange = {'key': match_key(request.method, request.url, request.headers),
+                    'status': r.status_code, 'reason': r.reason, 'elapsed': round(elapsed, 6),
+                    'response_headers': {name: scrub_url(value) if name.title() == 'Location' else value
+                                         for name, value in r.headers.items() if name.title() not in DROP_HEADERS}}
+        try:
+            exchange['body'] = body.decode('utf-8')
+        except UnicodeDecodeError:
+            exchange['body64'] = base64.b64encode(body).decode('ascii')
+        line = json.dumps(exchange, separators=(',', ':')) + '\n'
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+                self.recorded += 1
+
+    def play(self, request) -> dict:
+        """
+        :returns: The next exchange recorded for the request
+        :raises CassetteMiss: If the request was not recorded
+        """
+        key = match_key(request.method, request.url, request.headers)
+        with self._lock:
+            exchanges = self._exchanges.get(key)
+            if not exchanges:
+                self.missed += 1
+                raise CassetteMiss(f'No response recorded in {self.path} for {request.method} {request.url}',
+                                   request=request)
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            self.played += 1
+            return exchanges[min(index, len(exchanges) - 1)]
+
+    def summary(self) -> str:
+        if self.mode == 'record':
+            return f'Cassette: {self.recorded} exchanges recorded to {self.path}'
+        return f'Cassette: {self.played} responses played from {self.path}, {self.missed} requests not found'
+
+    def close(self):
+        """Finish writing the cassette. Nothing is recorded after this."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,119 @@
+"""
+Make concurrent identical CMR queries share one request ('single flight').
+
+Programs like string_search.py and regression_tests.py (now in retired/) ask
+about many collections from many threads, and the same query (e.g., the first
+and last granule of a collection that shows up for more than one provider) is
+often asked again while the first copy is still waiting for CMR. When
+opendap_cmr.flights is set (it is not by default; see --single-flight in
+ask_cmr.py and find_collections.py), process_request() and
+process_request_list() use it: the first thread to make a query (the leader)
+makes the request; threads that make the same query before it is done wait
+for the leader and are given copies of its result (or its exception).
+
+Only queries in flight at the same time are shared. A query made after the
+leader is done makes a new request; see cmr_cache for keeping responses.
+
+    opendap_cmr.flights = cmr_flight.SingleFlight()
+    ...
+    print(opendap_cmr.flights.summary())
+"""
+import copy
+import threading
+
+
+def result_copy(result):
+    """
+    Copy a result so the caller can change it. merge_dict() changes the dictionaries
+    it is given, for example.
+    """
+    if isinstance(result, (dict, set, list)):
+        return result.copy()
+    return copy.deepcopy(result)
+
+
+def error_copy(error: BaseException) -> BaseException:
+    """
+    Copy an exception so that each thread raises its own. Callers set attributes
+    of the exceptions they catch (e.g., CMRIncompleteResult.partial), so the
+    attributes that are dictionaries, sets or lists are copied too.
+    """
+    clone = type(error).__new__(type(error), *error.args)
+    clone.args = error.args
+    clone.__dict__.update({name: value.copy() if isinstance(value, (dict, set, list)) else value
+                           for name, value in vars(error).items()})
+    clone.__cause__ = error.__cause__
+    clone.__context__ = error.__context__
+    clone.__suppress_context__ = error.__suppress_context__
+    return clone.with_traceback(error.__traceback__)
+
+
+class Flight:
+    """One call in flight and the threads waiting for it."""
+    __slots__ = ('done', 'result', 'error', 'waiting')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiting = 0
+
+
+class SingleFlight:
+    """
+    Run at most one call for each key at a time. One instance can be shared by many threads.
+    """
+
+    def __init__(self):
+        self.calls = 0      # The calls made (by leaders)
+        self.shared = 0     # The calls that shared a leader's call instead of making their own
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function: callable):
+        """
+        Call function, unless a call with the same key is in flight; then wait for that
+        call and return a copy of its result.
+
+        :param key: Calls with equal keys are the same call; it must be hashable
+        :param function: Called with no arguments
+        :returns: What function returns
+        :raises: What function raises
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.calls += 1
+            else:
+                flight.waiting += 1
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise error_copy(flight.error)
+            return result_copy(flight.result)
+
+        try:
+            flight.result = function()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                waiting = flight.waiting
+            flight.done.set()
+
+        # The waiting threads copy the result; so the leader's caller can change it, it gets a copy too
+        return result_copy(flight.result) if waiting > 0 else flight.result
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def summary(self) -> str:
+        return f'Single flight: {self.calls} requests made, {self.shared} saved by sharing a request in flight'
@@ -0,0 +1,86 @@
+"""
+The HTTP connection pools shared by the requests sessions that opendap_cmr uses.
+
+A requests.Session is not thread safe, so opendap_cmr.get_session() still makes
+one session per thread. But every session mounts the same PooledAdapter, so all
+threads, and all the thread pools (executors) a program makes over its life, share
+one pool of keep-alive connections for each host. A connection opened (and its TLS
+handshake made) by one thread is reused by the next request from any thread.
+
+Each host's pool holds at most 'pool_size' connections. When they are all in use,
+a request waits for one instead of opening (and then throwing away) another. The
+PoolStats count the connections opened, the requests that reused a connection and
+the requests that had to wait.
+"""
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PoolStats:
+    """Counts of what the connection pools of a PooledAdapter have done."""
+
+    def __init__(self):
+        self.opened = 0
+        self.requests = 0
+        self.waited = 0
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def reused(self) -> int:
+        """The requests that used a connection already open"""
+        return max(0, self.requests - self.opened)
+
+    def as_dict(self) -> dict:
+        return {'opened': self.opened, 'reused': self.reused, 'waited': self.waited, 'requests': self.requests}
+
+    def __str__(self):
+        return (f'Connections: {self.opened} opened, {self.reused} reused, {self.waited} waited, '
+                f'{self.requests} requests')
+
+
+class CountingPoolMixin:
+    """Count the connections a urllib3 connection pool opens and the requests that wait for one."""
+    stats: PoolStats = None
+
+    def _new_conn(self):
+        self.stats.count('opened')
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        if self.pool is not None and self.pool.empty():
+            self.stats.count('waited')
+        return super()._get_conn(timeout)
+
+    def urlopen(self, *args, **kwargs):
+        self.stats.count('requests')
+        return super().urlopen(*args, **kwargs)
+
+
+class PooledAdapter(HTTPAdapter):
+    """
+    An HTTPAdapter that one or more sessions can share. Its pools block when full
+    and count what they do in 'stats.'
+    """
+
+    def __init__(self, pool_size=64, hosts=10, **kwargs):
+        """
+        :param pool_size: The most connections to keep open to each host
+        :param hosts: The number of hosts to keep pools for
+        :param kwargs: Passed to HTTPAdapter (e.g., max_retries)
+        """
+        self.stats = PoolStats()
+        super().__init__(pool_connections=hosts, pool_maxsize=pool_size, pool_block=True, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        stats = self.stats
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('CountingHTTPConnectionPool', (CountingPoolMixin, HTTPConnectionPool), {'stats': stats}),
+            'https': type('CountingHTTPSConnectionPool', (CountingPoolMixin, HTTPSConnectionPool), {'stats': stats}),
+        }
@@ -0,0 +1,138 @@
+"""
+An adaptive limit on the number of requests made to CMR at the same time.
+
+opendap_cmr.get_page() uses the limiter when opendap_cmr.limiter is set, so it
+is shared by all the CMR requests a program makes, from any thread:
+
+    opendap_cmr.limiter = cmr_limiter.AIMDLimiter()
+
+The limit follows the AIMD (additive increase, multiplicative decrease) rule
+that TCP uses for its congestion window. It starts low and grows by one for each
+healthy response until the first sign of trouble ('slow start'); after that it
+grows by about one for each limit's worth of healthy responses. When CMR
+throttles a request (429, 503), the connection fails or the average latency
+climbs well above the lowest latency seen, the limit is cut by 'decrease'. Latencies
+are only compared for requests of the same kind (see request_kind()): a hits-only
+query takes a fraction of the time a page of 2000 granules does. Only one cut
+is made for each round of requests, so a burst of throttled responses to
+requests that were all in flight together counts as one signal.
+
+Thread pools (e.g., the 'workers' of get_provider_opendap_collections_brutishly())
+become a ceiling; the limiter decides how many of those threads talk to CMR
+at once.
+"""
+import collections
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+
+"""
+HTTP status codes that mean 'slow down.'
+"""
+THROTTLE_STATUS = (429, 503)
+
+"""
+Latency changes smaller than this, in seconds, are noise, not overload.
+"""
+LATENCY_NOISE = 0.005
+
+
+def request_kind(url: str) -> str:
+    """
+    The kind of request a URL makes, for comparing latencies: its path and page size,
+    e.g., '/search/granules.json page_size=2000'.
+    """
+    parts = urlsplit(url)
+    page_size = parse_qs(parts.query).get('page_size', [''])[-1]
+    return f'{parts.path} page_size={page_size}' if page_size else parts.path
+
+
+class AIMDLimiter:
+    """
+    An AIMD concurrency limit. Call acquire() before a request and release()
+    after it. One instance can be shared by many threads.
+    """
+
+    def __init__(self, initial=8, minimum=1, maximum=256, decrease=0.5, latency_tolerance=2.0):
+        """
+        :param initial: The limit to start with
+        :param minimum: Never allow fewer than this many requests at once
+        :param maximum: Never allow more than this many requests at once
+        :param decrease: Multiply the limit by this when CMR shows signs of overload
+        :param latency_tolerance: Treat an average latency greater than this multiple of the
+            lowest latency seen, for the same kind of request, as a sign of overload
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(initial)
+        self.in_flight = 0
+        self.slow_start = True
+        self.min_latency = {}   # kind: the lowest latency seen
+        self.latency = {}       # kind: an exponentially weighted moving average
+        self.requests = 0
+        self.throttled = 0
+        self.peak = self.limit
+        self._last_decrease = 0.0
+        self._recent_limits = collections.deque(maxlen=100)
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Wait until another request can be made.
+
+        :returns: The time the request started; pass it to release()
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, start: float, throttled=False, kind=''):
+        """
+        Record the end of a request and adjust the limit.
+
+        :param start: The value acquire() returned
+        :param throttled: True if CMR throttled the request or the connection failed
+        :param kind: The kind of request, e.g., from request_kind(). Its latency is only
+            compared with those of requests of the same kind.
+        """
+        now = time.monotonic()
+        latency = now - start
+        with self._cond:
+            self.in_flight -= 1
+            self.requests += 1
+            self.throttled += 1 if throttled else 0
+            # Requests that started before the last cut say nothing about the new limit
+            if start > self._last_decrease:
+                if not throttled:
+                    self.min_latency[kind] = min(self.min_latency.get(kind, latency), latency)
+                    self.latency[kind] = 0.9 * self.latency.get(kind, latency) + 0.1 * latency
+
+                if throttled or (self.latency.get(kind, 0.0) >
+                                 self.min_latency.get(kind, 0.0) * self.latency_tolerance + LATENCY_NOISE):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.slow_start = False
+                    self.latency.clear()
+                    self._last_decrease = now
+                elif self.slow_start:
+                    self.limit = min(self.maximum, self.limit + 1)
+                else:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+            self.peak = max(self.peak, self.limit)
+            self._recent_limits.append(self.limit)
+            self._cond.notify_all()
+
+    @property
+    def settled(self) -> float:
+        """The average limit over the last 100 requests"""
+        with self._cond:
+            recent = list(self._recent_limits)
+        return sum(recent) / len(recent) if recent else self.limit
+
+    def summary(self) -> str:
+        return (f'Concurrency settled at {self.settled:.1f} (peak {self.peak:.0f}), {self.requests} requests, '
+                f'{self.throttled} throttled')
@@ -0,0 +1,232 @@
+"""
+Per-request metrics for the CMR client and the download and upload paths.
+
+When opendap_cmr.metrics is set, every HTTP request opendap_cmr.cmr_get() makes
+is recorded with its endpoint (the URL path, e.g., /search/granules.umm_json),
+status code, latency and size, and every retry get_page() makes is counted.
+s3_driver records its downloads and uploads the same way, with the endpoints
+'download' and 'upload'. The latencies and sizes are kept in histograms, so the
+memory used does not grow with the number of requests.
+
+At the end of a run, write() saves the metrics as a Prometheus text file (for
+node_exporter's textfile collector, or to diff across releases) and a JSON run
+report:
+
+    opendap_cmr.metrics = cmr_metrics.Metrics()
+    ...
+    opendap_cmr.metrics.write('logs/metrics')   # logs/metrics.prom and logs/metrics.json
+    print(opendap_cmr.metrics.summary())
+"""
+import datetime
+import json
+import threading
+import time
+from urllib.parse import urlsplit
+
+"""
+The upper bounds of the latency histograms' buckets, in seconds.
+"""
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+"""
+The upper bounds of the size histograms' buckets, in bytes.
+"""
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+
+PREFIX = 'pydmr'
+
+
+def endpoint(url: str) -> str:
+    """
+    The endpoint a URL is recorded under: its path, without the query. For URLs
+    that name a file (e.g., a granule's DMR++), the host is used instead, so the
+    endpoints do not grow with the number of files.
+    """
+    parts = urlsplit(url)
+    if parts.path.startswith('/search/'):
+        return parts.path
+    return parts.netloc or parts.path
+
+
+class Histogram:
+    """
+    Observations counted in buckets, like a Prometheus histogram. Not thread-safe
+    by itself; Metrics holds a lock while it is updated.
+    """
+    __slots__ = ('bounds', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # The last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile by interpolating within the bucket that holds it, as
+        Prometheus' histogram_quantile() does. Values in the +Inf bucket are given as the largest value seen.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if i == len(self.bounds):
+                    return self.max
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                return min(lower + (self.bounds[i] - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def cumulative(self) -> list:
+        """The (upper bound, count of observations <= it) pairs, ending with ('+Inf', count)."""
+        pairs = []
+        total = 0
+        for bound, count in zip(list(self.bounds) + ['+Inf'], self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class EndpointMetrics:
+    """What is known about the requests made to one endpoint."""
+    __slots__ = ('status', 'retries', 'bytes', 'latency', 'size')
+
+    def __init__(self):
+        self.status = {}  # status code (0 for a connection that failed): count
+        self.retries = 0
+        self.bytes = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+
+
+class Metrics:
+    """
+    Request metrics for a run, kept by endpoint. One instance can be shared by many threads.
+    """
+
+    def __init__(self):
+        self.started = datetime.datetime.now(datetime.timezone.utc)
+        self._start = time.monotonic()
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _endpoint(self, name: str) -> EndpointMetrics:
+        if name not in self._endpoints:
+            self._endpoints[name] = EndpointMetrics()
+        return self._endpoints[name]
+
+    def record(self, name: str, status: int, seconds: float, size: int = 0):
+        """
+        Record one request.
+
+        :param name: The endpoint; see endpoint()
+        :param status: The HTTP status code, or 0 if the connection failed
+        :param seconds: How long the request took
+        :param size: The bytes in the response (or sent, for an upload)
+        """
+        with self._lock:
+            metrics = self._endpoint(name)
+            metrics.status[status] = metrics.status.get(status, 0) + 1
+            metrics.latency.observe(seconds)
+            if status != 0:
+                metrics.size.observe(size)
+                metrics.bytes += size
+
+    def retry(self, name: str):
+        """Count a retry of a request to the endpoint."""
+        with self._lock:
+            self._endpoint(name).retries += 1
+
+    @property
+    def requests(self) -> int:
+        with self._lock:
+            return sum(sum(metrics.status.values()) for metrics in self._endpoints.values())
+
+    def report(self) -> dict:
+        """
+        The run report: for each endpoint, the requests by status, the retries, the
+        bytes and the latency quantiles.
+        """
+        with self._lock:
+            endpoints = {}
+            for name, metrics in sorted(self._endpoints.items()):
+                latency = metrics.latency
+                endpoints[name] = {
+                    'requests': sum(metrics.status.values()),
+                    'status': {str(status): count for status, count in sorted(metrics.status.items())},
+                    'retries': metrics.retries,
+                    'bytes': metrics.bytes,
+                    'seconds': {'total': round(latency.sum, 6),
+                                'mean': round(latency.sum / latency.count, 6) if latency.count else 0.0,
+                                'p50': round(latency.quantile(0.50), 6),
+                                'p95': round(latency.quantile(0.95), 6),
+                                'p99': round(latency.quantile(0.99), 6),
+                                'max': round(latency.max, 6)}}
+        return {'started': self.started.isoformat(timespec='seconds'),
+                'duration': round(time.monotonic() - self._start, 3),
+                'endpoints': endpoints}
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name: str, help_text: str, attribute: str):
+            lines.append(f'# HELP {PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {PREFIX}_{name} histogram')
+            for endpoint_name, metrics in sorted(self._endpoints.items()):
+                values = getattr(metrics, attribute)
+                label = f'endpoint="{endpoint_name}"'
+                for bound, count in values.cumulative():
+                    lines.append(f'{PREFIX}_{name}_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'{PREFIX}_{name}_sum{{{label}}} {values.sum:.6f}')
+                lines.append(f'{PREFIX}_{name}_count{{{label}}} {values.count}')
+
+        with self._lock:
+            lines.append(f'# HELP {PREFIX}_requests_total HTTP requests by endpoint and status (0: connection failed)')
+            lines.append(f'# TYPE {PREFIX}_requests_total counter')
+            for endpoint_name, metrics in sorted(self._endpoints.items()):
+                for status, count in sorted(metrics.status.items()):
+                    lines.append(f'{PREFIX}_requests_total{{endpoint="{endpoint_name}",status="{status}"}} {count}')
+            lines.append(f'# HELP {PREFIX}_retries_total Requests retried by endpoint')
+            lines.append(f'# TYPE {PREFIX}_retries_total counter')
+            for endpoint_name, metrics in sorted(self._endpoints.items()):
+                lines.append(f'{PREFIX}_retries_total{{endpoint="{endpoint_name}"}} {metrics.retries}')
+            histogram('request_seconds', 'The time each request took', 'latency')
+            histogram('response_bytes', 'The size of each response (or upload)', 'size')
+        lines.append(f'# HELP {PREFIX}_run_seconds The time since the metrics were started')
+        lines.append(f'# TYPE {PREFIX}_run_seconds gauge')
+        lines.append(f'{PREFIX}_run_seconds {time.monotonic() - self._start:.3f}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, prefix: str):
+        """
+        Write the metrics to '<prefix>.prom' (Prometheus text) and '<prefix>.json' (the run report).
+        """
+        with open(f'{prefix}.prom', 'w') as f:
+            f.write(self.prometheus())
+        with open(f'{prefix}.json', 'w') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+    def summary(self) -> str:
+        lines = ['Requests:']
+        for name, metrics in self.report()['endpoints'].items():
+            seconds = metrics['seconds']
+            lines.append(f'  {name}: {metrics["requests"]} requests ({metrics["retries"]} retries), '
+                         f'{metrics["bytes"] / 1024 ** 2:.1f}MB, p50 {seconds["p50"] * 1000:.0f}ms, '
+                         f'p95 {seconds["p95"] * 1000:.0f}ms, p99 {seconds["p99"] * 1000:.0f}ms')
+        return '\n'.join(lines)
@@ -0,0 +1,187 @@
+"""
+Deterministic (cProfile) profiles of a run, kept separately for each stage of
+the work: listing granules and collections in CMR, resolving the URLs of the
+granules, and downloading, rewriting and uploading the DMR++ files.
+
+When opendap_cmr.profiler is set, opendap_cmr.trace_span() also switches the
+thread it is called on to the profile of the span's stage (see STAGES; spans
+that are not a stage stay in the stage they are in). Time spent outside any
+stage is in the 'main' stage. Each stage is profiled on each thread that works
+in it, and the threads' profiles are merged when they are written:
+
+    opendap_cmr.profiler = cmr_profile.StageProfiler()
+    opendap_cmr.profiler.start()
+    ...
+    opendap_cmr.profiler.stop()
+    opendap_cmr.profiler.write('logs/profile')   # logs/profile-listing.prof, ...
+    print(opendap_cmr.profiler.summary())
+
+The .prof files can be read with pstats, snakeviz, etc. Profiling slows a run
+down, often by half or more, so the time in each stage is only a guide to where
+the time goes. On Python 3.12 and later only one profiler can run at a time, so
+only the first thread to start a stage is profiled while it is in one.
+"""
+import cProfile
+import io
+import pstats
+import threading
+from collections import defaultdict
+
+"""
+The trace span names that start a stage, and their stages. See opendap_cmr.trace_span().
+"""
+STAGES = {'listing': 'listing', 'plan': 'listing', 'window': 'listing', 'search': 'listing', 'hits': 'listing',
+          'resolve': 'resolve', 'download': 'download', 'rewrite': 'rewrite', 'upload': 'upload'}
+
+MAIN = 'main'
+
+
+class StageProfiler:
+    """
+    cProfile profiles of a run, one for each stage. One instance can be shared by many threads.
+    """
+
+    def __init__(self, stages: dict = None):
+        """
+        :param stages: The span names that start a stage and their stages (default: STAGES)
+        """
+        self.stages = stages if stages is not None else STAGES
+        self._profiles = defaultdict(list)  # stage: [cProfile.Profile, one for each thread]
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+            self._local.profiles = {}
+        return self._local.stack
+
+    def _profile(self, stage: str) -> cProfile.Profile:
+        """The profile of a stage for this thread."""
+        profiles = self._local.profiles
+        if stage not in profiles:
+            profiles[stage] = cProfile.Profile()
+            with self._lock:
+                self._profiles[stage].append(profiles[stage])
+        return profiles[stage]
+
+    def _enter(self, stage: str):
+        stack = self._stack()
+        if stack and stack[-1][0] == stage:
+            stack.append((stage, stack[-1][1], False))  # Already in the stage; do not switch profiles
+            return
+        if stack and stack[-1][1] is not None:
+            stack[-1][1].disable()
+        profile = self._profile(stage)
+        try:
+            profile.enable()
+        except ValueError:
+            profile = None  # Another thread is being profiled (Python 3.12+)
+        stack.append((stage, profile, True))
+
+    def _exit(self):
+        stack = self._stack()
+        if not stack:
+            return
+        _, profile, switched = stack.pop()
+        if not switched:
+            return
+        if profile is not None:
+            profile.disable()
+        if stack and stack[-1][1] is not None:
+            try:
+                stack[-1][1].enable()
+            except ValueError:
+                pass
+
+    def stage(self, name: str) -> 'Stage':
+        """
+        A context manager that profiles its block in the stage of the span 'name';
+        for names that are not stages, the block stays in the current stage.
+        """
+        return Stage(self, self.stages.get(name))
+
+    def start(self):
+        """Start profiling the calling thread in the 'main' stage."""
+        self._enter(MAIN)
+
+    def stop(self):
+        """Stop profiling the calling thread."""
+        while self._stack():
+            self._exit()
+
+    def stats(self, stage: str = None):
+        """
+        The profile of a stage, merged from all the threads, or of all the stages.
+        Call this after the threads have left their stages.
+
+        :returns: A pstats.Stats, or None if nothing was profiled
+        """
+        with self._lock:
+            profiles = [profile for name, stage_profiles in self._profiles.items() if stage in (None, name)
+                        for profile in stage_profiles]
+        stats = None
+        for profile in profiles:
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                stats.add(profile)
+        return stats
+
+    def write(self, prefix: str) -> list:
+        """
+        Write each stage's profile to '<prefix>-<stage>.prof'.
+
+        :returns: The names of the files written
+        """
+        with self._lock:
+            stages = sorted(self._profiles)
+        paths = []
+        for stage in stages:
+            stats = self.stats(stage)
+            if stats is not None:
+                paths.append(f'{prefix}-{stage}.prof')
+                stats.dump_stats(paths[-1])
+        return paths
+
+    def summary(self, top=20) -> str:
+        """The time profiled in each stage and the 'top' functions that took the most time themselves."""
+        lines = ['Profile (time in each stage, as profiled):']
+        with self._lock:
+            stages = sorted(self._profiles)
+        for stage in stages:
+            stats = self.stats(stage)
+            if stats is not None:
+                lines.append(f'  {stage}: {stats.total_tt:.2f}s, {stats.total_calls} calls')
+
+        stats = self.stats()
+        if stats is None:
+            return '\n'.join(lines)
+        lines += ['', f'Top {top} functions by time in the function itself:',
+                  f'{"tottime":>10}{"cumtime":>10}{"calls":>10}  function']
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        for (file, line, function), (_, calls, tottime, cumtime, _) in functions[:top]:
+            lines.append(f'{tottime:9.3f}s{cumtime:9.3f}s{calls:>10}  {function} ({file}:{line})')
+        return '\n'.join(lines)
+
+
+class Stage:
+    """Profile a block in a stage. See StageProfiler.stage()."""
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler: StageProfiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        if self.name is not None:
+            self.profiler._enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.name is not None:
+            self.profiler._exit()
+        return False
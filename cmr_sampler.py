@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+A sampling profiler that is cheap enough to leave on for a harvest that runs
+for hours.
+
+A background thread wakes up at a low, fixed rate (20 times a second by
+default), reads the stack of every other thread with sys._current_frames() and
+counts each stack. Nothing is done in the threads being sampled, so they run at
+full speed; the cost is the time the sampler thread takes, which it reports.
+Every so often the counts are written, in the 'collapsed stack' format that
+flamegraph.pl, speedscope, inferno, etc. render as flame graphs:
+
+    <prefix>.collapsed          every sample since the sampler started
+    <prefix>-recent.collapsed   the samples since the previous write
+
+Each file is replaced whole, so it can be read while the run goes on. Each line
+is one stack, from the thread (workers of a pool are named for the pool) down
+to the function that was running, and the number of times it was sampled:
+
+    ThreadPoolExecutor-0;_worker (thread.py:69);run (thread.py:53);... 1234
+
+    sampler = cmr_sampler.Sampler('logs/samples')
+    sampler.start()
+    ...
+    sampler.stop()              # Writes the files one last time
+
+Run this file to list the functions that were sampled most often:
+
+    ./cmr_sampler.py logs/samples.collapsed -n 20
+"""
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def thread_group(name: str) -> str:
+    """The name of a thread without its number in a pool, e.g., 'ThreadPoolExecutor-0_3' -> 'ThreadPoolExecutor-0'."""
+    return re.sub(r'_\d+$', '', name)
+
+
+def frame_label(code) -> str:
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+
+
+def collapse(frame, thread: str) -> str:
+    """A thread's stack as one line of a collapsed stack file (without the count), outermost frame first."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread)
+    return ';'.join(reversed(labels))
+
+
+class Sampler:
+    """
+    Sample the stacks of all threads from a background thread and write them, now and then, as collapsed stacks.
+    """
+
+    def __init__(self, prefix: str, rate=20.0, flush=60.0):
+        """
+        :param prefix: The files written are <prefix>.collapsed and <prefix>-recent.collapsed
+        :param rate: The number of times a second to sample the threads
+        :param flush: The seconds between writes of the files
+        """
+        self.prefix = prefix
+        self.interval = 1.0 / rate
+        self.flush_interval = flush
+        self.counts = Counter()
+        self.recent = Counter()
+        self.samples = 0
+        self.busy = 0.0     # Seconds the sampler spent sampling and writing
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def sample(self):
+        """Count the stack of each thread except the sampler's."""
+        names = {thread.ident: thread_group(thread.name) for thread in threading.enumerate()}
+        me = threading.get_ident()
+        stacks = [collapse(frame, names.get(ident, 'Thread')) for ident, frame in sys._current_frames().items()
+                  if ident != me]
+        with self._lock:
+            for stack in stacks:
+                self.counts[stack] += 1
+                self.recent[stack] += 1
+            self.samples += 1
+
+    def write(self) -> list:
+        """
+        Write the collapsed stack files, replacing them.
+
+        :returns: The names of the files written
+        """
+        with self._lock:
+            counts = dict(self.counts)
+            recent, self.recent = self.recent, Counter()
+        paths = []
+        for path, stacks in ((f'{self.prefix}.collapsed', counts), (f'{self.prefix}-recent.collapsed', recent)):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w') as f:
+                for stack, count in sorted(stacks.items()):
+                    f.write(f'{stack} {count}\n')
+            os.replace(f'{path}.tmp', path)
+            paths.append(path)
+        return paths
+
+    def _run(self):
+        flushed = time.monotonic()
+        while not self._stopped.wait(self.interval):
+            began = time.perf_counter()
+            self.sample()
+            if time.monotonic() - flushed >= self.flush_interval:
+                self.write()
+                flushed = time.monotonic()
+            self.busy += time.perf_counter() - began
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name='cmr_sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> list:
+        """
+        Stop sampling and write the files.
+
+        :returns: The names of the files written
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.write()
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self._started if self._started is not None else 0.0
+        overhead = f', {self.busy / elapsed:.2%} of the run' if elapsed > 0 else ''
+        return (f'Sampler: {self.samples} samples of {len(self.counts)} distinct stacks;'
+                f' {self.busy:.2f}s spent sampling{overhead}')
+
+
+def load(path: str) -> Counter:
+    """Read a collapsed stack file into a Counter of {stack: count}."""
+    counts = Counter()
+    with open(path) as f:
+        for line in f:
+            stack, _, count = line.rstrip('\n').rpartition(' ')
+            if stack:
+                counts[stack] += int(count)
+    return counts
+
+
+def report(counts: Counter, top=20) -> str:
+    """
+    The functions sampled most often: running (self) and on the stack (total).
+
+    :param counts: The stacks and their counts, as load() returns them
+    :param top: The number of functions listed
+    """
+    running, on_stack = Counter(), Counter()
+    total = sum(counts.values())
+    for stack, count in counts.items():
+        frames = stack.split(';')[1:]   # The first is the thread
+        if frames:
+            running[frames[-1]] += count
+        for frame in set(frames):
+            on_stack[frame] += count
+    if total == 0:
+        return 'No samples'
+
+    lines = [f'{total} samples', '', f'{"self":>7}{"total":>8}  function']
+    for frame, count in running.most_common(top):
+        lines.append(f'{count / total:7.1%}{on_stack[frame] / total:8.1%}  {frame}')
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="List the functions sampled most often in a collapsed stack file.")
+    parser.add_argument("samples", help="a collapsed stack file, e.g., logs/samples.collapsed")
+    parser.add_argument("-n", "--top", help="the number of functions to list (default: 20)", type=int, default=20)
+    args = parser.parse_args()
+
+    print(report(load(args.samples), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
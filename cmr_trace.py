@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+"""
+Lightweight tracing for the CMR -> download -> rewrite -> upload pipeline.
+
+A span is a named, timed piece of work, like the search of one time window or
+the download of one granule's DMR++. Spans nest: a span started while another
+is open on the same thread is its child, and a span started on a worker thread
+can be given its parent. Each span is written as one line of JSON when it ends,
+so a trace of a run that is stopped part way through can still be read.
+
+When opendap_cmr.tracer is set, opendap_cmr.trace_span() makes spans (it does
+nothing otherwise) and every CMR request made with cmr_get() is a span. s3_driver
+makes spans for each collection, time window, granule and granule stage:
+
+    opendap_cmr.tracer = cmr_trace.Tracer('logs/trace.jsonl')
+    with opendap_cmr.trace_span('download', url=url):
+        ...
+    opendap_cmr.tracer.close()
+
+Run this file to analyze a trace. It reports the time spent in each kind of span
+(count, total, p50, p95, p99 and max), the critical path (the chain of spans that
+determined how long the run took) and the slowest granules, with their stages:
+
+    ./cmr_trace.py logs/trace.jsonl -n 10
+"""
+import itertools
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+
+
+class Span:
+    """One timed piece of work. Use it as a context manager; see Tracer.span()."""
+    __slots__ = ('tracer', 'id', 'parent', 'name', 'attrs', 'start', '_began')
+
+    def __init__(self, tracer, span_id: int, parent: int, name: str, attrs: dict):
+        self.tracer = tracer
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self._began = 0.0
+
+    def set(self, **attrs):
+        """Add attributes to the span, e.g., the size of a file once it is downloaded."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.start = time.time()
+        self._began = time.perf_counter()
+        self.tracer._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self._began
+        self.tracer._pop(self)
+        if exc_type is not None:
+            self.attrs['error'] = f'{exc_type.__name__}: {exc_value}'
+        self.tracer._write(self, duration)
+        return False
+
+
+class Tracer:
+    """
+    Write spans to a JSONL file. One instance can be shared by many threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w')
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _push(self, span: Span):
+        self._stack().append(span)
+
+    def _pop(self, span: Span):
+        stack = self._stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def _write(self, span: Span, duration: float):
+        line = json.dumps({'id': span.id, 'parent': span.parent, 'name': span.name, 'start': round(span.start, 6),
+                           'duration': round(duration, 6), 'thread': threading.current_thread().name,
+                           'attrs': span.attrs}, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + '\n')
+
+    def current(self):
+        """The innermost span open on this thread, or None. Give it to work started on other threads."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def span(self, name: str, parent: Span = None, **attrs) -> Span:
+        """
+        Make a span. It starts when its 'with' block is entered and is written when the block ends.
+
+        :param name: The kind of work, e.g., 'download'. The analyzer groups spans by name.
+        :param parent: The parent span; by default, the innermost span open on this thread
+        :param attrs: Attributes to record with the span, e.g., url=...
+        :returns: The span
+        """
+        parent = parent or self.current()
+        return Span(self, next(self._ids), parent.id if parent else None, name, attrs)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def load(path: str) -> list:
+    """Read the spans in a trace file. Each is a dictionary with an added 'end'."""
+    spans = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                span['end'] = span['start'] + span['duration']
+                spans.append(span)
+    return spans
+
+
+def quantile(values: list, q: float) -> float:
+    """The nearest-rank quantile of a sorted list."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def stage_stats(spans: list) -> dict:
+    """
+    :returns: A dictionary like {name: (count, total, p50, p95, p99, max)} of the spans' durations
+    """
+    durations = defaultdict(list)
+    for span in spans:
+        durations[span['name']].append(span['duration'])
+    stats = {}
+    for name, values in durations.items():
+        values.sort()
+        stats[name] = (len(values), sum(values), quantile(values, 0.50), quantile(values, 0.95),
+                       quantile(values, 0.99), values[-1])
+    return stats
+
+
+def critical_path(spans: list) -> list:
+    """
+    Find the spans that determined when the run ended: starting from the root span
+    that ended last, the child that ended last, then the child that ended last
+    before that one started, and so on, for each span on the path.
+
+    :returns: A list of (depth, span) tuples in time order
+    """
+    ids = {span['id'] for span in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span['parent'] in ids:
+            children[span['parent']].append(span)
+        else:
+            roots.append(span)
+
+    def walk(span: dict, depth: int) -> list:
+        path = [(depth, span)]
+        chain = []
+        end = span['end']
+        for child in sorted(children[span['id']], key=lambda c: c['end'], reverse=True):
+            if child['end'] <= end + 1e-6:
+                chain.append(child)
+                end = child['start']
+        for child in reversed(chain):
+            path.extend(walk(child, depth + 1))
+        return path
+
+    if not roots:
+        return []
+    return walk(max(roots, key=lambda root: root['end']), 0)
+
+
+def slowest(spans: list, name='granule', n=10) -> list:
+    """
+    :returns: The n longest spans with the given name, longest first, as (span, {stage: seconds}) tuples
+        where the stages are the span's children
+    """
+    stages = defaultdict(dict)
+    for span in spans:
+        if span['parent'] is not None:
+            stage = stages[span['parent']]
+            stage[span['name']] = stage.get(span['name'], 0.0) + span['duration']
+    longest = sorted((span for span in spans if span['name'] == name), key=lambda s: s['duration'], reverse=True)
+    return [(span, stages.get(span['id'], {})) for span in longest[:n]]
+
+
+def describe(span: dict) -> str:
+    attrs = span['attrs']
+    label = (attrs.get('url') or attrs.get('ccid') or attrs.get('window') or attrs.get('provider')
+             or attrs.get('endpoint') or '')
+    return f'{span["name"]} {label}'.strip()
+
+
+def report(spans: list, top=10) -> str:
+    lines = [f'{len(spans)} spans', '',
+             f'{"stage":<28}{"count":>8}{"total":>10}{"p50":>9}{"p95":>9}{"p99":>9}{"max":>9}']
+    for name, (count, total, p50, p95, p99, longest) in sorted(stage_stats(spans).items(),
+                                                                key=lambda item: item[1][1], reverse=True):
+        lines.append(f'{name:<28}{count:>8}{total:>9.2f}s{p50:>8.3f}s{p95:>8.3f}s{p99:>8.3f}s{longest:>8.3f}s')
+
+    path = critical_path(spans)
+    if path:
+        lines += ['', 'Critical path:']
+        for depth, span in path[:top * 5]:
+            lines.append(f'{"  " * depth}{span["duration"]:8.3f}s  {describe(span)}')
+        if len(path) > top * 5:
+            lines.append(f'  ... {len(path) - top * 5} more')
+
+    granules = slowest(spans, n=top)
+    if granules:
+        lines += ['', 'Slowest granules:']
+        for span, stages in granules:
+            breakdown = ', '.join(f'{name} {seconds:.3f}s' for name, seconds in stages.items())
+            lines.append(f'{span["duration"]:8.3f}s  {describe(span)}  ({breakdown})')
+
+    return '\n'.join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Report the time spent in each stage of a traced run, its critical"
+                                                 " path and its slowest granules.")
+    parser.add_argument("trace", help="a JSONL trace file, e.g., logs/trace.jsonl")
+    parser.add_argument("-n", "--top", help="the number of slowest granules to list (default: 10)", type=int,
+                        default=10)
+    args = parser.parse_args()
+
+    print(report(load(args.trace), top=args.top))
+
+
+if __name__ == "__main__":
+    main()
@@ -39,6 +39,22 @@ def update_summary(data):
             f.close()
 
 
+def update_summary_months(months):
+    # months is {(year, month): granules}. As when each month was searched, write a table for each
+    # year from the first with data to this one, each with the running total
+    if not months:
+        return
+    total = 0
+    first_year = min(months)[0]
+    for year in range(first_year, max(max(months)[0], datetime.date.today().year) + 1):
+        outlist = []
+        for month in range(1, 13):
+            outlist.append((month, months.get((year, month), 0)))
+            total += months.get((year, month), 0)
+        outlist.append((year, total))
+        update_summary(outlist)
+
+
 def format_data(data):
     top = ""
     bottom = ""
@@ -61,33 +77,8 @@ def format_data(data):
 
 
 def convert_month(data):
-    month = ""
-    match data:
-        case 1:
-            month = "Jan"
-        case 2:
-            month = "Feb"
-        case 3:
-            month = "Mar"
-        case 4:
-            month = "Apr"
-        case 5:
-            month = "May"
-        case 6:
-            month = "Jun"
-        case 7:
-            month = "Jul"
-        case 8:
-            month = "Aug"
-        case 9:
-            month = "Sep"
-        case 10:
-            month = "Oct"
-        case 11:
-            month = "Nov"
-        case 12:
-            month = "Dec"
-    return month
+    months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+    return months[data - 1] if 1 <= data <= 12 else ""
 
 
 def format_cell(data):
@@ -8,7 +8,9 @@ on-premises systems.
 This looks for the first granule in each collection and determines if that
 URL is OPeNDAP-enabled. It does not look at any other granules in the collection.
 
-The results are written to CSV files named for each provider.
+The results are written to CSV files named for each provider. All the providers
+are searched at once, sharing one pool of threads (-w), and each provider's results
+are written as soon as its search is done.
 
 Example usages:
     ./find_collections.py -t -B -c POCLOUD      # use the brute-force method (-B), cloud only (-c) for POCLOUD
@@ -21,11 +23,66 @@ Example usages:
 import csv
 import sys
 import time
-import cmr
+import opendap_cmr as cmr
+import cmr_cache
+import cmr_cassette
+import cmr_flight
+import cmr_limiter
+import cmr_metrics
+import cmr_profile
 import errLog
 import argparse
 
 
+def report(provider: str, entries: dict, duration: float, args):
+    """
+    Print what was found for a provider and write it to the stats, cloud and site files.
+
+    :param provider: The provider
+    :param entries: The dictionary get_provider_opendap_collections_brutishly() returns
+    :param duration: The seconds the search took
+    :param args: The command line arguments
+    """
+    if args.verbose:
+        for key, value in entries.items():
+            print(f'{key}: {value}')
+
+    print(f'Total entries: {len(entries)}') if len(entries) > 1 else ""
+    print(f'Request time: {duration:.1f}s') if args.time else ""
+
+    # count all the True responses - collections with OPeNDAP cloud URLs. The value is a tuple (True, URL)
+    true_values = [value[1] for value in entries.values() if value[0] is True]
+    print(
+        f"Number of {provider} OPeNDAP-enabled cloud collections found: {len(true_values)}, out of {len(entries.keys())}")
+
+    # count all collections that don't have a cloud URL, but do claim to have OPeNDAP URLs. These
+    # are the on-premises servers. The value is the tuple (False, URL)
+    false_with_url_values = [value[1] for value in entries.values() if
+                             value[0] is False and len(value[1]) != 0]
+    print(f"Number of {provider} OPeNDAP-enabled non-cloud collections found: {len(false_with_url_values)}")
+
+    if args.stats:
+        with open(f"{args.stats}.csv", mode='a') as stats:
+            stats_writer = csv.writer(stats, delimiter=',')
+            # ['Provider', 'Collections (total)', 'Cloud URLs', 'Non-cloud URLs', 'Query time (s)']
+            stats_writer.writerow([provider, len(entries), len(true_values), len(false_with_url_values),
+                                   f"{duration:.1f}"])
+
+    if args.cloud:
+        with open(f"{provider}-cloud.csv", "w") as cloud:
+            cloud.write(f"OPeNDAP Cloud URLs\n")
+            for key, value in entries.items():
+                if value[0]:
+                    cloud.write(f"{key}, {value[1]}\n")
+
+    if args.site:
+        with open(f"{provider}-site.csv", "w") as site:
+            site.write(f"OPeNDAP on-premises URLs\n")
+            for key, value in entries.items():
+                if value[0] is False and len(value[1]) != 0:
+                    site.write(f"{key}, {value[1]}\n")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Find all the collections for a given provider that have OPeNDAP"
                                                  " URLs. Use a brute force query (look at the first granule of each"
@@ -34,7 +91,30 @@ def main():
     parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
     parser.add_argument("-P", "--pretty", help="request pretty responses from CMR", action="store_true")
     parser.add_argument("-t", "--time", help="time responses from CMR", action="store_true")
-
+    parser.add_argument("--cache", help="cache CMR responses in this SQLite file. Given without a file, use"
+                        " logs/cmr_cache.sqlite.", nargs="?", const="logs/cmr_cache.sqlite", default=None)
+    parser.add_argument("--revalidate", help="with --cache, ask CMR if expired responses have changed"
+                        " before getting them again.", action="store_true")
+    parser.add_argument("--metrics", help="record each request's latency, size and status and write them, at the"
+                        " end, to <METRICS>.prom (Prometheus text) and <METRICS>.json. Given without a name, use"
+                        " logs/metrics.", nargs="?", const="logs/metrics", default=None)
+    parser.add_argument("--record", help="record every request made and its response to this cassette file."
+                        " Given without a file, use logs/cassette.jsonl.gz.", nargs="?",
+                        const="logs/cassette.jsonl.gz", default=None)
+    parser.add_argument("--replay", help="answer every request with the response recorded for it in this cassette"
+                        " file, without the network. Given without a file, use logs/cassette.jsonl.gz.", nargs="?",
+                        const="logs/cassette.jsonl.gz", default=None)
+    parser.add_argument("--replay-timing", help="with --replay, wait this many times as long as each recorded request"
+                        " took (default: 0, answer right away). Given without a value, use 1, the recorded timings.",
+                        nargs="?", type=float, const=1.0, default=0.0)
+    parser.add_argument("--profile", help="profile the run with cProfile, writing a profile for each stage (listing,"
+                        " resolve, ...) to <PROFILE>-<stage>.prof, and print the functions that took the most time."
+                        " Given without a name, use logs/profile.", nargs="?", const="logs/profile", default=None)
+
+    parser.add_argument("-A", "--adaptive", help="adapt the number of requests made to CMR at once to how"
+                        " quickly it answers, up to the number of workers", action="store_true")
+    parser.add_argument("--single-flight", help="make identical CMR queries asked by different workers at the same"
+                        " time share one request", action="store_true")
     parser.add_argument("-B", "--opendap-brutishly", help="for a provider, show only collections with OPeNDAP URLS."
                                                           " Uses a brute-force search of the first URL for all collection.",
                         action="store_true")
@@ -46,6 +126,10 @@ def main():
                                              " have an OPeNDAP URL that points to an on-premises (on-site) server. When given, the CCID"
                                              " and URL will be stored to a file named <provider>-site.txt.",
                         action="store_true")
+    parser.add_argument("-w", "--workers", help="the number of threads shared by all the providers (default: 64)",
+                        type=int, default=64)
+    parser.add_argument("--service", help="the CMR to search (default: cmr.earthdata.nasa.gov)",
+                        default="cmr.earthdata.nasa.gov")
     parser.add_argument("-S", "--stats", help="write the information printed to stdout also to a"
                                         " file named <stats>.csv that can be easily used by a spreadsheet, pandas,"
                                         " et cetera.", type=str, default=None)
@@ -56,6 +140,24 @@ def main():
 
     # cmr.verbose = True if args.verbose else False
     pretty = True if args.pretty else False
+    if args.cache:
+        cmr.response_cache = cmr_cache.ResponseCache(args.cache, revalidate=args.revalidate)
+    if args.adaptive:
+        cmr.limiter = cmr_limiter.AIMDLimiter()
+    if args.single_flight:
+        cmr.flights = cmr_flight.SingleFlight()
+    if args.metrics:
+        cmr.metrics = cmr_metrics.Metrics()
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together")
+    if args.record:
+        cmr.cassette = cmr_cassette.Cassette(args.record, 'record')
+    elif args.replay:
+        cmr.cassette = cmr_cassette.Cassette(args.replay, 'replay', timing=args.replay_timing)
+    if args.profile:
+        cmr.profiler = cmr_profile.StageProfiler()
+        cmr.profiler.start()
+    cmr.set_pool_size(args.workers)
 
     if len(args.providers) == 0:
         print(f"At least one provider must be given.", file=sys.stderr, flush=True)
@@ -73,59 +175,41 @@ def main():
                 stats_writer.writerow(['Provider', 'Collections (total)', 'Cloud URLs', 'Non-cloud URLs',
                                        'Query time (s)'])
 
-        for provider in args.providers:
-            start = time.time()
-
-            if args.opendap_brutishly:
-                entries = cmr.get_provider_opendap_collections_brutishly(provider)
-            else:
-                entries = cmr.get_provider_opendap_collections_uum_s(provider)
-
-            duration = time.time() - start
-
-            if args.verbose:
-                for key, value in entries.items():
-                    print(f'{key}: {value}')
-
-            print(f'Total entries: {len(entries)}') if len(entries) > 1 else ""
-            print(f'Request time: {duration:.1f}s') if args.time else ""
-
-            # count all the True responses - collections with OPeNDAP cloud URLs. The value is a tuple (True, URL)
-            true_values = [value[1] for value in entries.values() if value[0] is True]
-            print(
-                f"Number of {provider} OPeNDAP-enabled cloud collections found: {len(true_values)}, out of {len(entries.keys())}")
-
-            # count all collections that don't have a cloud URL, but do claim to have OPeNDAP URLs. These
-            # are the on-premises servers. The value is the tuple (False, URL)
-            false_with_url_values = [value[1] for value in entries.values() if
-                                     value[0] is False and len(value[1]) != 0]
-            print(f"Number of {provider} OPeNDAP-enabled non-cloud collections found: {len(false_with_url_values)}")
-
-            if args.stats:
-                with open(f"{args.stats}.csv", mode='a') as stats:
-                    stats_writer = csv.writer(stats, delimiter=',')
-                    # ['Provider', 'Collections (total)', 'Cloud URLs', 'Non-cloud URLs', 'Query time (s)']
-                    stats_writer.writerow([provider, len(entries), len(true_values), len(false_with_url_values),
-                                           f"{duration:.1f}"])
-
-            if args.cloud:
-                with open(f"{provider}-cloud.csv", "w") as cloud:
-                    cloud.write(f"OPeNDAP Cloud URLs\n")
-                    for key, value in entries.items():
-                        if value[0]:
-                            cloud.write(f"{key}, {value[1]}\n")
-
-            if args.site:
-                with open(f"{provider}-site.csv", "w") as site:
-                    site.write(f"OPeNDAP on-premises URLs\n")
-                    for key, value in entries.items():
-                        if value[0] is False and len(value[1]) != 0:
-                            site.write(f"{key}, {value[1]}\n")
+        start = time.time()
+        results = cmr.iter_providers_opendap_collections(args.providers, brutishly=args.opendap_brutishly,
+                                                         workers=args.workers, service=args.service)
+        # The providers are searched at once; each is reported when its search is done
+        for provider, entries, duration, error in results:
+            if error is not None:
+                errLog.output_errlog("/////////////////////////////////////////////////////\n")
+                errLog.output_errlog(f"{type(error).__name__}: find_collections.py::main() - {provider}: {error}\n")
+                print(f"{provider}: {error}", file=sys.stderr, flush=True)
+                if len(entries) == 0:
+                    continue
+
+            report(provider, entries, duration, args)
+
+        print(f'Total time: {time.time() - start:.1f}s') if args.time and len(args.providers) > 1 else ""
+        print(cmr.limiter.summary()) if cmr.limiter and args.time else ""
+        print(cmr.pool_stats()) if args.time else ""
+        print(cmr.flights.summary()) if cmr.flights and args.time else ""
+        print(cmr.metrics.summary()) if cmr.metrics and args.time else ""
+        print(cmr.cassette.summary()) if cmr.cassette and args.time else ""
 
     except cmr.CMRException as e:
         errLog.output_errlog("/////////////////////////////////////////////////////\n")
         errLog.output_errlog(f"CMRException: find_collections.py::main() - {e.message}\n")
         print(e)
+    finally:
+        cmr.close_sessions()
+        if cmr.metrics:
+            cmr.metrics.write(args.metrics)
+        if cmr.cassette:
+            cmr.cassette.close()
+        if cmr.profiler:
+            cmr.profiler.stop()
+            print(f'Profiles: {", ".join(cmr.profiler.write(args.profile))}')
+            print(cmr.profiler.summary())
 
 
 if __name__ == "__main__":
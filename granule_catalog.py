@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+"""
+A local catalog of collections, granules and their Related URLs, stored in a
+SQLite database and kept up to date with CMR.
+
+The first sync() of a collection lists all of its granules. Later syncs ask CMR
+only for the granules with a revision date after the last sync (updated_since)
+and for the granules deleted since then, so keeping a large collection current
+costs a few requests.
+
+When opendap_cmr.catalog is set, get_related_urls() (and so decompose_resty_url()),
+get_related_urls_from_granule_id() and iter_collection_granule_urls() (and so
+s3_driver) answer from the catalog for the granules and collections it holds:
+
+    opendap_cmr.catalog = granule_catalog.GranuleCatalog('logs/catalog.sqlite')
+
+Example usage:
+    ./granule_catalog.py -v C2036877806-POCLOUD      # sync one collection
+    ./granule_catalog.py -R C2036877806-POCLOUD:20220902120000-REMSS-L4_GHRSST-SSTfnd-MW_OI-GLOB-v02.0-fv05.1
+"""
+import sqlite3
+import threading
+import time
+
+import opendap_cmr
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS collections (ccid TEXT PRIMARY KEY, last_sync TEXT);
+CREATE TABLE IF NOT EXISTS granules (concept_id TEXT PRIMARY KEY, ccid TEXT, native_id TEXT, start_time TEXT,
+                                     revision_id INTEGER, size REAL);
+CREATE TABLE IF NOT EXISTS urls (concept_id TEXT, position INTEGER, kind TEXT, type TEXT, subtype TEXT, url TEXT);
+CREATE INDEX IF NOT EXISTS granules_ccid ON granules (ccid);
+CREATE UNIQUE INDEX IF NOT EXISTS granules_ur ON granules (ccid, native_id);
+CREATE INDEX IF NOT EXISTS granules_start ON granules (ccid, start_time);
+CREATE INDEX IF NOT EXISTS urls_concept_id ON urls (concept_id);
+'''
+
+
+def url_kind(r_url: dict) -> str:
+    """
+    Classify a RelatedUrls entry as an 'opendap', 's3' or 'https' URL, or 'other'.
+    """
+    if r_url.get("Subtype") == 'OPENDAP DATA':
+        return 'opendap'
+    if r_url["URL"].startswith('s3://'):
+        return 's3'
+    if r_url["URL"].startswith('https://') or r_url["URL"].startswith('http://'):
+        return 'https'
+    return 'other'
+
+
+def granule_start_time(umm: dict) -> str:
+    """
+    The start time of a UMM-G granule record, or '' if it has none.
+    """
+    temporal = umm.get("TemporalExtent", {})
+    if "RangeDateTime" in temporal:
+        return temporal["RangeDateTime"].get("BeginningDateTime", '')
+    return temporal.get("SingleDateTime", '')
+
+
+def granule_end_time(umm: dict) -> str:
+    """
+    The end time of a UMM-G granule record. A granule with a SingleDateTime, or
+    without an EndingDateTime, ends when it starts.
+    """
+    temporal = umm.get("TemporalExtent", {})
+    if "RangeDateTime" in temporal:
+        return temporal["RangeDateTime"].get("EndingDateTime") or granule_start_time(umm)
+    return temporal.get("SingleDateTime", '')
+
+
+def granule_size(umm: dict) -> float:
+    """
+    The size of a UMM-G granule record, in bytes, or 0 if it is not given.
+    """
+    info = umm.get("DataGranule", {}).get("ArchiveAndDistributionInformation", [])
+    if len(info) == 0:
+        return 0
+    if "SizeInBytes" in info[0]:
+        return info[0]["SizeInBytes"]
+    units = {'KB': 2 ** 10, 'MB': 2 ** 20, 'GB': 2 ** 30, 'TB': 2 ** 40}
+    return info[0].get("Size", 0) * units.get(info[0].get("SizeUnit"), 1)
+
+
+def catalog_records(json_resp: dict) -> list:
+    """
+    Extract the catalog records from CMR JSON UMM.
+
+    This function processes the return information from a granules.umm_json request.
+    Do not use it for a granules.json request.
+
+    :param json_resp: CMR JSON UMM response
+    :returns: A list of (granule row, URL rows) tuples, ready for the granules and urls tables
+    :rtype: list
+    """
+    if "items" not in json_resp.keys():
+        return []
+
+    records = []
+    for item in json_resp["items"]:
+        if not opendap_cmr.is_meta_item(item):
+            continue
+        meta = item["meta"]
+        umm = item.get("umm", {})
+        concept_id = meta["concept-id"]
+        granule = (concept_id, meta["native-id"], granule_start_time(umm), meta.get("revision-id", 0),
+                   granule_size(umm))
+        urls = [(concept_id, position, url_kind(r_url), r_url["Type"], r_url.get("Subtype"), r_url["URL"])
+                for position, r_url in enumerate(umm.get("RelatedUrls", []))
+                if "Type" in r_url and "URL" in r_url]
+        records.append((granule, urls))
+
+    return records
+
+
+class GranuleCatalog:
+    """
+    A SQLite-backed catalog of granules. One instance can be shared by many threads.
+    """
+
+    def __init__(self, path='logs/catalog.sqlite', service='cmr.earthdata.nasa.gov'):
+        """
+        :param path: The SQLite database file
+        :param service: The CMR service used by sync()
+        """
+        self.path = path
+        self.service = service
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def has_collection(self, ccid: str) -> bool:
+        """Has this collection been synced?"""
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM collections WHERE ccid = ?', (ccid,)).fetchone() is not None
+
+    def last_sync(self, ccid: str) -> str:
+        """The time of the last sync of a collection as an ISO 8601 string, or '' if it has not been synced"""
+        with self._lock:
+            row = self._db.execute('SELECT last_sync FROM collections WHERE ccid = ?', (ccid,)).fetchone()
+        return row[0] if row else ''
+
+    def sync(self, ccid: str) -> tuple:
+        """
+        Bring a collection up to date with CMR. The first sync lists every granule,
+        later syncs get only the granules added, changed or deleted since the last one.
+
+        :param ccid: The collection concept ID
+        :returns: A tuple of the number of granules added or updated and the number deleted
+        """
+        since = self.last_sync(ccid)
+        # Use the time before asking CMR so that changes made during the sync are seen next time
+        now = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        base_url = opendap_cmr.service_url(self.service)
+
+        updated_since = f'&updated_since={since}' if since else ''
+        cmr_query_url = f'{base_url}/search/granules.umm_json?collection_concept_id={ccid}{updated_since}'
+        updated = 0
+        for json_resp in opendap_cmr.cmr_pages(cmr_query_url, opendap_cmr.get_session(), page_size=2000):
+            records = catalog_records(json_resp)
+            with self._lock, self._db:
+                for granule, urls in records:
+                    self._db.execute('DELETE FROM urls WHERE concept_id = ?', (granule[0],))
+                    self._db.execute('INSERT OR REPLACE INTO granules VALUES (?, ?, ?, ?, ?, ?)',
+                                     (granule[0], ccid) + granule[1:])
+                    self._db.executemany('INSERT INTO urls VALUES (?, ?, ?, ?, ?, ?)', urls)
+            updated += len(records)
+
+        deleted = 0
+        if since:
+            cmr_query_url = f'{base_url}/search/deleted-granules.json?parent_collection_id={ccid}&revision_date={since}'
+            concept_ids = [(granule["concept-id"],)
+                           for json_resp in opendap_cmr.cmr_pages(cmr_query_url, opendap_cmr.get_session(),
+                                                                  page_size=2000, fan_out=0)
+                           for granule in json_resp if "concept-id" in granule]
+            with self._lock, self._db:
+                self._db.executemany('DELETE FROM urls WHERE concept_id = ?', concept_ids)
+                self._db.executemany('DELETE FROM granules WHERE concept_id = ?', concept_ids)
+            deleted = len(concept_ids)
+
+        with self._lock, self._db:
+            self._db.execute('INSERT OR REPLACE INTO collections VALUES (?, ?)', (ccid, now))
+
+        print(f'{ccid}: {updated} added or updated, {deleted} deleted') if opendap_cmr.verbose else ''
+        return updated, deleted
+
+    def granule_ids(self, ccid: str, descending=False) -> list:
+        """The collection's granule IDs, ordered by start time"""
+        order = 'DESC' if descending else 'ASC'
+        with self._lock:
+            rows = self._db.execute(f'SELECT concept_id FROM granules WHERE ccid = ? ORDER BY start_time {order}, '
+                                    f'concept_id {order}', (ccid,)).fetchall()
+        return [row[0] for row in rows]
+
+    def granule_count(self, ccid: str) -> int:
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM granules WHERE ccid = ?', (ccid,)).fetchone()[0]
+
+    def urls(self, concept_id: str, kind='') -> list:
+        """
+        The URLs of a granule, in the order CMR lists them.
+
+        :param concept_id: The granule concept ID
+        :param kind: If given, only the 'opendap', 's3', 'https' or 'other' URLs
+        :returns: A list of URLs
+        """
+        kind_clause = ' AND kind = ?' if kind else ''
+        with self._lock:
+            rows = self._db.execute(f'SELECT url FROM urls WHERE concept_id = ?{kind_clause} ORDER BY position',
+                                    (concept_id, kind) if kind else (concept_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def data_urls(self, concept_id: str) -> dict:
+        """
+        The same URLs, in the same form, as opendap_cmr.granule_data_url_dict() returns.
+
+        :param concept_id: The granule concept ID
+        :returns: A dictionary of the URLs, indexed as 'URL1', ..., 'URLn.'
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT url FROM urls WHERE concept_id = ? AND subtype IS NULL"
+                                    " AND type IN ('GET DATA', 'USE SERVICE API', 'EXTENDED METADATA')"
+                                    " ORDER BY position", (concept_id,)).fetchall()
+        return {f'URL{i}': row[0] for i, row in enumerate(rows, start=1)}
+
+    def concept_id(self, ccid: str, granule_ur: str) -> str:
+        """The granule concept ID for a collection and granule UR, or '' if the catalog does not have it"""
+        with self._lock:
+            row = self._db.execute('SELECT concept_id FROM granules WHERE ccid = ? AND native_id = ?',
+                                   (ccid, granule_ur)).fetchone()
+        return row[0] if row else ''
+
+    def get_related_urls(self, ccid: str, granule_ur: str):
+        """
+        The local version of opendap_cmr.get_related_urls().
+
+        :returns: A dictionary of the URLs, or None if the catalog does not have the granule
+        """
+        concept_id = self.concept_id(ccid, granule_ur)
+        return self.data_urls(concept_id) if concept_id else None
+
+    def get_related_urls_from_granule_id(self, ccid: str, granule_id: str):
+        """
+        The local version of opendap_cmr.get_related_urls_from_granule_id().
+
+        :returns: A dictionary of the URLs, or None if the catalog does not have the granule
+        """
+        with self._lock:
+            row = self._db.execute('SELECT 1 FROM granules WHERE ccid = ? AND concept_id = ?',
+                                   (ccid, granule_id)).fetchone()
+        return self.data_urls(granule_id) if row else None
+
+    def iter_granule_urls(self, ccid: str, num=-1, descending=False):
+        """
+        The local version of opendap_cmr.iter_collection_granule_urls().
+
+        :returns: A generator of (granule ID, URLs) tuples
+        """
+        granule_ids = self.granule_ids(ccid, descending)
+        for granule_id in granule_ids if num < 0 else granule_ids[:num]:
+            yield granule_id, self.data_urls(granule_id)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Keep a local catalog of the granules and Related URLs of "
+                                                 "collections up to date with CMR.")
+    parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true")
+    parser.add_argument("-t", "--time", help="time the sync", action="store_true")
+    parser.add_argument("-d", "--database", help="the catalog file (default: logs/catalog.sqlite)",
+                        default="logs/catalog.sqlite")
+    parser.add_argument("-R", "--collection-and-title", help="print the data URLs for 'CCID:title' from the catalog")
+    parser.add_argument("ccids", nargs="*", help="collections to sync")
+    args = parser.parse_args()
+
+    opendap_cmr.verbose = args.verbose
+    catalog = GranuleCatalog(args.database)
+    try:
+        start = time.time()
+        for ccid in args.ccids:
+            updated, deleted = catalog.sync(ccid)
+            print(f'{ccid}: {updated} added or updated, {deleted} deleted, '
+                  f'{catalog.granule_count(ccid)} granules') if not args.verbose else ''
+        print(f'Sync time: {time.time() - start:.1f}s') if args.time else ''
+
+        if args.collection_and_title:
+            collection, title = args.collection_and_title.split(':')
+            print(catalog.get_related_urls(collection, title))
+
+    except opendap_cmr.CMRException as e:
+        print(e)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""
+A compact container for the granule records that the response processors build.
+
+collection_granules_dict() and granule_ur_dict_2() return a dict that maps each
+granule's concept id to a tuple of strings. At a few hundred bytes a granule
+(the key, the tuple, its strings and the dict's slot), a provider's millions of
+granules take gigabytes. A GranuleStore holds the same records in columns:
+
+    - The concept id 'G2081588885-POCLOUD' is split into the prefix 'G', the
+      number 2081588885 and the suffix '-POCLOUD.' The number is stored in an
+      integer array and the prefix and suffix are interned, so a key costs
+      eight bytes;
+    - Each field is a column of UTF-8 bytes with an array of offsets. The start
+      that the other fields have in common with the first (e.g., a producer
+      granule id that is the title plus '.nc') is stored as a length;
+    - In fields whose name includes 'url,' the part of the URL up to the last
+      '/' is stored once and shared by every URL with that prefix;
+    - Keys are found using an open-addressing hash table held in an array.
+
+It is a MutableMapping, so code written for the dicts (items(), len(), 'in',
+store[key][0], ==) works with it. Looking up a key returns a GranuleRecord, a
+view of one record that behaves like the tuple the dict would hold.
+
+    store = GranuleStore(('title', 'producer_granule_id'))
+    store['G2081588885-POCLOUD'] = ('ascat_20121029_010001', 'ascat_20121029_010001.nc')
+    store['G2081588885-POCLOUD'].title
+"""
+import os
+import re
+from array import array
+from collections.abc import MutableMapping, Sequence
+
+KEY_PATTERN = re.compile(r'([A-Za-z]*)([1-9][0-9]{0,12})(-.*)')
+FORM_BITS = 20      # The low bits of a key hold its form (prefix and suffix); the rest hold its number
+DELETED = 0xFF      # The width of a deleted record
+EMPTY = -1          # An unused slot in the hash table
+
+
+class StringColumn:
+    """
+    A column of strings stored as UTF-8 bytes in one buffer. When 'shared' is true,
+    the part of each value that it has in common with the start of a base value (the
+    record's first field) is stored as a length.
+    """
+
+    def __init__(self, shared=False):
+        self._data = bytearray()
+        self._start = array('Q')
+        self._length = array('I')
+        self._shared = array('B') if shared else None
+
+    def _encode(self, value: str, base: str) -> bytes:
+        if self._shared is None:
+            return value.encode()
+        shared = len(base) if value.startswith(base) else len(os.path.commonprefix((value, base)))
+        shared = min(shared, 255)
+        self._shared.append(shared)
+        return value[shared:].encode()
+
+    def append(self, value: str, base=''):
+        encoded = self._encode(value, base)
+        self._start.append(len(self._data))
+        self._length.append(len(encoded))
+        self._data += encoded
+
+    def set(self, i: int, value: str, base=''):
+        """Replace a value. The old bytes are left in the buffer."""
+        encoded = self._encode(value, base)
+        if self._shared is not None:
+            self._shared[i] = self._shared.pop()
+        self._start[i] = len(self._data)
+        self._length[i] = len(encoded)
+        self._data += encoded
+
+    def get(self, i: int, base='') -> str:
+        start = self._start[i]
+        value = self._data[start:start + self._length[i]].decode()
+        return value if self._shared is None else base[:self._shared[i]] + value
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self._data) + self._start.itemsize * len(self._start)
+                + self._length.itemsize * len(self._length) + len(self._shared or b''))
+
+
+class URLColumn:
+    """
+    A column of URLs that stores each URL's directory (the part up to the last '/')
+    once. The rest of the URL is stored in a StringColumn.
+    """
+
+    def __init__(self, shared=False):
+        self._prefixes = []
+        self._prefix_ids = {}
+        self._prefix = array('I')
+        self._rest = StringColumn(shared)
+
+    def append(self, value: str, base=''):
+        prefix, rest = self._split(value)
+        self._prefix.append(prefix)
+        self._rest.append(rest, base)
+
+    def set(self, i: int, value: str, base=''):
+        prefix, rest = self._split(value)
+        self._prefix[i] = prefix
+        self._rest.set(i, rest, base)
+
+    def _split(self, value: str) -> tuple:
+        """:returns: The id of the interned prefix (None for a value without a '/') and the rest of the value"""
+        prefix, slash, rest = value.rpartition('/')
+        return self._intern(prefix if slash else None), rest
+
+    def _intern(self, prefix) -> int:
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+        return prefix_id
+
+    def get(self, i: int, base='') -> str:
+        rest = self._rest.get(i, base)
+        prefix = self._prefixes[self._prefix[i]]
+        return rest if prefix is None else f'{prefix}/{rest}'
+
+    @property
+    def nbytes(self) -> int:
+        return (self._rest.nbytes + self._prefix.itemsize * len(self._prefix)
+                + sum(len(p or '') for p in self._prefixes))
+
+
+class GranuleRecord(Sequence):
+    """
+    A view of one record in a GranuleStore. It compares, hashes and prints like
+    the tuple of its values, and its fields can be read by name.
+    """
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index: int):
+        self._store = store
+        self._index = index
+
+    def __len__(self):
+        return self._store._width[self._index]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self)[i]
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('GranuleRecord index out of range')
+        return self._store._get(self._index, i)
+
+    def __getattr__(self, name: str):
+        fields = self._store.fields
+        if name in fields and fields.index(name) < len(self):
+            return self[fields.index(name)]
+        raise AttributeError(name)
+
+    @property
+    def concept_id(self) -> str:
+        return self._store._key_str(self._store._keys[self._index])
+
+    def __eq__(self, other):
+        if isinstance(other, (tuple, GranuleRecord)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+
+class GranuleStore(MutableMapping):
+    """
+    A mapping of granule concept ids to records of string fields, stored in columns.
+    """
+
+    def __init__(self, fields=('title', 'producer_granule_id'), records=None):
+        """
+        :param fields: The names of the fields of each record. A record can have fewer
+            values than there are fields (e.g., a granule without a producer_granule_id),
+            but not more.
+        :param records: A mapping or iterable of (key, value) pairs to add
+        """
+        self.fields = tuple(fields)
+        self._columns = [(URLColumn if 'url' in name else StringColumn)(shared=i > 0)
+                         for i, name in enumerate(self.fields)]
+        self._forms = []
+        self._form_ids = {}
+        self._keys = array('Q')
+        self._width = array('B')
+        self._table = array('q', [EMPTY]) * 8
+        self._len = 0
+        if records is not None:
+            self.update(records)
+
+    def _form(self, form: tuple) -> int:
+        form_id = self._form_ids.get(form)
+        if form_id is None:
+            if len(self._forms) >= 1 << FORM_BITS:
+                raise ValueError('Too many distinct concept id prefixes and suffixes')
+            form_id = self._form_ids[form] = len(self._forms)
+            self._forms.append(form)
+        return form_id
+
+    def _key_int(self, key: str) -> int:
+        """Encode a concept id as an int. Ids that do not look like 'G1234-PROVIDER' are interned whole."""
+        m = KEY_PATTERN.fullmatch(key)
+        if m:
+            return int(m.group(2)) << FORM_BITS | self._form((m.group(1), m.group(3)))
+        return self._form((key, None))
+
+    def _key_str(self, key_int: int) -> str:
+        prefix, suffix = self._forms[key_int & ((1 << FORM_BITS) - 1)]
+        return prefix if suffix is None else f'{prefix}{key_int >> FORM_BITS}{suffix}'
+
+    def _slot(self, key_int: int) -> int:
+        """Find the slot in the hash table that holds key_int, or the empty slot where it would go."""
+        mask = len(self._table) - 1
+        # Fibonacci hashing spreads keys that differ only in their high bits
+        slot = (key_int * 0x9E3779B97F4A7C15 & 0xFFFFFFFFFFFFFFFF) >> (64 - mask.bit_length())
+        while True:
+            index = self._table[slot]
+            if index == EMPTY or self._keys[index] == key_int:
+                return slot
+            slot = (slot + 1) & mask
+
+    def _find(self, key) -> int:
+        """:returns: The index of the record for key, or -1"""
+        if not isinstance(key, str):
+            return -1
+        m = KEY_PATTERN.fullmatch(key)
+        if m:
+            form_id = self._form_ids.get((m.group(1), m.group(3)))
+            key_int = int(m.group(2)) << FORM_BITS | form_id if form_id is not None else None
+        else:
+            key_int = self._form_ids.get((key, None))
+        if key_int is None:
+            return -1
+        index = self._table[self._slot(key_int)]
+        return index if index != EMPTY and self._width[index] != DELETED else -1
+
+    def _grow(self):
+        self._table = array('q', [EMPTY]) * (len(self._table) * 2)
+        for index, key_int in enumerate(self._keys):
+            if self._width[index] != DELETED:
+                self._table[self._slot(key_int)] = index
+
+    def __setitem__(self, key: str, value):
+        if not isinstance(value, (tuple, GranuleRecord)):
+            raise TypeError(f'GranuleStore values must be tuples, not {type(value).__name__}')
+        if len(value) > len(self.fields):
+            raise ValueError(f'GranuleStore records have at most {len(self.fields)} fields ({value})')
+
+        key_int = self._key_int(key)
+        slot = self._slot(key_int)
+        index = self._table[slot]
+        if index != EMPTY and self._width[index] != DELETED:
+            # Replace the record in place, so the key keeps its position, as with a dict
+            base = value[0] if value else ''
+            for i, column in enumerate(self._columns):
+                column.set(index, value[i] if i < len(value) else '', base)
+            self._width[index] = len(value)
+            return
+
+        index = len(self._keys)
+        self._keys.append(key_int)
+        self._width.append(len(value))
+        base = value[0] if value else ''
+        for i, column in enumerate(self._columns):
+            column.append(value[i] if i < len(value) else '', base)
+        self._table[slot] = index
+        self._len += 1
+        if len(self._keys) * 2 > len(self._table):
+            self._grow()
+
+    def __getitem__(self, key: str) -> GranuleRecord:
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        return GranuleRecord(self, index)
+
+    def __delitem__(self, key: str):
+        index = self._find(key)
+        if index < 0:
+            raise KeyError(key)
+        self._width[index] = DELETED
+        self._len -= 1
+
+    def __contains__(self, key) -> bool:
+        return self._find(key) >= 0
+
+    def __iter__(self):
+        for index, key_int in enumerate(self._keys):
+            if self._width[index] != DELETED:
+                yield self._key_str(key_int)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self):
+        return f'GranuleStore({dict(self.items())!r})'
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, GranuleStore):
+            # Copy the records without looking up each key in the other store
+            other = ((other._key_str(key_int), tuple(other.record(index)))
+                     for index, key_int in enumerate(other._keys) if other._width[index] != DELETED)
+        super().update(other, **kwargs)
+
+    def _get(self, index: int, field: int) -> str:
+        """:returns: The value of a field of the index-th record"""
+        if field == 0:
+            return self._columns[0].get(index)
+        return self._columns[field].get(index, self._columns[0].get(index))
+
+    def record(self, index: int) -> GranuleRecord:
+        """:returns: The view of the index-th record added to the store"""
+        return GranuleRecord(self, index)
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate size of the store's arrays and buffers, in bytes"""
+        return (sum(column.nbytes for column in self._columns)
+                + self._keys.itemsize * len(self._keys) + len(self._width)
+                + self._table.itemsize * len(self._table)
+                + sum(len(prefix) + len(suffix or '') for prefix, suffix in self._forms))
@@ -2,12 +2,34 @@
 Access information about data in NASA's EarthData Cloud system using the
 CMR Web API.
 """
+import cmr_http
+import cmr_limiter
+import cmr_metrics
 import errLog
+import granule_store
 # from typing import Dict, Any, Set
 
+import contextlib
+import datetime
+import email.utils
+import inspect
+import json
+import pickle
+import queue
+import random
+import re
 import requests
 import threading
+import time
+import weakref
+from collections.abc import Mapping
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 """
@@ -27,6 +49,27 @@ class CMRException(Exception):
         return f'CMR Exception HTTP status: {self.status} - {self.message}'
 
 
+class CMRIncompleteResult(CMRException):
+    """
+    When some pages of a response could not be read, even after retrying them.
+    'missing' lists the missing pages as (first, last) page number ranges; a last page
+    of -1 means 'to the end' when the number of pages is not known. process_request()
+    and process_request_list() set 'partial' to the results they did get.
+    """
+
+    def __init__(self, cmr_query_url: str, missing: list, page_size: int, cause: Exception):
+        ranges = ', '.join(f'{first}-{last if last > 0 else "end"}' if first != last else f'{first}'
+                           for first, last in missing)
+        super().__init__(getattr(cause, 'status', 0),
+                         f'Incomplete result, missing pages {ranges} (page size {page_size}) of {cmr_query_url}:'
+                         f' {cause}')
+        self.cmr_query_url = cmr_query_url
+        self.missing = missing
+        self.page_size = page_size
+        self.cause = cause
+        self.partial = None
+
+
 """
 These are the response processors used by 'process_response()'. They extract
 various things from the JSON and return a dictionary.
@@ -110,6 +153,28 @@ def collection_granules_dict(json_resp: dict) -> dict:
     return dict_resp
 
 
+def collection_granules_store(json_resp: dict) -> granule_store.GranuleStore:
+    """
+    Like collection_granules_dict(), but the granules are held in a compact
+    GranuleStore. Use this for collections with many granules.
+
+    :param json_resp: CMR JSON response
+    :return: A GranuleStore with the Granule id indexing the granule title and the producer granule id
+    :rtype: granule_store.GranuleStore
+    """
+    store = granule_store.GranuleStore(('title', 'producer_granule_id'))
+    if not is_entry_feed(json_resp):
+        return store
+
+    for entry in json_resp["feed"]["entry"]:
+        if "producer_granule_id" in entry:
+            store[entry["id"]] = (entry["title"], entry["producer_granule_id"])
+        else:
+            store[entry["id"]] = (entry["title"],)
+
+    return store
+
+
 def collection_granule_and_url_dict(json_resp: dict) -> dict:
     """
     This function processes the return information from a granules.json request.
@@ -221,6 +286,34 @@ def granule_data_url_dict(json_resp: dict) -> dict:
     return dict_resp
 
 
+def granule_data_urls_by_id(json_resp: dict) -> dict:
+    """
+    Extract the Related URLs of every granule in a CMR JSON UMM response. This
+    is granule_data_url_dict() applied to each granule, so the same URLs are
+    included.
+
+    This function processes the return information from a granules.umm_json request.
+    Do not use it for a granules.json request.
+
+    :param json_resp: CMR JSON UMM response
+    :returns: A dictionary indexed by granule concept ID. Each value is the dictionary
+        granule_data_url_dict() returns for that granule. The dictionaries look like:
+        {'G2081588885-POCLOUD': {'URL1': 's3://podaac/metopb_00588_eps_o_250_2101_ovw.l2.nc',
+                                 'URL2': 'https://archive/250_2101_ovw.l2.nc'}}
+    :rtype: dict
+    """
+    if "items" not in json_resp.keys():
+        return {}
+
+    dict_resp = {}
+    for item in json_resp["items"]:
+        if not is_meta_item(item):
+            continue
+        dict_resp[item["meta"]["concept-id"]] = granule_data_url_dict({"items": [item]})
+
+    return dict_resp
+
+
 def granule_json(json_resp: dict) -> dict:
     """
     This is an identity response for a granules.umm_json request.
@@ -310,6 +403,49 @@ def granule_ur_dict_2(json_resp: dict) -> dict:
     return dict_resp
 
 
+def granule_time_dict(json_resp: dict) -> dict:
+    """
+    Extract the temporal extent of the granules in a granules.umm_json response.
+    Do not use it for a granules.json request.
+
+    :param json_resp: CMR JSON UMM response
+    :returns: A dictionary like {ID : (Beginning, Ending)} where ID is the granule
+        concept ID and Beginning and Ending are the date/time strings from the
+        granule's TemporalExtent. A granule with a SingleDateTime, or without an
+        EndingDateTime, ends when it begins. Granules with no TemporalExtent are left out.
+    :rtype: dict
+    """
+    if "items" not in json_resp.keys():
+        return {}
+
+    dict_resp = {}
+    for item in json_resp["items"]:
+        if not (is_meta_item(item) and is_granule_item(item)) or "concept-id" not in item["meta"].keys():
+            continue
+        temporal = item["umm"].get("TemporalExtent", {})
+        if "RangeDateTime" in temporal:
+            beginning = temporal["RangeDateTime"].get("BeginningDateTime", '')
+            ending = temporal["RangeDateTime"].get("EndingDateTime") or beginning
+        else:
+            beginning = ending = temporal.get("SingleDateTime", '')
+        if beginning:
+            dict_resp[item["meta"]["concept-id"]] = (beginning, ending)
+
+    return dict_resp
+
+
+def granule_ur_store(json_resp: dict) -> granule_store.GranuleStore:
+    """
+    Like granule_ur_dict_2(), but the granules are held in a compact GranuleStore,
+    which stores the OPeNDAP URLs' common prefixes once.
+
+    :param json_resp: CMR JSON UMM response
+    :returns: A GranuleStore with the granule concept ID indexing the native id and OPeNDAP URL
+    :rtype: granule_store.GranuleStore
+    """
+    return granule_store.GranuleStore(('native_id', 'url'), granule_ur_dict_2(json_resp))
+
+
 def merge_dict(dict1: dict, dict2: dict) -> dict:
     """
     Merge dictionaries, preserve key order
@@ -321,7 +457,7 @@ def merge_dict(dict1: dict, dict2: dict) -> dict:
     :rtype: dict
     """
     # silently bail
-    if not (type(dict1) is dict and type(dict2) is dict):
+    if not (type(dict1) in (dict, granule_store.GranuleStore) and type(dict2) in (dict, granule_store.GranuleStore)):
         raise TypeError("Both arguments to cmr.merge() must be dictionaries.")
 
     # If there is nothing in dict1, return dict2.
@@ -348,8 +484,614 @@ def convert(a: list) -> dict:
     return res_dct
 
 
+def service_url(service: str) -> str:
+    """
+    Build the base URL for a CMR service. The 'service' parameters used throughout
+    this module are host names (e.g., cmr.earthdata.nasa.gov) that are accessed
+    using https. A complete base URL (e.g., http://localhost:3003) is used as is,
+    which makes it possible to point these functions at a local CMR stand-in.
+
+    :param service: A host name or a base URL
+    :returns: The base URL, without a trailing slash
+    """
+    return service.rstrip('/') if '://' in service else f'https://{service}'
+
+
+def count_entries(json_resp: dict) -> int:
+    """
+    How many entries are in this page of a CMR response? The 'feed' key is used
+    by the json response and 'items' is used by the umm_json responses. The
+    deleted-granules search returns a list.
+
+    :param json_resp: CMR JSON response
+    :returns: The number of entries in the page
+    :raises CMRException: If the response is neither kind of CMR response
+    """
+    if isinstance(json_resp, list):  # deleted-granules.json
+        return len(json_resp)
+    if "feed" in json_resp and "entry" in json_resp["feed"]:  # 'feed' is for the json response
+        return len(json_resp["feed"]["entry"])
+    elif "items" in json_resp:  # 'items' is for json_umm
+        return len(json_resp["items"])
+    else:
+        raise CMRException(200, "cmr.process_request does not know how to decode the response")
+
+
+"""
+A cmr_cache.ResponseCache. When set, get_page() answers requests from the cache
+when it can. None by default; ask_cmr.py, find_collections.py and s3_driver.py
+set it with --cache.
+"""
+response_cache = None
+
+"""
+A granule_catalog.GranuleCatalog. When set, the Related URLs of the granules it
+holds are read from it instead of CMR. None by default; ask_cmr.py and
+s3_driver.py set it with --catalog.
+"""
+catalog = None
+
+"""
+A cmr_limiter.AIMDLimiter. When set, it limits the number of requests made to CMR
+at the same time, by all threads. None (no limit) by default; ask_cmr.py and
+find_collections.py set it with --adaptive.
+"""
+limiter = None
+
+"""
+A cmr_metrics.Metrics. When set, each request cmr_get() makes and each retry
+get_page() makes is recorded. None by default; ask_cmr.py, find_collections.py
+and s3_driver.py set it with --metrics.
+"""
+metrics = None
+
+"""
+A cmr_trace.Tracer. When set, trace_span() makes spans and each request cmr_get()
+makes is one. None (no tracing) by default; s3_driver.py sets it with --trace.
+"""
+tracer = None
+
+"""
+A cmr_cassette.Cassette. When set, the requests made with the sessions get_session()
+makes are recorded to it or played back from it. None by default. It must be set
+before the first request, since the sessions are made with it; the command line
+tools set it with --record or --replay.
+"""
+cassette = None
+
+
+"""
+A cmr_profile.StageProfiler. When set, trace_span() also profiles the work done in
+the spans that are stages (listing, resolve, download, ...) in that stage's profile.
+None by default; the command line tools set it with --profile.
+"""
+profiler = None
+
+
+@contextlib.contextmanager
+def profiled_span(stage, span):
+    """Profile a span in a stage; see trace_span()."""
+    with stage, span as entered:
+        yield entered
+
+
+def trace_span(name: str, parent=None, **attrs):
+    """
+    A span of the tracer, if there is one; otherwise a context that does nothing.
+    See cmr_trace.Tracer.span(). When there is a profiler, the span's work is also
+    profiled in its stage; see cmr_profile.StageProfiler.stage().
+
+    :returns: A context manager
+    """
+    span = tracer.span(name, parent, **attrs) if tracer is not None else contextlib.nullcontext()
+    if profiler is not None:
+        return profiled_span(profiler.stage(name), span)
+    return span
+
+
+def trace_parent():
+    """
+    The innermost trace span open on this thread, or None. Give it to trace_span()
+    on worker threads so their spans nest under it.
+    """
+    return tracer.current() if tracer is not None else None
+
+
+def cmr_get(session: object, url: str, headers=None) -> requests.Response:
+    """
+    Make a request to CMR, waiting for the limiter, if there is one, and record
+    it in the metrics and the trace, if they are kept.
+
+    :param session: A requests package session object
+    :param url: The whole URL, query params and all
+    :param headers: Request headers, if any
+    :returns: The requests.Response
+    """
+    if tracer is not None:
+        with tracer.span('cmr', endpoint=cmr_metrics.endpoint(url)) as span:
+            r = limited_get(session, url, headers)
+            span.set(status=r.status_code)
+            return r
+    return limited_get(session, url, headers)
+
+
+def limited_get(session: object, url: str, headers=None) -> requests.Response:
+    """
+    Make a request to CMR with measured_get(), waiting for the limiter, if there is one.
+
+    :param session: A requests package session object
+    :param url: The whole URL, query params and all
+    :param headers: Request headers, if any
+    :returns: The requests.Response
+    """
+    if limiter is None:
+        return measured_get(session, url, headers)
+
+    start = limiter.acquire()
+    throttled = True
+    try:
+        r = measured_get(session, url, headers)
+        throttled = r.status_code in cmr_limiter.THROTTLE_STATUS
+        return r
+    finally:
+        limiter.release(start, throttled, cmr_limiter.request_kind(url))
+
+
+def measured_get(session: object, url: str, headers=None) -> requests.Response:
+    """
+    Make a request to CMR and record it in the metrics, if they are kept. The time
+    waiting for the limiter is not part of the latency recorded.
+    """
+    if metrics is None:
+        return session.get(url, headers=headers)
+
+    start = time.monotonic()
+    status = 0
+    try:
+        r = session.get(url, headers=headers)
+        status = r.status_code
+        return r
+    finally:
+        metrics.record(cmr_metrics.endpoint(url), status, time.monotonic() - start,
+                       len(r.content) if status else 0)
+
+
+"""
+Only revalidate pages of at least this many results. Revalidating a query costs up to
+two hits-only queries, which saves nothing over getting a small page (for example,
+the page_size=1 lookups) again.
+"""
+REVALIDATE_MIN_PAGE_SIZE = 100
+
+
+def response_unchanged(cmr_query_url: str, session: object, cached) -> bool:
+    """
+    Ask CMR if the results of a cached response could have changed since it was
+    fetched. Two hits-only queries are used: are there results with a revision
+    date after the response was fetched, and is the total number of results the
+    same (which catches deletions)? The answer is saved in the response cache, so
+    the other pages of the query are not revalidated again. Small pages are not
+    revalidated at all; see REVALIDATE_MIN_PAGE_SIZE.
+
+    :param cmr_query_url: The whole URL for the page, query params and all
+    :param session: A requests package session object
+    :param cached: The cmr_cache.CachedResponse
+    :returns: True if the cached response can be used
+    """
+    page_size = re.search(r'[?&]page_size=(\d+)', cmr_query_url)
+    if (int(page_size.group(1)) if page_size else 10) < REVALIDATE_MIN_PAGE_SIZE:  # CMR's default is 10
+        return False
+
+    query_url = re.sub(r'&page_(num|size)=\d+', '', cmr_query_url)
+    unchanged = response_cache.verdict(query_url, cached.fetched)
+    if unchanged is not None:
+        return unchanged
+
+    updated_since = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(cached.fetched))
+    r = cmr_get(session, f'{query_url}&updated_since={updated_since}&page_size=0')
+    unchanged = r.status_code == 200 and r.headers.get('CMR-Hits') == '0'
+    if unchanged and 'CMR-Hits' in cached.headers:
+        r = cmr_get(session, f'{query_url}&page_size=0')
+        unchanged = r.status_code == 200 and r.headers.get('CMR-Hits') == cached.headers['CMR-Hits']
+    response_cache.remember_verdict(query_url, cached.fetched, unchanged)
+    return unchanged
+
+
+"""
+Retry a page up to 'max_retries' times when CMR throttles the request, has a server
+error, the connection fails or the response is cut short. The first retry waits about
+'retry_backoff' seconds, each one after that about twice as long as the one before
+(with random jitter so that many threads do not retry at the same time) unless CMR
+sends a Retry-After header. By default, a page is tried five times in all; set
+'max_retries' to 0 to never retry.
+"""
+max_retries: int = 4
+retry_backoff: float = 0.5
+
+RETRY_MAX_DELAY = 60
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_EXCEPTIONS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError, json.JSONDecodeError)
+
+
+def retry_delay(attempt: int, retry_after=None) -> float:
+    """
+    How long to wait before retrying a request.
+
+    :param attempt: The number of retries already made
+    :param retry_after: The value of the response's Retry-After header, if any. This can
+        be a number of seconds or an HTTP date.
+    :returns: The delay in seconds
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                when = email.utils.parsedate_to_datetime(retry_after)
+                delay = (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                delay = None
+        if delay is not None:
+            return min(max(delay, 0), RETRY_MAX_DELAY)
+
+    return random.uniform(0, min(RETRY_MAX_DELAY, retry_backoff * 2 ** attempt))
+
+
+def is_transient(e: Exception) -> bool:
+    """Is this an error that retrying the request might fix?"""
+    return isinstance(e, RETRY_EXCEPTIONS) or (isinstance(e, CMRException) and e.status in RETRY_STATUS)
+
+
+def error_message(r: requests.Response) -> str:
+    """The error message in a CMR error response, or the start of the response if there is none"""
+    try:
+        # JSON returned on error: {'errors': ['Collection-concept-id [ECCO Ocean ...']}
+        return r.json()["errors"][0]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return r.text[:200] if r.text else r.reason
+
+
+"""
+The function used to decode CMR responses. It is passed the body of a response,
+as bytes. The default is orjson.loads when orjson is installed and json.loads
+when it is not.
+"""
+json_decoder: callable = orjson.loads if orjson is not None else json.loads
+
+
+def get_page(cmr_query_url: str, session: object, search_after: str = '', decoder: callable = None) -> tuple:
+    """
+    Get one page of a CMR response. This is the only place the paging functions
+    make an HTTP request.
+
+    :param cmr_query_url: The whole URL for the page, query params and all
+    :param session: A requests package session object
+    :param search_after: If given, the value of the CMR-Search-After header from the previous page
+    :param decoder: Decode the body of the response with this function instead of
+        'json_decoder.' A body it cannot decode is retried like a failed connection.
+    :returns: A tuple of the decoded JSON and the response headers
+    :raises CMRException: If CMR returns an error
+    :raises requests.exceptions.RequestException: If the connection fails, after the retries
+    """
+    if response_cache is not None:
+        cached = response_cache.get(cmr_query_url, search_after)
+        if cached is not None and not cached.fresh and response_cache.revalidate \
+                and response_unchanged(cmr_query_url, session, cached):
+            response_cache.refresh(cached)
+            cached.fresh = True
+        if cached is not None and cached.fresh:
+            return (decoder or json_decoder)(cached.body), cached.headers
+
+    # By default, requests uses cookies, supports OAuth2 and reads username and password
+    # from a ~/.netrc file.
+    headers = {'CMR-Search-After': search_after} if search_after else None
+    for attempt in range(max_retries + 1):
+        try:
+            r = cmr_get(session, cmr_query_url, headers)
+            if r.status_code == 200:
+                json_resp = (decoder or json_decoder)(r.content)
+        except RETRY_EXCEPTIONS:
+            if attempt == max_retries:
+                raise
+            if metrics is not None:
+                metrics.retry(cmr_metrics.endpoint(cmr_query_url))
+            time.sleep(retry_delay(attempt))
+            continue
+
+        print("-", end="", flush=True) if verbose else ''
+        if verbose > 0:
+            print(f'CMR Query URL: {cmr_query_url}')
+            print(f'Status code: {r.status_code}')
+
+        if r.status_code == 200:
+            break
+        if r.status_code not in RETRY_STATUS or attempt == max_retries:
+            raise CMRException(r.status_code, error_message(r))
+        if metrics is not None:
+            metrics.retry(cmr_metrics.endpoint(cmr_query_url))
+        time.sleep(retry_delay(attempt, r.headers.get('Retry-After')))
+
+    if response_cache is not None:
+        response_cache.put(cmr_query_url, search_after, r.content, r.headers)
+    return json_resp, r.headers
+
+
+"""
+Use the CMR-Search-After header to walk through the pages of a response. Set this
+to False to use only the page_num parameter.
+"""
+use_search_after: bool = True
+
+"""
+When greater than zero, read the number of hits from the first page of a response
+and get the remaining pages using this many concurrent requests. The default, 0,
+gets the pages one at a time; ask_cmr.py and s3_driver.py set it with --fan-out.
+"""
+page_fan_out: int = 0
+
+CMR_MAX_PAGE_SIZE = 2000
+CMR_MAX_PAGING_DEPTH = 1000000  # CMR refuses page_num requests deeper than this
+
+
+"""
+A concurrent.futures.ProcessPoolExecutor. When set, process_request() and
+process_request_list() decode and process the pages of at least 'offload_bytes'
+in the pool's processes, where the work does not hold this process's GIL. Only
+response processors that are module-level functions can be used this way. None
+(decode in this process) by default; ask_cmr.py sets it with --decode-processes.
+"""
+decode_pool = None
+offload_bytes: int = 1024 * 1024
+
+
+def decode_and_process(body: bytes, response_processor: callable) -> tuple:
+    """
+    Decode a page and process it. This runs in the decode_pool's processes for large pages.
+
+    :param body: The body of the response
+    :param response_processor: A function that will process the decoded json response
+    :returns: A tuple of the number of entries in the page and the processed page, which
+        is None if the page has no entries
+    """
+    json_resp = json_decoder(body)
+    entries_num = count_entries(json_resp)
+    return entries_num, response_processor(json_resp) if entries_num > 0 else None
+
+
+def page_processor(response_processor: callable) -> callable:
+    """
+    Make the function cmr_pages() uses to decode and process each page. Large pages
+    are sent to the decode_pool, if there is one.
+
+    :param response_processor: A function that will process the decoded json response
+    :returns: A function that takes the body of a response and returns what decode_and_process() does
+    """
+    pool = decode_pool
+    if pool is not None:
+        try:
+            pickle.dumps(response_processor)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            pool = None  # e.g., a lambda; it can only run in this process
+
+    def process(body: bytes) -> tuple:
+        if pool is not None and len(body) >= offload_bytes:
+            return pool.submit(decode_and_process, body, response_processor).result()
+        return decode_and_process(body, response_processor)
+
+    return process
+
+
+def fetch_page(cmr_query_url: str, session: object, search_after: str = '', processor: callable = None) -> tuple:
+    """
+    Get a page with get_page() and, if a processor is given, decode and process it.
+
+    :param cmr_query_url: The whole URL for the page, query params and all
+    :param session: A requests package session object
+    :param search_after: If given, the value of the CMR-Search-After header from the previous page
+    :param processor: A function made by page_processor(). If not given, the page is decoded
+    :returns: A tuple of the number of entries in the page, the decoded JSON (or the processed
+        page) and the response headers
+    """
+    if processor is None:
+        json_resp, headers = get_page(cmr_query_url, session, search_after)
+        return count_entries(json_resp), json_resp, headers
+
+    (entries_num, page), headers = get_page(cmr_query_url, session, search_after, decoder=processor)
+    return entries_num, page, headers
+
+
+def page_ranges(pages: list) -> list:
+    """
+    Collapse a sorted list of page numbers into (first, last) ranges, e.g., [2, 3, 4, 7] -> [(2, 4), (7, 7)]
+    """
+    ranges = []
+    for page in pages:
+        if ranges and ranges[-1][1] == page - 1:
+            ranges[-1] = (ranges[-1][0], page)
+        else:
+            ranges.append((page, page))
+    return ranges
+
+
+def page_blocks(start: int, end: int, page_size: int) -> list:
+    """
+    Split the entries from 'start' to 'end' into pages that CMR can return using
+    page_num. Each page is a whole number of 'page_size' pages and starts at a
+    multiple of its own size, so the pages grow, up to CMR's largest page size,
+    as the offset grows; the last page may go past 'end' by less than 'page_size.'
+
+    :param start: The offset of the first entry; a multiple of 'page_size'
+    :param end: The offset just past the last entry wanted
+    :param page_size: The page size of the first page
+    :returns: A list of (page_num, page_size) tuples
+    """
+    blocks = []
+    offset = start
+    while offset < end:
+        pages = max(min(CMR_MAX_PAGE_SIZE, end - offset + page_size - 1) // page_size, 1)
+        while offset % (pages * page_size) != 0:
+            pages -= 1
+        size = pages * page_size
+        blocks.append((offset // size + 1, size))
+        offset += size
+    return blocks
+
+
+def get_pages_concurrently(cmr_query_url: str, blocks: list, page_size: int, fan_out: int, processor=None):
+    """
+    A generator that yields the given pages of a CMR response, in order, while
+    'fan_out' threads request them. A page that cannot be read does not stop the
+    others; once they are all yielded, CMRIncompleteResult lists the missing pages.
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param blocks: The pages to get, as (page_num, page_size) tuples made by page_blocks()
+    :param page_size: The page size the missing pages are listed in; each block is a multiple of it
+    :param fan_out: Use this many threads
+    :param processor: If given, a function made by page_processor(); see fetch_page()
+    :returns: A generator of the decoded JSON (or processed) pages
+    :raises CMRIncompleteResult: If some pages could not be read
+    """
+    def get_json(block: tuple):
+        try:
+            return fetch_page(f'{cmr_query_url}&page_num={block[0]}&page_size={block[1]}', get_session(),
+                              processor=processor)[1]
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            return e
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=fan_out) as executor:
+        for (page, size), json_resp in zip(blocks, executor.map(get_json, blocks)):
+            if isinstance(json_resp, Exception):
+                pages = size // page_size
+                failed.extend((n, json_resp) for n in range((page - 1) * pages + 1, page * pages + 1))
+            else:
+                yield json_resp
+
+    if failed:
+        raise CMRIncompleteResult(cmr_query_url, page_ranges([page for page, _ in failed]), page_size, failed[-1][1])
+
+
+def cmr_pages(cmr_query_url: str, session: object, page_size=10, page_num=0, num_responses=-1, fan_out=-1,
+              processor=None):
+    """
+    A generator that yields the pages of a CMR response, as decoded JSON.
+
+    The first page is requested using page_num. When CMR includes the CMR-Search-After
+    header in a response, the next page is requested by sending that value back instead
+    of a page_num. Search-after requests cost the same at any depth, while CMR
+    has to skip over all the earlier results for a page_num request and refuses
+    page_num requests deeper than one million results. If CMR does not send the
+    header, page_num is incremented.
+
+    If 'fan_out' is greater than zero, the first page is requested using 'page_size' and
+    the remaining pages are requested concurrently, using the CMR-Hits header of the
+    first page and 'num_responses' to know how many entries there are to get. Those
+    pages grow from 'page_size' up to the largest page size CMR allows (see
+    page_blocks()). The pages are still yielded in order. Results deeper than CMR's
+    page_num limit, or a response without the CMR-Hits header, fall back to the
+    one-page-at-a-time walk.
+
+    Either way, the last page may hold up to 'page_size' - 1 entries past 'num_responses';
+    the callers drop them.
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param session: A requests package session object
+    :param page_size: The number of entries per page from CMR
+    :param page_num: Return only this page of the query response. If not given, gets all the pages
+    :param num_responses: Stop once this many entries have been returned. If not given, gets all the pages
+    :param fan_out: Get the pages using this many concurrent requests. If not given, use 'page_fan_out.'
+    :param processor: If given, a function made by page_processor(), and the pages are yielded
+        processed. Empty pages are yielded as None.
+    :returns: A generator of the decoded JSON pages
+    :raises CMRIncompleteResult: If some pages could not be read, even after retrying them
+    """
+    if page_num != 0:
+        try:
+            _, json_resp, _ = fetch_page(f'{cmr_query_url}&page_num={page_num}&page_size={page_size}', session,
+                                         processor=processor)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            raise CMRIncompleteResult(cmr_query_url, [(page_num, page_num)], page_size, e) from e
+        yield json_resp
+        return
+
+    fan_out = page_fan_out if fan_out < 0 else fan_out
+
+    page = 1
+    try:
+        entries_num, json_resp, headers = fetch_page(f'{cmr_query_url}&page_num={page}&page_size={page_size}',
+                                                     session, processor=processor)
+    except Exception as e:
+        if not is_transient(e):
+            raise
+        raise CMRIncompleteResult(cmr_query_url, [(1, -1)], page_size, e) from e
+    entries = entries_num
+    yield json_resp
+
+    hits = int(headers.get('CMR-Hits', -1))
+    wanted = hits if num_responses < 0 else min(hits, num_responses)
+    last_page = (wanted + page_size - 1) // page_size if hits > -1 and page_size > 0 else -1
+    if fan_out > 0 and 0 < page_size and -1 < wanted <= CMR_MAX_PAGING_DEPTH:
+        yield from get_pages_concurrently(cmr_query_url, page_blocks(entries, wanted, page_size), page_size,
+                                          fan_out, processor)
+        return
+
+    while 0 < page_size <= entries_num and not (-1 < num_responses <= entries):
+        page += 1
+        search_after = headers.get('CMR-Search-After', '') if use_search_after else ''
+        try:
+            if search_after:
+                entries_num, json_resp, headers = fetch_page(f'{cmr_query_url}&page_size={page_size}', session,
+                                                             search_after, processor)
+            else:
+                entries_num, json_resp, headers = fetch_page(f'{cmr_query_url}&page_num={page}&page_size={page_size}',
+                                                             session, processor=processor)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            # Without this page, the pages after it cannot be found (search-after) or trusted
+            raise CMRIncompleteResult(cmr_query_url, [(page, max(last_page, page) if last_page > 0 else -1)],
+                                      page_size, e) from e
+
+        entries += entries_num
+        yield json_resp
+
+
+"""
+A cmr_flight.SingleFlight. When set, concurrent calls to process_request() or
+process_request_list() for the same query share one request. None (off) by
+default; ask_cmr.py and find_collections.py set it with --single-flight.
+"""
+flights = None
+
+
+def single_flight(function: callable) -> callable:
+    """
+    Decorate a function whose arguments are a CMR query, a response processor and a
+    session so that, when 'flights' is set, concurrent calls with the same arguments
+    (other than the session) share one call.
+    """
+    signature = inspect.signature(function)
+
+    @wraps(function)
+    def share(*args, **kwargs):
+        if flights is None:
+            return function(*args, **kwargs)
+        bound = signature.bind(*args, **kwargs)
+        bound.apply_defaults()
+        key = (function.__name__,) + tuple(value for name, value in bound.arguments.items() if name != 'session')
+        return flights.do(key, lambda: function(*args, **kwargs))
+
+    return share
+
+
 # TODO Make a 'returns a set' version of this to avoid the 'function with two
 #  return types' confusion. jhrg 7/6/24
+@single_flight
 def process_request(cmr_query_url: str, response_processor: callable(dict), session: object, page_size=10,
                     page_num=0) -> dict:
     """
@@ -365,51 +1107,23 @@ def process_request(cmr_query_url: str, response_processor: callable(dict), sess
     :returns: A dictionary of entries
     :rtype: dict or set
     """
-    page = 1 if page_num == 0 else page_num
     entries_dict = {}
     entries_set = set()
     try:
-        while True:
-            # By default, requests uses cookies, supports OAuth2 and reads username and password
-            # from a ~/.netrc file.
-            r = session.get(f'{cmr_query_url}&page_num={page}&page_size={page_size}')
-            page += 1  # if page_num was explicitly set, this is not needed
-
-            print("-", end="", flush=True) if verbose else ''
-            if verbose > 0:
-                print(f'CMR Query URL: {cmr_query_url}')
-                print(f'Status code: {r.status_code}')
-
-            if r.status_code != 200:
-                # JSON returned on error: {'errors': ['Collection-concept-id [ECCO Ocean ...']}
-                raise CMRException(r.status_code, r.json()["errors"][0])
-
-            json_resp = r.json()
-            if "feed" in json_resp and "entry" in json_resp["feed"]:  # 'feed' is for the json response
-                entries_num = len(json_resp["feed"]["entry"])
-            elif "items" in json_resp:  # 'items' is for json_umm
-                entries_num = len(json_resp["items"])
-            else:
-                raise CMRException(200, "cmr.process_request does not know how to decode the response")
-
-            if entries_num > 0:
-                entries_page = response_processor(json_resp)  # The response_processor() is passed in
-                if type(entries_page) is dict:
-                    entries_dict = merge_dict(entries_dict, entries_page)  # merge is smart if entries is empty
-                elif type(entries_page) is set:
-                    entries_set.update(entries_page)
-
-            if page_num != 0 or entries_num < page_size:
-                break
-
-    except requests.exceptions.ConnectionError:
+        # The response_processor() is passed in; cmr_pages() uses it on each page
+        for entries_page in cmr_pages(cmr_query_url, session, page_size, page_num,
+                                      processor=page_processor(response_processor)):
+            if type(entries_page) in (dict, granule_store.GranuleStore):
+                entries_dict = merge_dict(entries_dict, entries_page)  # merge is smart if entries is empty
+            elif type(entries_page) is set:
+                entries_set.update(entries_page)
+
+    except CMRIncompleteResult as e:
         err = "/////////////////////////////////////////////////////\n"
-        err += "ConnectionError : cmr.py::process_request() - " + cmr_query_url + "\n"
-        errLog.output_errlog(err)
-    except requests.exceptions.JSONDecodeError:
-        err = "/////////////////////////////////////////////////////\n"
-        err += "JSONDecodeError : cmr.py::process_request() - " + cmr_query_url + "\n"
+        err += "CMRIncompleteResult : opendap_cmr.py::process_request() - " + e.message + "\n"
         errLog.output_errlog(err)
+        e.partial = entries_set if len(entries_set) > 0 else entries_dict
+        raise
 
     if len(entries_dict) > 0:
         return entries_dict
@@ -419,6 +1133,7 @@ def process_request(cmr_query_url: str, response_processor: callable(dict), sess
         return {}
 
 
+@single_flight
 def process_request_list(cmr_query_url: str, response_processor: callable(list), session: object,
                          num_responses = -1, page_size=10, page_num=0) -> list:
     """
@@ -439,70 +1154,198 @@ def process_request_list(cmr_query_url: str, response_processor: callable(list),
     :returns: A dictionary of entries
     :rtype: list
     """
-    # Ensure that if the caller wants a specific page, that page is returned.
-    # OOtherwise, get all the pages.
-    page = 1 if page_num == 0 else page_num
     # Ensure that if the caller wants fewer responses than the page size, only
     # that number of responses is retrieved
     if num_responses > -1 and page_size > num_responses:
         page_size = num_responses
 
     entries = []
+    try:
+        # The response_processor() is passed in; cmr_pages() uses it on each page
+        for entries_page in cmr_pages(cmr_query_url, session, page_size, page_num, num_responses,
+                                      processor=page_processor(response_processor)):
+            if entries_page is not None:
+                entries.extend(entries_page)
+
+    except CMRIncompleteResult as e:
+        err = "/////////////////////////////////////////////////////\n"
+        err += "CMRIncompleteResult : opendap_cmr.py::process_request_list() - " + e.message + "\n"
+        errLog.output_errlog(err)
+        e.partial = entries
+        raise
+
+    # The last page may hold more entries than were asked for
+    return entries[:num_responses] if num_responses > -1 else entries
+
+
+def prefetch(make_iterable: callable, depth=1):
+    """
+    A generator that yields the items of an iterable while a background thread
+    gets the next 'depth' items. The iterable is made, by calling make_iterable(),
+    on the background thread so that it can use that thread's session. If the
+    background thread raises an exception, it is raised here.
+
+    :param make_iterable: A function that returns the iterable
+    :param depth: How many items the background thread may get ahead
+    :returns: A generator of the items
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            iterator = iter(make_iterable())
+            while not stop.is_set():
+                item = next(iterator, done)
+                if not put((item, None)) or item is done:
+                    return
+        except BaseException as e:
+            put((done, e))
+
+    threading.Thread(target=produce, daemon=True).start()
     try:
         while True:
-            # By default, requests uses cookies, supports OAuth2 and reads username and password
-            # from a ~/.netrc file.
-            r = session.get(f'{cmr_query_url}&page_num={page}&page_size={page_size}')
-            page += 1  # if page_num was explicitly set, this is not needed
-
-            print("-", end="", flush=True) if verbose else ''
-            if verbose > 0:
-                print(f'CMR Query URL: {cmr_query_url}')
-                print(f'Status code: {r.status_code}')
-
-            if r.status_code != 200:
-                # JSON returned on error: {'errors': ['Collection-concept-id [ECCO Ocean ...']}
-                raise CMRException(r.status_code, r.json()["errors"][0])
-
-            json_resp = r.json()
-            if "feed" in json_resp and "entry" in json_resp["feed"]:  # 'feed' is for the json response
-                entries_num = len(json_resp["feed"]["entry"])
-            elif "items" in json_resp:  # 'items' is for json_umm
-                entries_num = len(json_resp["items"])
-            else:
-                raise CMRException(200, "cmr.process_request does not know how to decode the response")
+            item, error = items.get()
+            if error:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()  # The background thread quits after its current item if this generator is abandoned
+
 
-            if entries_num > 0:
-                entries_page = response_processor(json_resp)  # The response_processor() is passed in
-                entries = entries + entries_page
+def iter_request(cmr_query_url: str, response_processor: callable(dict), num_responses=-1, page_size=10):
+    """
+    Query CMR and yield the results one at a time. This is the streaming version
+    of process_request_list(): the next page of the response is requested while
+    the results from the current page are being used, and only a couple of pages
+    are held in memory no matter how large the response is.
 
-            if page_num != 0 or entries_num < page_size or (num_responses > -1 and len(entries) >= num_responses):
-                break
+    :param cmr_query_url: The whole URL, query params and all.
+    :param response_processor: A function that will process the returned json response returning
+    results in a list or a mapping (a dictionary or a GranuleStore). For a mapping, the (key, value)
+    pairs are yielded.
+    :param num_responses: The number of responses to get. If not given, gets all the responses.
+    :param page_size: The number of entries per page from CMR. The default is the CMR default value.
+    :returns: A generator of the results
+    """
+    if num_responses > -1 and page_size > num_responses:
+        page_size = num_responses
 
-    except requests.exceptions.ConnectionError:
-        err = "/////////////////////////////////////////////////////\n"
-        err += "ConnectionError : cmr.py::process_request() - " + cmr_query_url + "\n"
-        errLog.output_errlog(err)
-    except requests.exceptions.JSONDecodeError:
-        err = "/////////////////////////////////////////////////////\n"
-        err += "JSONDecodeError : cmr.py::process_request() - " + cmr_query_url + "\n"
-        errLog.output_errlog(err)
+    results = 0
+    for json_resp in prefetch(lambda: cmr_pages(cmr_query_url, get_session(), page_size,
+                                                num_responses=num_responses)):
+        if count_entries(json_resp) > 0:
+            entries_page = response_processor(json_resp)  # The response_processor() is passed in
+            items = entries_page.items() if isinstance(entries_page, Mapping) else entries_page
+            if num_responses > -1:
+                items = list(items)[:num_responses - results]  # The last page may hold more than were asked for
+            yield from items
+            results += len(items)
+            if -1 < num_responses <= results:
+                return
+
+
+def get_hits(cmr_query_url: str, session: object) -> int:
+    """
+    Ask CMR how many results a query has without getting any of them.
+
+    :param cmr_query_url: The whole URL, query params and all
+    :param session: A requests package session object
+    :returns: The value of the CMR-Hits header, or -1 if CMR did not send it
+    """
+    _, headers = get_page(f'{cmr_query_url}&page_size=0', session)
+    return int(headers.get('CMR-Hits', -1))
 
-    return entries
 
+"""
+The most connections kept open to CMR, shared by all threads. Requests beyond
+this wait for a connection. The default, 64, is the number of threads
+get_provider_opendap_collections_brutishly() uses. The command line tools set
+it, using set_pool_size(), to the number of threads they make requests from.
+"""
+pool_size: int = 64
 
 """ Used to ensure that each thread has its own session for the HTTP Requests package """
 thread_local = threading.local()
+session_lock = threading.Lock()
+http_adapter = None
+sessions = weakref.WeakSet()  # A thread's session goes away with the thread
+
+
+def set_pool_size(threads: int):
+    """
+    Size the connection pools for this many threads making requests at once, or, when
+    'limiter' is set and its ceiling is lower, for that many. Call this after the limiter
+    is set and before the first request; the pools are made then.
+
+    :param threads: The most threads that make requests at the same time
+    """
+    global pool_size
+    pool_size = max(1, min(threads, limiter.maximum) if limiter is not None else threads)
+
+
+def get_adapter() -> cmr_http.PooledAdapter:
+    """
+    Get the connection pools that all the sessions share, making them if needed.
+    When there is a cassette, its adapter records (or plays back) the requests.
+    """
+    global http_adapter
+    with session_lock:
+        if http_adapter is None:
+            http_adapter = cmr_http.PooledAdapter(pool_size=pool_size)
+            if cassette is not None:
+                http_adapter = cassette.adapter(http_adapter)
+        return http_adapter
 
 
 def get_session() -> object:
     """
     With 'thread_local' above, get a new session object for each thread. Reuse session
-    for existing threads. The Requests Session object is not multi-thread safe.
+    for existing threads. The Requests Session object is not multi-thread safe, but the
+    connection pools are, so all the sessions share them (see cmr_http).
     """
-    if not hasattr(thread_local, "session"):
-        thread_local.session = requests.Session()
-    return thread_local.session
+    adapter = get_adapter()
+    session = getattr(thread_local, "session", None)
+    if session is None or session.get_adapter('https://') is not adapter:
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        thread_local.session = session
+        with session_lock:
+            sessions.add(session)
+    return session
+
+
+def pool_stats() -> cmr_http.PoolStats:
+    """The statistics of the shared connection pools: connections opened, reused and waited for"""
+    return get_adapter().stats
+
+
+def close_sessions():
+    """
+    Close all the sessions and their connections. The next call to get_session(), from
+    any thread, makes a new session (and new pools, sized using 'pool_size').
+    """
+    global http_adapter
+    with session_lock:
+        for session in list(sessions):
+            session.close()
+        sessions.clear()
+        if http_adapter is not None:
+            http_adapter.close()
+        http_adapter = None
 
 
 def get_collection_granules_umm_first_last(ccid: str, json_processor=granule_ur_dict_2, pretty=False,
@@ -521,7 +1364,7 @@ def get_collection_granules_umm_first_last(ccid: str, json_processor=granule_ur_
     pretty = '&pretty=true' if pretty else ''
 
     # by default, CMR returns results with "sort_key = +start_date" returning the oldest granule
-    cmr_query_url = f'https://{service}/search/granules.umm_json_v1_4?collection_concept_id={ccid}{pretty}'
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json_v1_4?collection_concept_id={ccid}{pretty}'
     oldest_dict = process_request(cmr_query_url, json_processor, get_session(), page_size=1, page_num=1)
 
     # Use "-start-date" to get the newest granule
@@ -556,7 +1399,7 @@ def get_provider_collections(provider: str, opendap=False, pretty=False, service
     """
     pretty = '&pretty=true' if pretty else ''
     opendap = '&has_opendap_url=true' if opendap else ''
-    cmr_query_url = f'https://{service}/search/collections.json?provider={provider}{opendap}{pretty}'
+    cmr_query_url = f'{service_url(service)}/search/collections.json?provider={provider}{opendap}{pretty}'
     return process_request(cmr_query_url, provider_collections_dict, get_session(), page_size=500)
 
 
@@ -576,8 +1419,9 @@ def collection_has_opendap(ccid: str, cloud_prefix="https://opendap.earthdata.na
     :return: A tuple of (ccid, True|False) - True if an OPeNDAP is present
     """
     # by default, CMR returns results with "sort_key = +start_date" returning the oldest granule
-    cmr_query_url = f'https://{service}/search/granules.umm_json_v1_4?collection_concept_id={ccid}'
-    oldest_dict = process_request(cmr_query_url, json_processor, get_session(), page_size=1, page_num=1)
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json_v1_4?collection_concept_id={ccid}'
+    with trace_span('resolve', ccid=ccid):
+        oldest_dict = process_request(cmr_query_url, json_processor, get_session(), page_size=1, page_num=1)
 
     if len(oldest_dict) != 1:
         return ccid, False, ""    # Empty URL if there is none.
@@ -606,17 +1450,20 @@ def get_provider_opendap_collections_brutishly(provider: str, workers=64, servic
 
     :param provider: The string ID for a given EDC provider (e.g., ORNL_CLOUD)
     :param workers: Use this many threads when asking CMR about granules. I set this at 64 by trial and error.
+        When opendap_cmr.limiter is set, this is the most requests that can be made at once and the
+        limiter decides how many are.
     :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
     :returns: A dictionary
     """
-    cmr_query_url = f'https://{service}/search/collections.json?provider={provider}'
-    all_collections = process_request(cmr_query_url, provider_collections_dict, get_session(), page_size=500)
+    cmr_query_url = f'{service_url(service)}/search/collections.json?provider={provider}'
+    with trace_span('listing', provider=provider):
+        all_collections = process_request(cmr_query_url, provider_collections_dict, get_session(), page_size=500)
 
     ccids = list(all_collections.keys())
 
     with ThreadPoolExecutor(max_workers=workers) as executor:
         # Use 'partial' to curry collection_has_opendap() if using optional parameters. jhrg 6/30/24
-        results = executor.map(collection_has_opendap, ccids)
+        results = executor.map(partial(collection_has_opendap, service=service), ccids)
 
     ccids_opendap = {key: (value2, value3) for key, value2, value3 in results}
 
@@ -633,26 +1480,112 @@ def get_provider_opendap_collections_uum_s(provider: str, workers=64, service='c
 
     :param provider: The string ID for a given EDC provider (e.g., ORNL_CLOUD)
     :param workers: Use this many threads when asking CMR about granules. I set this at 64 by trial and error.
+        When opendap_cmr.limiter is set, this is the most requests that can be made at once and the
+        limiter decides how many are.
     :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
     :returns: A dictionary
     """
 
     opendap = '&has_opendap_url=true'
 
-    cmr_query_url = f'https://{service}/search/collections.json?provider={provider}{opendap}'
-    umm_s_collections = process_request(cmr_query_url, provider_collections_dict, get_session(), page_size=500)
+    cmr_query_url = f'{service_url(service)}/search/collections.json?provider={provider}{opendap}'
+    with trace_span('listing', provider=provider):
+        umm_s_collections = process_request(cmr_query_url, provider_collections_dict, get_session(), page_size=500)
 
     ccids = list(umm_s_collections.keys())
 
     with ThreadPoolExecutor(max_workers=workers) as executor:
         # Use 'partial' to curry collection_has_opendap() if using optional parameters. jhrg 6/30/24
-        results = executor.map(collection_has_opendap, ccids)
+        results = executor.map(partial(collection_has_opendap, service=service), ccids)
 
     ccids_opendap = {key: (value2, value3) for key, value2, value3 in results}
 
     return ccids_opendap
 
 
+def iter_providers_opendap_collections(providers: list, brutishly=True, workers=64,
+                                       service='cmr.earthdata.nasa.gov'):
+    """
+    Find the collections with OPeNDAP URLs for many providers at once.
+
+    This does what get_provider_opendap_collections_brutishly() (or, if brutishly is
+    false, get_provider_opendap_collections_uum_s()) does for each provider, but all the
+    providers share one pool of threads. The collection listings of all the providers are
+    requested first; as each listing arrives, a check of each of its collections is added
+    to the pool's queue. Every thread takes the next check from that queue, whichever
+    provider it is for, so a provider with thousands of collections (e.g., POCLOUD) is
+    worked on by all the threads once the small providers are done, and no thread sits
+    idle while there is work left.
+
+    The results for a provider are yielded as soon as its last collection is checked.
+
+    :param providers: The string IDs of the providers
+    :param brutishly: If true, check every collection; else, only the collections with
+        OPeNDAP UMM-S records
+    :param workers: Use this many threads in all. When opendap_cmr.limiter is set, this
+        is the most requests that can be made at once and the limiter decides how many are.
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A generator of (provider, entries, seconds, error) tuples, where entries is
+        the dictionary get_provider_opendap_collections_brutishly() returns and error is
+        None or the exception that stopped the provider's search. If a collection check
+        fails, the entries hold the collections that were checked.
+    """
+    opendap = '' if brutishly else '&has_opendap_url=true'
+    check = partial(collection_has_opendap, service=service)
+    done = queue.Queue()
+    start = {}
+    ccids = {}      # provider: its collections, in the order CMR listed them
+    entries = {}    # provider: {ccid: (cloud, url)}
+    errors = {}
+    remaining = {}  # provider: the checks not yet done
+    outstanding = 0
+
+    def list_collections(provider: str) -> list:
+        cmr_query_url = f'{service_url(service)}/search/collections.json?provider={provider}{opendap}'
+        with trace_span('listing', provider=provider):
+            return list(process_request(cmr_query_url, provider_collections_dict, get_session(),
+                                        page_size=500).keys())
+
+    def submit(task: str, provider: str, function, arg):
+        future = executor.submit(function, arg)
+        future.add_done_callback(lambda f: done.put((task, provider, f)))
+
+    def finished(provider: str) -> tuple:
+        result = {ccid: entries[provider][ccid] for ccid in ccids.get(provider, []) if ccid in entries[provider]}
+        return provider, result, time.time() - start[provider], errors.get(provider)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for provider in dict.fromkeys(providers):
+            start[provider] = time.time()
+            entries[provider] = {}
+            submit('list', provider, list_collections, provider)
+            outstanding += 1
+
+        while outstanding > 0:
+            task, provider, future = done.get()
+            outstanding -= 1
+            if task == 'list':
+                if future.exception() is not None:
+                    errors[provider] = future.exception()
+                    yield finished(provider)
+                    continue
+                ccids[provider] = future.result()
+                remaining[provider] = len(ccids[provider])
+                for ccid in ccids[provider]:
+                    submit('check', provider, check, ccid)
+                outstanding += remaining[provider]
+            else:
+                if future.exception() is not None:
+                    errors.setdefault(provider, future.exception())
+                else:
+                    ccid, cloud, url = future.result()
+                    entries[provider][ccid] = (cloud, url)
+                remaining[provider] -= 1
+
+            if remaining[provider] == 0:
+                yield finished(provider)
+
+
 def get_collection_entry(ccid: str, pretty=False, count=False, service='cmr.earthdata.nasa.gov') -> dict:
     """
     Get the collection entry given a concept id.
@@ -665,7 +1598,7 @@ def get_collection_entry(ccid: str, pretty=False, count=False, service='cmr.eart
     """
     pretty = '&pretty=true' if pretty else ''
     collection_count = '&include_granule_counts=true' if count else ''
-    cmr_query_url = f'https://{service}/search/collections.json?concept_id={ccid}{collection_count}{pretty}'
+    cmr_query_url = f'{service_url(service)}/search/collections.json?concept_id={ccid}{collection_count}{pretty}'
     return process_request(cmr_query_url, provider_collections_dict, get_session(), page_num=1)
 
 
@@ -678,8 +1611,13 @@ def get_related_urls(ccid: str, granule_ur: str, pretty=False, service='cmr.eart
 
     :returns: A dictionary that holds all the RelatedUrls that have Type 'GET DATA' or 'USE SERVICE DATA.'
     """
+    if catalog is not None:
+        urls = catalog.get_related_urls(ccid, granule_ur)
+        if urls is not None:
+            return urls
+
     pretty = '&pretty=true' if pretty else ''
-    cmr_query_url = f'https://{service}/search/granules.umm_json_v1_4?collection_concept_id={ccid}&granule_ur={granule_ur}{pretty}'
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json_v1_4?collection_concept_id={ccid}&granule_ur={granule_ur}{pretty}'
     return process_request(cmr_query_url, granule_data_url_dict, get_session(), page_num=1)
 
 
@@ -693,11 +1631,12 @@ def get_cmr_json(ccid: str, granule_ur: str, pretty=False, service='cmr.earthdat
     :returns: The CMR JSON object
     """
     pretty = '&pretty=true' if pretty else ''
-    cmr_query_url = f'https://{service}/search/granules.umm_json_v1_4?collection_concept_id={ccid}&granule_ur={granule_ur}{pretty}'
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json_v1_4?collection_concept_id={ccid}&granule_ur={granule_ur}{pretty}'
     return process_request(cmr_query_url, granule_json, get_session(), page_num=1)
 
 
-def get_collection_granules(ccid: str, pretty=False, service='cmr.earthdata.nasa.gov', descending=False) -> dict:
+def get_collection_granules(ccid: str, pretty=False, service='cmr.earthdata.nasa.gov', descending=False,
+                            compact=False) -> dict:
     """
     Get granules for a collection
 
@@ -705,12 +1644,14 @@ def get_collection_granules(ccid: str, pretty=False, service='cmr.earthdata.nasa
     :param pretty: request a 'pretty' version of the response from the service. default False
     :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
     :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param compact: If true, return the granules in a GranuleStore, which takes much less memory than a dict
     :returns: The collection JSON object
     """
     pretty = '&pretty=true' if pretty else ''
     sort_key = '&sort_key=-start_date' if descending else ''
-    cmr_query_url = f'https://{service}/search/granules.json?collection_concept_id={ccid}{pretty}{sort_key}'
-    return process_request(cmr_query_url, collection_granules_dict, get_session(), page_size=500)
+    cmr_query_url = f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}{pretty}{sort_key}'
+    json_processor = collection_granules_store if compact else collection_granules_dict
+    return process_request(cmr_query_url, json_processor, get_session(), page_size=500)
 
 
 def collection_granules_list(json_resp: dict) -> list:
@@ -746,10 +1687,49 @@ def get_collection_granule_ids(ccid: str, num = -1, descending=False,  service='
     :returns: The collection's Granule IDs, in a list
     """
     sort_key = '&sort_key=-start_date' if descending else ''
-    cmr_query_url = f'https://{service}/search/granules.json?collection_concept_id={ccid}{sort_key}'
+    cmr_query_url = f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}{sort_key}'
     return process_request_list(cmr_query_url, collection_granules_list, get_session(), num, page_size=500)
 
 
+def iter_collection_granules(ccid: str, num=-1, descending=False, time_range='', json_processor=collection_granules_list,
+                             pretty=False, service='cmr.earthdata.nasa.gov'):
+    """
+    Yield the granules of a collection, a page at a time, while the next page is
+    requested in the background. See iter_request().
+
+    :param ccid: The string Collection Concept ID
+    :param num: Limit the number of granules returned. Default is -1, which returns all granules.
+    :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param time_range: If given, limit the granules to this date range, e.g.,
+        '2000-01-01T10:00:00Z,2010-03-10T12:00:00Z'
+    :param json_processor: A function to parse the granules.json response. With the default,
+        the Granule IDs are yielded. With collection_granules_dict(), (ID, (Title, ...)) tuples are yielded.
+    :param pretty: request a 'pretty' version of the response from the service. default False
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A generator of the collection's granules
+    """
+    pretty = '&pretty=true' if pretty else ''
+    sort_key = '&sort_key=-start_date' if descending else ''
+    temporal = f'&temporal={time_range}' if time_range else ''
+    cmr_query_url = (f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}'
+                     f'{pretty}{sort_key}{temporal}')
+    return iter_request(cmr_query_url, json_processor, num, page_size=500)
+
+
+def get_collection_granule_hits(ccid: str, time_range='', service='cmr.earthdata.nasa.gov') -> int:
+    """
+    Get the number of granules in a collection without listing them.
+
+    :param ccid: The string Collection Concept ID
+    :param time_range: If given, count only the granules in this date range
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: The number of granules
+    """
+    temporal = f'&temporal={time_range}' if time_range else ''
+    cmr_query_url = f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}{temporal}'
+    return get_hits(cmr_query_url, get_session())
+
+
 def get_related_urls_from_granule_id(ccid: str, granule_id: str, service='cmr.earthdata.nasa.gov') -> dict:
     """
     Search for a granules RelatedUrls using the collection concept id and granule ur.
@@ -759,11 +1739,80 @@ def get_related_urls_from_granule_id(ccid: str, granule_id: str, service='cmr.ea
 
     :returns: A dictionary that holds all the RelatedUrls that have Type 'GET DATA' or 'USE SERVICE DATA.'
     """
-    cmr_query_url = f'https://{service}/search/granules.umm_json?collection_concept_id={ccid}&concept_id={granule_id}'
+    if catalog is not None:
+        urls = catalog.get_related_urls_from_granule_id(ccid, granule_id)
+        if urls is not None:
+            return urls
+
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json?collection_concept_id={ccid}&concept_id={granule_id}'
     return process_request(cmr_query_url, granule_data_url_dict, get_session(), page_num=1)
 
+
+"""
+The most granules get_related_urls_from_granule_ids() looks up in one request. Each
+one adds about 35 characters to the URL, so this keeps the URLs under 4 KB; at
+CMR's page size limit (2000) they would be around 70 KB, more than servers accept.
+"""
+MAX_CONCEPT_IDS = 100
+
+
+def get_related_urls_from_granule_ids(ccid: str, granule_ids, batch_size=MAX_CONCEPT_IDS,
+                                      service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    The bulk version of get_related_urls_from_granule_id(). The granules are looked
+    up 'batch_size' at a time using the concept_id[] parameter, so this makes one
+    request for each batch instead of one request for each granule.
+
+    :param ccid: The collection concept id
+    :param granule_ids: The granule concept ids
+    :param batch_size: The number of granules to look up in each request, at most MAX_CONCEPT_IDS
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A dictionary indexed by granule concept ID. Each value holds the RelatedUrls that
+        get_related_urls_from_granule_id() returns for that granule.
+    """
+    granule_ids = list(granule_ids)
+    batch_size = min(batch_size, MAX_CONCEPT_IDS)
+    urls = {}
+    if catalog is not None:
+        for granule_id in granule_ids:
+            granule_urls = catalog.get_related_urls_from_granule_id(ccid, granule_id)
+            if granule_urls is not None:
+                urls[granule_id] = granule_urls
+        granule_ids = [granule_id for granule_id in granule_ids if granule_id not in urls]
+
+    for start in range(0, len(granule_ids), batch_size):
+        batch = granule_ids[start:start + batch_size]
+        concept_ids = ''.join(f'&concept_id[]={granule_id}' for granule_id in batch)
+        cmr_query_url = f'{service_url(service)}/search/granules.umm_json?collection_concept_id={ccid}{concept_ids}'
+        # Each batch fits on one page
+        urls = merge_dict(urls, process_request(cmr_query_url, granule_data_urls_by_id, get_session(),
+                                                page_size=len(batch), page_num=1))
+    return urls
+
+
+def iter_collection_granule_urls(ccid: str, num=-1, descending=False, service='cmr.earthdata.nasa.gov'):
+    """
+    Yield the Related URLs of the granules in a collection while listing them. This
+    reads the granules.umm_json response, which holds the RelatedUrls, so no other
+    request is needed to get the URLs for a granule. See iter_request().
+
+    :param ccid: The string Collection Concept ID
+    :param num: Limit the number of granules returned. Default is -1, which returns all granules.
+    :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A generator of (granule ID, URLs) tuples where URLs is the dictionary that
+        get_related_urls_from_granule_id() returns.
+    """
+    if catalog is not None and catalog.has_collection(ccid):
+        return catalog.iter_granule_urls(ccid, num, descending)
+
+    sort_key = '&sort_key=-start_date' if descending else ''
+    cmr_query_url = f'{service_url(service)}/search/granules.umm_json?collection_concept_id={ccid}{sort_key}'
+    return iter_request(cmr_query_url, granule_data_urls_by_id, num, page_size=500)
+
+
 def get_collection_granules_temporal(ccid: str, time_range: str, pretty=False, service='cmr.earthdata.nasa.gov',
-                                     descending=False) -> dict:
+                                     descending=False, compact=False) -> dict:
     """
     Get granules that fall within a time range for a collection
 
@@ -772,13 +1821,15 @@ def get_collection_granules_temporal(ccid: str, time_range: str, pretty=False, s
     :param pretty: request a 'pretty' version of the response from the service. default False
     :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
     :param descending: If true, get the granules in newest first order, else oldest granule is first
+    :param compact: If true, return the granules in a GranuleStore, which takes much less memory than a dict
     :returns: The collection JSON object
     """
     temporal = f'&temporal={time_range}'
     pretty = '&pretty=true' if pretty else ''
     sort_key = '&sort_key=-start_date' if descending else ''
-    cmr_query_url = f'https://{service}/search/granules.json?collection_concept_id={ccid}{pretty}{sort_key}{temporal}'
-    return process_request(cmr_query_url, collection_granules_dict, get_session(), page_size=500)
+    cmr_query_url = f'{service_url(service)}/search/granules.json?collection_concept_id={ccid}{pretty}{sort_key}{temporal}'
+    json_processor = collection_granules_store if compact else collection_granules_dict
+    return process_request(cmr_query_url, json_processor, get_session(), page_size=500)
 
 
 def decompose_resty_url(url: str, pretty=False) -> dict:
@@ -5,15 +5,14 @@ Find all the NASA ESDIS Providers in the CMR catalog that have collections
 accessible using OPeNDAP.
 """
 
-import xml.dom.minidom as minidom
 import time
-import requests
-import subprocess
 import os
 
-import cmr
+import opendap_cmr as cmr
+import cmr_profile
 import errLog
-import string_search
+# xml.dom.minidom, subprocess and string_search are imported by the options that use them,
+# so that a listing does not wait for them.
 
 
 def main():
@@ -48,6 +47,10 @@ def main():
     parser.add_argument('-d', '--dap', help="run the dap tests", action='store_true', default=False)
     parser.add_argument('-D', '--dap_var', help="run the dap_var tests", action='store_true', default=False)
 
+    parser.add_argument("--profile", help="profile the run with cProfile, writing a profile for each stage (listing,"
+                        " resolve, ...) to <PROFILE>-<stage>.prof, and print the functions that took the most time."
+                        " Given without a name, use logs/profile.", nargs="?", const="logs/profile", default=None)
+
     group = parser.add_mutually_exclusive_group(required=True)  # only one option in 'group' is allowed at a time
     group.add_argument("-e", "--environment", help="an environment, a placeholder for now. This only works for PROD.")
 
@@ -55,12 +58,16 @@ def main():
 
     # cmr.verbose = True if args.verbose else False
     cmr.verbose = args.verbose
+    if args.profile:
+        cmr.profiler = cmr_profile.StageProfiler()
+        cmr.profiler.start()
 
     try:
         start = time.time()
 
         # make the response document
         if args.xml:
+            import xml.dom.minidom as minidom
             root = minidom.Document()
             xsl_element = root.createProcessingInstruction("xml-stylesheet",
                                                            "type='text/xsl' href='/NGAP-PROD-tests/home.v2.xsl'")
@@ -77,7 +84,8 @@ def main():
         cmr_query_url = f'https://{service}/search/collections.umm_json?{opendap}{pretty}'
 
         # this uses the new return value as a set feature of process_request
-        entries = cmr.process_request(cmr_query_url, cmr.provider_id, requests.Session(), page_size=2000)
+        with cmr.trace_span('listing'):
+            entries = cmr.process_request(cmr_query_url, cmr.provider_id, cmr.get_session(), page_size=2000)
 
         duration = time.time() - start
 
@@ -96,13 +104,17 @@ def main():
                 prov.setAttribute('name', provider)
                 environment.appendChild(prov)
 
+        if args.search or args.find:
+            import string_search
         if args.search:
             print("\nsearch string: " + args.search)
-            string_search.run_search(entries, args.search, args.concurrency, args.workers,
-                                     args.verbose, args.very_verbose)
+            with cmr.trace_span('resolve'):
+                string_search.run_search(entries, args.search, args.concurrency, args.workers,
+                                         args.verbose, args.very_verbose)
         elif args.find:
-            string_search.run_url_finder(entries, args.concurrency, args.workers,
-                                     args.verbose, args.very_verbose)
+            with cmr.trace_span('resolve'):
+                string_search.run_url_finder(entries, args.concurrency, args.workers,
+                                             args.verbose, args.very_verbose)
         else:
             save_file_path = ""
             if args.xml:
@@ -118,6 +130,7 @@ def main():
                     f.write(xml_str)
 
             if args.tests:
+                import subprocess
                 # once we have the list of providers, call regression_tests.py for each one
                 save_dir_name = "logs"
                 cur = 1
@@ -154,6 +167,12 @@ def main():
         errLog.output_errlog(err)
         print(e)
 
+    finally:
+        if cmr.profiler:
+            cmr.profiler.stop()
+            print(f'Profiles: {", ".join(cmr.profiler.write(args.profile))}')
+            print(cmr.profiler.summary())
+
 
 if __name__ == "__main__":
     main()
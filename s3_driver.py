@@ -1,15 +1,30 @@
 
+import collections
 import configparser
 import datetime
 import os
 import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 import regex as re
-import boto3
+import cmr_cache
+import cmr_cassette
+import cmr_metrics
+import cmr_profile
+import cmr_sampler
+import cmr_trace
 import opendap_cmr
 import fileOutput as out
+import granule_catalog
+import temporal_plan
+import url_table
 
-import earthaccess
+# earthaccess and boto3 are imported, and the EDL auth and S3 client made, when they are
+# first used (see get_auth() and get_s3_client()). Importing them takes a second or more,
+# which '--help', a run with --replay and the tests that import this module do not need.
 # from earthaccess import Auth, DataGranules #, Store
 
 verbose = True
@@ -17,8 +32,45 @@ nasa_s3 = ""
 open_s3 = ""
 template = ""
 replace = ""
-auth = earthaccess.Auth()
+auth = None        # the earthaccess.Auth; use get_auth()
+s3_client = None   # the boto3 S3 client shared by the workers; use get_s3_client()
+lazy_lock = threading.Lock()
 limit = 0
+workers = 8         # the number of time windows searched at once
+window_size = 2000  # the most granules in one time window
+summary_only = False  # count the granules with hits-only queries, without finding or testing their URLs
+
+
+def get_auth():
+    """
+    The earthaccess.Auth used to download the DMR++ files, made, and logged in to EDL
+    using ~/.netrc, on first use. Runs that download nothing (e.g., --summary-only)
+    never log in.
+    """
+    global auth
+    if auth is None:
+        with lazy_lock:
+            if auth is None:
+                import earthaccess
+                edl = earthaccess.Auth()
+                edl.login(strategy="netrc")
+                print("Authenticated: " + str(edl.authenticated)) if verbose else ''
+                auth = edl
+    return auth
+
+
+def get_s3_client():
+    """
+    The boto3 S3 client, made on first use. Clients are thread safe, so one is shared
+    by all the workers rather than made for each upload.
+    """
+    global s3_client
+    if s3_client is None:
+        with lazy_lock:
+            if s3_client is None:
+                import boto3
+                s3_client = boto3.client('s3')
+    return s3_client
 
 
 def load_config():
@@ -44,33 +96,46 @@ def load_config():
     print("\treplace: " + replace) if verbose else ''
 
 
-def query_cmr(ccid: str, max = -1) -> list:
+def query_cmr(ccid: str, max = -1, service='cmr.earthdata.nasa.gov') -> url_table.URLTable:
     """
     Queries CMR for a list of granule urls.
     For the CCID, get a list of granule IDs and use those to find the S3 URLs that
-    provide direct access to the granules. The function will return a list of URLs.
+    provide direct access to the granules. The function will return a table of URLs.
     :param ccid: CMR Collection Concept ID
     :param max: Instead of returning all the urls, return only the first 'max' number of urls.
-    :return: A list of URLs
+    :param service: The URL of the CMR to query (default cmr.earthdata.nasa.gov)
+    :return: A URLTable of the URLs, which can be iterated over like a list
     """
     print("Starting query_cmr with url: " + ccid) if verbose else ''
 
-    # granules is a list of granule IDs, the request to CMR is limited to max return values.
-    # although if the page size is larger, the function will get that many values from CMR.
-    granules = opendap_cmr.get_collection_granule_ids(ccid, max)
-    num_gran = len(granules)
+    # granules yields granule IDs and their URLs a page at a time while the next page is
+    # fetched, so the work on the first granule starts before the listing is done. The URLs
+    # are part of the listing (granules.umm_json), so there is no request for each granule.
+    # The request to CMR is limited to max return values, although if the page size is
+    # larger, the function will get that many values from CMR.
+    # With a granule catalog, bring the collection up to date (only the changes since the
+    # last run are requested) and read the granules and URLs from it.
+    catalog = opendap_cmr.catalog
+    if catalog is not None:
+        catalog.sync(ccid)
+    granules = opendap_cmr.iter_collection_granule_urls(ccid, max, service=service)
+    if max != -1:
+        num_gran = max
+    elif catalog is not None:
+        num_gran = catalog.granule_count(ccid)
+    else:
+        num_gran = opendap_cmr.get_collection_granule_hits(ccid, service=service)
     print("# granules: " + str(num_gran))
     print("max: " + str(max)) if max != -1 else ''
     cur_num = 0
-    url_list = []
-    for granule_id in granules:
+    url_list = url_table.URLTable()
+    for granule_id, urls in granules:
         # print(f"\ngranule: {granule_id}") if verbose else ''
-        urls = opendap_cmr.get_related_urls_from_granule_id(ccid, granule_id)
         # print(f"# urls: {len(urls)}") if verbose else ''
         for url in urls:
             # print(f"\turl: {urls[url]}") if verbose else ''
             if urls[url].startswith("s3://"):
-                url_list.append(urls[url])
+                url_list.add(urls[url], granule_id)
                 break   # only add the first s3 url
 
         cur_num += 1
@@ -81,33 +146,49 @@ def query_cmr(ccid: str, max = -1) -> list:
     return url_list
 
 
-def query_earthaccess(ccid, year, month):
+def query_earthaccess(ccid, start, end, extents=None):
     """
     Args:
         ccid:
-        year:
-        month:
+        start: the start of the time range, a datetime or a CMR date/time string
+        end: the end of the time range (inclusive)
+        extents: if given, a dictionary that is given the (start, end) times of each granule found
 
     Returns:
-
+        A URLTable of the DMR++ URLs, which can be iterated over like a list
     """
     # print("Starting query_earthaccess with CCID: " + ccid) if verbose else ''
-    url_list = []
-
-    results = earthaccess.search_data(
-        concept_id=ccid,
-        temporal=(f"{year}-{month}",f"{year}-{month}"),
-        cloud_hosted=True
-    )
+    url_list = url_table.URLTable()
 
-    for result in results:
-        for url in result.data_links():
-            if "opendap" in url and url.endswith(".html"):
-                url = url.replace(".html", "")
-
-            # hack to get the DMR++
-            url = f"{url}.dmrpp"
-            url_list.append(url)
+    if isinstance(start, datetime.datetime):
+        start, end = temporal_plan.cmr_time(start), temporal_plan.cmr_time(end)
+    search_start = time.monotonic()
+    status = 0
+    import earthaccess
+    try:
+        with opendap_cmr.trace_span("search"):
+            results = earthaccess.search_data(
+                concept_id=ccid,
+                temporal=(start, end),
+                cloud_hosted=True
+            )
+        status = 200
+    finally:
+        if opendap_cmr.metrics is not None:
+            opendap_cmr.metrics.record("earthaccess.search_data", status, time.monotonic() - search_start)
+
+    with opendap_cmr.trace_span("resolve"):
+        for result in results:
+            if extents is not None:
+                extents[result["meta"]["concept-id"]] = (granule_catalog.granule_start_time(result["umm"]),
+                                                         granule_catalog.granule_end_time(result["umm"]))
+            for url in result.data_links():
+                if "opendap" in url and url.endswith(".html"):
+                    url = url.replace(".html", "")
+
+                # hack to get the DMR++
+                url = f"{url}.dmrpp"
+                url_list.add(url, result["meta"]["concept-id"])
 
     return url_list
 
@@ -123,7 +204,7 @@ def query_s3(s3_url):
     # pseudocode
     # make the s3 boto3 client using the s3_url ( ?? maybe the region, access id, and access key ?? )
     # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/core/session.html#boto3.session.Session.client
-    s3 = boto3.client('s3')
+    s3 = get_s3_client()
         # client(service_name, region_name=None, api_version=None, use_ssl=True,
         #   verify=None, endpoint_url=None, aws_access_key_id=None,
         #   aws_secret_access_key=None, aws_session_token=None, config=None)
@@ -153,22 +234,32 @@ def download_file_from_s3(url, local_file_path):
             url (str): The url of the file in s3.
             local_file_path (str): The path to save the downloaded file locally.
     """
+    start = time.monotonic()
+    status = 0
+    size = 0
     try:
-        session = auth.get_session()
+        session = get_auth().get_session()
+        if opendap_cmr.cassette is not None:
+            opendap_cmr.cassette.mount(session)
         with session.get(
                 url,
                 stream=True,
                 allow_redirects=True,
         ) as r:
+            status = r.status_code
             r.raise_for_status()
             with open(local_file_path, "wb") as f:
                 # This is to cap memory usage for large files at 1MB per write to disk per thread
                 # https://docs.python-requests.org/en/latest/user/quickstart/#raw-response-content
                 shutil.copyfileobj(r.raw, f, length=1024 * 1024)
+                size = f.tell()
     except BaseException as e:
         print(f"Error while downloading the file {local_file_path}")
         print(e)
         return False
+    finally:
+        if opendap_cmr.metrics is not None:
+            opendap_cmr.metrics.record("download", status, time.monotonic() - start, size)
 
     return True
 
@@ -194,8 +285,16 @@ def copy_file_to_s3(local_file_path, s3_bucket_name, s3_file_name):
         s3_file_name (str): The s3 file name for the uploaded file in S3.
     """
 
-    s3 = boto3.client('s3')
-    s3.upload_file(local_file_path, s3_bucket_name, s3_file_name)
+    # Size the file first, so a missing file is reported by boto3, not by the metrics
+    size = os.path.getsize(local_file_path) if os.path.exists(local_file_path) else 0
+    start = time.monotonic()
+    status = 0
+    try:
+        get_s3_client().upload_file(local_file_path, s3_bucket_name, s3_file_name)
+        status = 200
+    finally:
+        if opendap_cmr.metrics is not None:
+            opendap_cmr.metrics.record("upload", status, time.monotonic() - start, size)
 
 
 def delete_file(path):
@@ -217,11 +316,17 @@ def test_url(url, ccid):
     local_path, file = build_urls(url, ccid)
     dacc = ccid.partition("-")[2]
 
-    if download_file_from_s3(url, local_path):
-        replace_template(local_path, url)
-        file_name = f"{dacc}/{ccid}/{file}"
-        copy_file_to_s3(local_path, open_s3, file_name)
-        delete_file(local_path)
+    with opendap_cmr.trace_span("granule", url=url):
+        with opendap_cmr.trace_span("download"):
+            downloaded = download_file_from_s3(url, local_path)
+        if downloaded:
+            with opendap_cmr.trace_span("rewrite"):
+                replace_template(local_path, url)
+            file_name = f"{dacc}/{ccid}/{file}"
+            with opendap_cmr.trace_span("upload"):
+                copy_file_to_s3(local_path, open_s3, file_name)
+            with opendap_cmr.trace_span("delete"):
+                delete_file(local_path)
 
 
 def print_progress(amount, total):
@@ -269,32 +374,68 @@ def load_ccid_list(ifile):
         out.update_status(f" - Completed: {datetime.datetime.now().strftime('%H:%M - %m/%d/%Y')}\n")
 
 
+def harvest_window(ccid, window, parent=None):
+    """
+    Find the DMR++ URLs of the granules in one of a collection's time windows.
+    :param ccid:
+    :param window: a tuple (start, end, hits) from temporal_plan
+    :param parent: the trace span of the collection, since this runs on a worker thread
+    :return: the tuple (window, URLTable of the URLs, {granule id: (start time, end time)})
+    """
+    extents = {}
+    with opendap_cmr.trace_span("window", parent, window=f"{window[0]} - {window[1]}", hits=window[2]):
+        url_list = query_earthaccess(ccid, window[0], window[1], extents)
+    return window, url_list, extents
+
+
 def process_ccid(ccid):
-    print(f"[==============================]\nccid: {ccid}") if verbose else ''
-    cur_year = datetime.date.today().year
-    outlist = []
-    total = 0
-    for year in range(1970, cur_year + 1):
-        print(f"\t{year}: ") if verbose else ''
-        for month in range(1, 13):
-            url_list = query_earthaccess(ccid, year, month)
-            print(f"\t\t{month} - urls: {len(url_list)}") if verbose and len(url_list) > 0 else '.'
-            outlist.append((month, len(url_list)))
-            total += len(url_list)
-
-            x = 0
-            for url in url_list:
-                test_url(url, ccid, year, month)
-                print_progress(x, len(url_list))
-                x += 1
-                if limit != -1 and x > limit:
-                    break
-
-            print(".") if verbose and len(url_list) > 0 else ''
-
-        outlist.append((year, total))
-        out.update_summary(outlist)
-        outlist.clear()
+    with opendap_cmr.trace_span("ccid", ccid=ccid):
+        print(f"[==============================]\nccid: {ccid}") if verbose else ''
+        try:
+            if summary_only:
+                out.update_summary_months(temporal_plan.collection_monthly_hits(ccid, workers=workers))
+                return
+            with opendap_cmr.trace_span("plan"):
+                windows = temporal_plan.plan_collection(ccid, target=window_size, workers=workers)
+        except (opendap_cmr.CMRException, ValueError) as e:
+            # A ValueError is a granule time that cannot be parsed; the other collections can still be harvested
+            print(f"\tNo granules with a temporal extent found for {ccid}: {e}") if verbose else ''
+            return
+        print(f"\t{len(windows)} windows, {sum(hits for _, _, hits in windows)} granules") if verbose else ''
+
+        # The windows are searched concurrently; their URLs are tested in time order, as they arrive.
+        # A granule that spans two windows is found in both, so skip the granules already seen.
+        # The summary counts each granule in every month its temporal extent overlaps, as the
+        # month by month searches did and as --summary-only does.
+        seen = set()
+        months = collections.Counter()
+        tested = 0
+        parent = opendap_cmr.trace_parent()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            harvested = executor.map(partial(harvest_window, ccid, parent=parent), windows)
+            for (start, end, hits), url_list, extents in harvested:
+                print(f"\t{start} - {end}: {hits} granules, urls: {len(url_list)}") if verbose else ''
+                new = {granule_id for granule_id in extents if granule_id not in seen}
+                seen.update(new)
+                # Granules without a temporal extent are not found by a search of any month
+                months.update(temporal_plan.count_months(extents[granule_id] for granule_id in new
+                                                         if extents[granule_id][0]))
+
+                # In test mode the cap is on the collection, whatever the window size
+                x = 0
+                for granule_id, url in url_list.items():
+                    if limit != -1 and tested >= limit:
+                        break
+                    if granule_id not in new:
+                        continue
+                    test_url(url, ccid)
+                    print_progress(x, len(url_list))
+                    x += 1
+                    tested += 1
+
+                print(".") if verbose and len(url_list) > 0 else ''
+
+        out.update_summary_months(months)
 
 
 def main():
@@ -304,25 +445,90 @@ def main():
 
     parser.add_argument("-v", "--verbose", help="increase output verbosity", action="store_true",
                         default=False)
-    parser.add_argument("-t", "--test", help="test mode, caps max number of granule urls to 10",
+    parser.add_argument("-t", "--test", help="test mode, tests at most 10 granule urls for each collection",
                         action="store_true", default=False)
+    parser.add_argument("-F", "--fan-out", help="read the number of hits from the first page of a CMR response and"
+                        " get the remaining pages using this many concurrent requests (default: 0, one page at a time)",
+                        type=int, default=0)
+    parser.add_argument("-w", "--workers", help="search this many time windows of a collection at once (default: 8)",
+                        type=int, default=8)
+    parser.add_argument("--window-size", help="split a collection's temporal extent into windows of at most this"
+                        " many granules (default: 2000)", type=int, default=2000)
+    parser.add_argument("--summary-only", help="only write the summary of granules by month, counting them with"
+                        " hits-only CMR queries instead of finding and testing their URLs", action="store_true")
+    parser.add_argument("--metrics", help="record the latency, size and status of each CMR request, search,"
+                        " download and upload and write them, at the end, to <METRICS>.prom (Prometheus text) and"
+                        " <METRICS>.json. Given without a name, use logs/metrics.", nargs="?",
+                        const="logs/metrics", default=None)
+    parser.add_argument("--trace", help="write a span for each collection, time window, CMR request, granule"
+                        " and granule stage to this JSONL file; see cmr_trace.py to analyze it. Given without a"
+                        " file, use logs/trace.jsonl.", nargs="?", const="logs/trace.jsonl", default=None)
+    parser.add_argument("--cache", help="cache CMR responses in this SQLite file. Given without a file, use"
+                        " logs/cmr_cache.sqlite.", nargs="?", const="logs/cmr_cache.sqlite", default=None)
+    parser.add_argument("--revalidate", help="with --cache, ask CMR if expired responses have changed"
+                        " before getting them again.", action="store_true")
+    parser.add_argument("--catalog", help="keep the granules and their URLs in this granule catalog, synced with"
+                        " CMR on each run. Given without a file, use logs/catalog.sqlite.", nargs="?",
+                        const="logs/catalog.sqlite", default=None)
+    parser.add_argument("--record", help="record the CMR requests and downloads made, and their responses, to"
+                        " this cassette file. The earthaccess searches of a harvest are not recorded. Given without"
+                        " a file, use logs/cassette.jsonl.gz.", nargs="?", const="logs/cassette.jsonl.gz",
+                        default=None)
+    parser.add_argument("--replay", help="with --summary-only, answer the CMR requests with the responses recorded"
+                        " in this cassette file. Given without a file, use logs/cassette.jsonl.gz.", nargs="?",
+                        const="logs/cassette.jsonl.gz", default=None)
+    parser.add_argument("--replay-timing", help="with --replay, wait this many times as long as each recorded request"
+                        " took (default: 0, answer right away). Given without a value, use 1, the recorded timings.",
+                        nargs="?", type=float, const=1.0, default=0.0)
+    parser.add_argument("--profile", help="profile the run with cProfile, writing a profile for each stage (listing,"
+                        " resolve, download, rewrite, upload) to <PROFILE>-<stage>.prof, and print the functions that"
+                        " took the most time. Given without a name, use logs/profile.", nargs="?",
+                        const="logs/profile", default=None)
+    parser.add_argument("--sample", help="sample the stacks of all the threads a few times a second, for as long as"
+                        " the run lasts, and write them every minute to <SAMPLE>.collapsed (the whole run) and"
+                        " <SAMPLE>-recent.collapsed (the last minute), for flame graphs. Given without a name, use"
+                        " logs/samples.", nargs="?", const="logs/samples", default=None)
+    parser.add_argument("--sample-rate", help="with --sample, the number of samples a second (default: 20)",
+                        type=float, default=20.0)
 
     group = parser.add_mutually_exclusive_group(required=True)  # only one option in 'group' is allowed at a time
     group.add_argument("-c", "--ccid", help="ccid to send to CMR")
     group.add_argument("-i", "--input", help="path to file containing list of CCIDs")
 
     args = parser.parse_args()
-
-    # first we authenticate with NASA EDL
-    auth.login(strategy="netrc")
-    # are we authenticated?
-    print("Authenticated: " + str(auth.authenticated)) if verbose else ''
-
+    opendap_cmr.page_fan_out = args.fan_out
+    opendap_cmr.set_pool_size(max(args.workers, args.fan_out))
+    if args.cache:
+        opendap_cmr.response_cache = cmr_cache.ResponseCache(args.cache, revalidate=args.revalidate)
+    if args.catalog:
+        opendap_cmr.catalog = granule_catalog.GranuleCatalog(args.catalog)
+    if args.metrics:
+        opendap_cmr.metrics = cmr_metrics.Metrics()
+    if args.trace:
+        opendap_cmr.tracer = cmr_trace.Tracer(args.trace)
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be used together")
+    if args.replay and not args.summary_only:
+        # A harvest searches with earthaccess, whose requests the cassette cannot record or play back
+        parser.error("--replay can only be used with --summary-only")
+    if args.record:
+        opendap_cmr.cassette = cmr_cassette.Cassette(args.record, 'record')
+    elif args.replay:
+        opendap_cmr.cassette = cmr_cassette.Cassette(args.replay, 'replay', timing=args.replay_timing)
+    if args.profile:
+        opendap_cmr.profiler = cmr_profile.StageProfiler()
+        opendap_cmr.profiler.start()
+    sampler = cmr_sampler.Sampler(args.sample, rate=args.sample_rate).start() if args.sample else None
+
+    # We authenticate with NASA EDL when the first DMR++ is downloaded; see get_auth()
 
     # pseudocode
     # call load_config(...) to set ns3 and os3
     load_config()
-    global limit
+    global limit, workers, window_size, summary_only
+    workers = args.workers
+    window_size = args.window_size
+    summary_only = args.summary_only
     if args.test:
         limit = 10
     else:
@@ -330,14 +536,35 @@ def main():
 
     out.create_status()
 
-    if args.input:
-        print(f"file: {args.input}") if verbose else ''
-        load_ccid_list(args.input)
-    else:
-        out.create_summary(args.ccid)
-        out.update_status(f"\t{args.ccid} - Started: {datetime.datetime.now().strftime('%H:%M - %m/%d/%Y')}")
-        process_ccid(args.ccid)
-        out.update_status(f" - Completed: {datetime.datetime.now().strftime('%H:%M - %m/%d/%Y')}\n")
+    # What was measured is written even when the run fails part way, which is when it is most wanted
+    try:
+        with opendap_cmr.trace_span("run"):
+            if args.input:
+                print(f"file: {args.input}") if verbose else ''
+                load_ccid_list(args.input)
+            else:
+                out.create_summary(args.ccid)
+                out.update_status(f"\t{args.ccid} - Started: {datetime.datetime.now().strftime('%H:%M - %m/%d/%Y')}")
+                process_ccid(args.ccid)
+                out.update_status(f" - Completed: {datetime.datetime.now().strftime('%H:%M - %m/%d/%Y')}\n")
+    finally:
+        if sampler:
+            sampler.stop()
+            print(f"{sampler.summary()}; see: ./cmr_sampler.py {args.sample}.collapsed") if verbose else ''
+        opendap_cmr.close_sessions()
+        if opendap_cmr.tracer:
+            opendap_cmr.tracer.close()
+            print(f"Trace written to {args.trace}; see: ./cmr_trace.py {args.trace}") if verbose else ''
+        if opendap_cmr.metrics:
+            opendap_cmr.metrics.write(args.metrics)
+            print(opendap_cmr.metrics.summary()) if verbose else ''
+        if opendap_cmr.cassette:
+            opendap_cmr.cassette.close()
+            print(opendap_cmr.cassette.summary()) if verbose else ''
+        if opendap_cmr.profiler:
+            opendap_cmr.profiler.stop()
+            print(f"Profiles: {', '.join(opendap_cmr.profiler.write(args.profile))}")
+            print(opendap_cmr.profiler.summary())
 
 
 if __name__ == "__main__":
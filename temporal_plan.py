@@ -0,0 +1,227 @@
+"""
+Split a collection's temporal extent into windows that each hold about the same
+number of granules, so the granules can be harvested one window at a time, with
+the windows harvested concurrently.
+
+Asking CMR (or earthaccess) for a collection's granules one month at a time from
+1970 to today makes hundreds of requests for each collection, most of them for
+months with no data, and one at a time. Instead, plan_collection() bounds the
+collection using its oldest and newest granules, then asks CMR how many granules
+are in that time range (a hits-only query, which is cheap) and splits any range
+with more than 'target' granules in half until each range is small enough. A
+collection with a few years of data is planned with a handful of requests; one
+with a million granules gets about a million / 'target' windows, more of them
+where the granules are dense.
+
+CMR matches the granules whose temporal extent overlaps a range, so a granule
+that spans the boundary between two windows is found in both. Callers that need
+each granule once should skip the granule IDs they have already seen.
+
+    windows = temporal_plan.plan_collection('C2036877806-POCLOUD', target=2000)
+    for start, end, hits in windows:
+        ... earthaccess.search_data(concept_id=ccid, temporal=(cmr_time(start), cmr_time(end)))
+
+collection_monthly_hits() counts a collection's granules by month the same way,
+with hits-only queries, for the summary tables fileOutput writes. count_months()
+counts the granules a harvest finds for the same tables; both count a granule in
+every month its temporal extent overlaps.
+"""
+import collections
+import datetime
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import opendap_cmr
+
+MIN_WIDTH = datetime.timedelta(seconds=2)
+"""A window narrower than this is not split, even if it holds more than 'target' granules."""
+
+
+"""
+A CMR date/time: the date, then optionally the time, with any number of digits
+after the decimal point, and a 'Z' or an offset from UTC.
+"""
+TIME_PATTERN = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d*))?)?)?'
+                          r'(Z|[+-]\d{2}(?::?\d{2})?)?')
+
+
+def parse_time(value: str) -> datetime.datetime:
+    """
+    Parse a CMR date/time string like '2012-10-29T01:00:01.000Z'. Unlike
+    datetime.fromisoformat() before Python 3.11, any number of fractional digits
+    (e.g., '01:00:01.5Z') is accepted.
+
+    :returns: A naive datetime in UTC
+    :raises ValueError: If the value is not a date/time
+    """
+    match = TIME_PATTERN.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f'Not a CMR date/time: {value!r}')
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    parsed = datetime.datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                               int((fraction or '').ljust(6, '0')[:6]))
+    if zone and zone != 'Z':
+        sign = -1 if zone[0] == '-' else 1
+        digits = zone[1:].replace(':', '')
+        parsed -= sign * datetime.timedelta(hours=int(digits[:2]), minutes=int(digits[2:] or 0))
+    return parsed
+
+
+def cmr_time(value: datetime.datetime) -> str:
+    """Format a datetime for CMR's 'temporal' parameter; CMR works in whole seconds."""
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def month_range(year: int, month: int) -> tuple:
+    """The first and last second of a month."""
+    start = datetime.datetime(year, month, 1)
+    return start, datetime.datetime(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(seconds=1)
+
+
+def granule_months(beginning: str, ending: str) -> list:
+    """
+    The months a granule's temporal extent overlaps, which are the months whose
+    searches (and hits queries) find it.
+
+    :param beginning: The granule's start, a CMR date/time string
+    :param ending: The granule's end, a CMR date/time string, or '' if it ends when it begins
+    :returns: A list of (year, month) tuples
+    """
+    first, last = parse_time(beginning), parse_time(ending or beginning)
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = year + month // 12, month % 12 + 1
+    return months
+
+
+def count_months(extents) -> collections.Counter:
+    """
+    Count granules in each month their temporal extents overlap, so that a granule
+    that spans the end of a month is counted in both months, as monthly_hits() does.
+
+    :param extents: The (beginning, ending) of each granule, e.g., the values of
+        the dictionary opendap_cmr.granule_time_dict() returns
+    :returns: A Counter like {(year, month): granules}
+    """
+    months = collections.Counter()
+    for beginning, ending in extents:
+        months.update(granule_months(beginning, ending))
+    return months
+
+
+def cmr_range(start: datetime.datetime, end: datetime.datetime) -> str:
+    """The value of CMR's 'temporal' parameter for the range start to end, inclusive."""
+    return f'{cmr_time(start)},{cmr_time(end)}'
+
+
+def collection_extent(ccid: str, service='cmr.earthdata.nasa.gov') -> tuple:
+    """
+    Find the time range a collection's granules cover, using its oldest and newest granules.
+
+    :param ccid: The collection concept id
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: The tuple (start, end) of naive UTC datetimes, rounded out to whole seconds
+    :raises: CMRException if CMR has no granules with a temporal extent for the collection
+    """
+    times = opendap_cmr.get_collection_granules_umm_first_last(ccid, json_processor=opendap_cmr.granule_time_dict,
+                                                               service=service)
+    start = min(parse_time(beginning) for beginning, _ in times.values())
+    end = max(parse_time(ending) for _, ending in times.values())
+    if end.microsecond:
+        end += datetime.timedelta(seconds=1)
+    return start.replace(microsecond=0), end.replace(microsecond=0)
+
+
+def plan_windows(ccid: str, start: datetime.datetime, end: datetime.datetime, target=2000, workers=8,
+                 min_width=MIN_WIDTH, service='cmr.earthdata.nasa.gov') -> list:
+    """
+    Split the time range start to end into windows that each hold at most 'target'
+    of the collection's granules by splitting the windows that hold more in half.
+    The windows at each level of splitting are counted concurrently.
+
+    :param ccid: The collection concept id
+    :param start: The start of the range
+    :param end: The end of the range
+    :param target: The most granules a window should hold
+    :param workers: The most hits queries to make at once
+    :param min_width: Do not split windows narrower than this
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A list of tuples (start, end, hits), in time order, of the windows
+        with granules in them. Adjacent windows share their boundary.
+    """
+    parent = opendap_cmr.trace_parent()
+
+    def count(window: tuple) -> tuple:
+        with opendap_cmr.trace_span('hits', parent, window=cmr_range(*window)):
+            return window, opendap_cmr.get_collection_granule_hits(ccid, cmr_range(*window), service=service)
+
+    windows = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = {executor.submit(count, (start, end))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                (first, last), hits = future.result()
+                if hits > target and last - first >= min_width:
+                    middle = (first + (last - first) / 2).replace(microsecond=0)
+                    pending.add(executor.submit(count, (first, middle)))
+                    pending.add(executor.submit(count, (middle, last)))
+                elif hits > 0:
+                    windows.append((first, last, hits))
+
+    return sorted(windows)
+
+
+def plan_collection(ccid: str, target=2000, workers=8, service='cmr.earthdata.nasa.gov') -> list:
+    """
+    Bound a collection's temporal extent and split it into windows of at most
+    'target' granules. See plan_windows().
+
+    :returns: A list of tuples (start, end, hits), in time order
+    :raises: CMRException if CMR has no granules with a temporal extent for the collection
+    """
+    start, end = collection_extent(ccid, service=service)
+    return plan_windows(ccid, start, end, target=target, workers=workers, service=service)
+
+
+def monthly_hits(ccid: str, start: datetime.datetime, end: datetime.datetime, workers=8,
+                 service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    Count a collection's granules in each month from start to end using hits-only
+    queries, made concurrently. The years are counted first and only the months
+    of the years with granules are counted. As with searching month by month, a
+    granule that spans the end of a month is counted in both months; counting the
+    granules a harvest finds with count_months() gives the same counts.
+
+    :param ccid: The collection concept id
+    :param start: Count from the start of this datetime's year
+    :param end: Count to the end of this datetime's year
+    :param workers: The most hits queries to make at once
+    :param service: The URL of the service to query (default cmr.earthdata.nasa.gov)
+    :returns: A dictionary like {(year, month): hits} with all twelve months of
+        each year that has granules
+    """
+    parent = opendap_cmr.trace_parent()
+
+    def count(window: tuple) -> int:
+        with opendap_cmr.trace_span('hits', parent, window=cmr_range(*window)):
+            return opendap_cmr.get_collection_granule_hits(ccid, cmr_range(*window), service=service)
+
+    years = range(start.year, end.year + 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        year_hits = executor.map(count, [(month_range(year, 1)[0], month_range(year, 12)[1]) for year in years])
+        months = [(year, month) for year, hits in zip(years, year_hits) if hits > 0 for month in range(1, 13)]
+        return dict(zip(months, executor.map(count, [month_range(*month) for month in months])))
+
+
+def collection_monthly_hits(ccid: str, workers=8, service='cmr.earthdata.nasa.gov') -> dict:
+    """
+    Count a collection's granules in each month of its temporal extent. See monthly_hits().
+
+    :returns: A dictionary like {(year, month): hits}
+    :raises: CMRException if CMR has no granules with a temporal extent for the collection
+    """
+    start, end = collection_extent(ccid, service=service)
+    return monthly_hits(ccid, start, end, workers=workers, service=service)
@@ -0,0 +1,21 @@
+"""
+The unit tests use the CMR stand-in (benchmarks/cmr_standin.py) or mocked
+responses, never a real CMR. So that a test that forgets to pass 'service' (and
+so falls back to cmr.earthdata.nasa.gov) fails instead of querying production,
+only local host names can be looked up while the tests run.
+"""
+import socket
+
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+_getaddrinfo = socket.getaddrinfo
+
+
+def local_getaddrinfo(host, *args, **kwargs):
+    name = host.decode() if isinstance(host, bytes) else host
+    if name is not None and name not in LOCAL_HOSTS:
+        raise socket.gaierror(socket.EAI_NONAME, f'{name}: the unit tests may not use the network')
+    return _getaddrinfo(host, *args, **kwargs)
+
+
+socket.getaddrinfo = local_getaddrinfo
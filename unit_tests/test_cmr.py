@@ -6,7 +6,7 @@ import unittest
 import requests
 import responses
 
-import cmr
+import opendap_cmr as cmr
 from unit_tests import CMR_Responses
 
 
@@ -0,0 +1,107 @@
+"""
+Test the asyncio CMR client using the local CMR stand-in.
+"""
+import asyncio
+import unittest
+from unittest.mock import patch
+
+import cmr_async
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestCMRAsync(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections=3, granules=25).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def run_with_session(self, coroutine_function, *args, **kwargs):
+        async def run():
+            async with cmr_async.get_session(4) as session:
+                return await coroutine_function(session, *args, **kwargs)
+        return asyncio.run(run())
+
+    def test_get_collection_granule_ids(self):
+        """All the pages are returned, in order"""
+        result = self.run_with_session(cmr_async.get_collection_granule_ids, 'C1-POCLOUD',
+                                       service=self.standin.url)
+        self.assertEqual(25, len(result))
+        self.assertEqual('G10000001-POCLOUD', result[0])
+        self.assertEqual('G10000025-POCLOUD', result[-1])
+
+    def test_get_collection_granule_ids_matches_sync(self):
+        """The async and sync clients return the same thing"""
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C2-POCLOUD'
+        sync = opendap_cmr.process_request_list(url, opendap_cmr.collection_granules_list,
+                                                opendap_cmr.get_session(), page_size=10)
+        result = self.run_with_session(lambda session: cmr_async.process_request_list(
+            url, opendap_cmr.collection_granules_list, session, page_size=10))
+        self.assertEqual(sync, result)
+
+    def test_get_collection_granule_ids_num(self):
+        """Only the first 'num' granules are returned"""
+        result = self.run_with_session(cmr_async.get_collection_granule_ids, 'C1-POCLOUD', num=5, descending=True,
+                                       service=self.standin.url)
+        self.assertEqual(['G10000025-POCLOUD', 'G10000024-POCLOUD', 'G10000023-POCLOUD', 'G10000022-POCLOUD',
+                          'G10000021-POCLOUD'], result)
+
+    def test_process_request_dict(self):
+        """The dict response processors are merged across pages"""
+        url = f'{self.standin.url}/search/granules.umm_json_v1_4?collection_concept_id=C3-POCLOUD'
+        result = self.run_with_session(lambda session: cmr_async.process_request(
+            url, opendap_cmr.granule_ur_dict_2, session, page_size=7))
+        self.assertEqual(25, len(result))
+        self.assertEqual('granule_G30000001-POCLOUD', result['G30000001-POCLOUD'][0])
+
+    def test_get_provider_opendap_collections_brutishly(self):
+        result = self.run_with_session(cmr_async.get_provider_opendap_collections_brutishly, 'POCLOUD',
+                                       service=self.standin.url)
+        self.assertEqual(['C1-POCLOUD', 'C2-POCLOUD', 'C3-POCLOUD'], list(result.keys()))
+        self.assertTrue(all(value[0] for value in result.values()))
+
+    def test_cmr_error(self):
+        """CMR errors are raised as CMRException"""
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        with self.assertRaises(opendap_cmr.CMRException):
+            self.run_with_session(lambda session: cmr_async.process_request_list(
+                url, opendap_cmr.collection_granules_list, session, page_size=5000))
+
+    @patch('errLog.output_errlog')
+    def test_incomplete(self, errlog):
+        """A page that fails every retry is reported with the pages that were read, as the sync client does"""
+        opendap_cmr.retry_backoff = 0
+        opendap_cmr.max_retries = 1
+        with CMRStandIn(collections=1, granules=25) as standin:
+            standin.failing_pages = {3}
+            url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+            try:
+                with self.assertRaises(opendap_cmr.CMRIncompleteResult) as cm:
+                    self.run_with_session(lambda session: cmr_async.process_request_list(
+                        url, opendap_cmr.collection_granules_list, session, page_size=5))
+                with self.assertRaises(opendap_cmr.CMRIncompleteResult):
+                    standin.failing_pages = {1}
+                    self.run_with_session(cmr_async.collection_has_opendap, 'C1-POCLOUD', service=standin.url)
+            finally:
+                opendap_cmr.retry_backoff = 0.5
+                opendap_cmr.max_retries = 4
+            self.assertEqual(1 + 4 + 1 + 2, standin.requests)  # Page 3 (and then page 1) was tried twice
+        self.assertEqual([(3, 3)], cm.exception.missing)
+        self.assertEqual(503, cm.exception.status)
+        self.assertEqual(20, len(cm.exception.partial))
+        self.assertNotIn('G10000011-POCLOUD', cm.exception.partial)
+        self.assertIn('missing pages 3', errlog.call_args_list[0][0][0])
+
+    def test_get_collections_granule_ids(self):
+        result = cmr_async.get_collections_granule_ids(['C1-POCLOUD', 'C2-POCLOUD'], connections=2,
+                                                       service=self.standin.url)
+        self.assertEqual(['C1-POCLOUD', 'C2-POCLOUD'], list(result.keys()))
+        self.assertEqual([25, 25], [len(ids) for ids in result.values()])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Test the CMR response cache.
+"""
+import os
+import tempfile
+import unittest
+
+import cmr_cache
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestResponseCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections=3, granules=25).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, 'cache.sqlite')
+
+    def tearDown(self):
+        opendap_cmr.response_cache = None
+        self.temp_dir.cleanup()
+
+    def test_normalize_url(self):
+        self.assertEqual(cmr_cache.normalize_url('https://cmr/search/granules.json?b=2&a=1&pretty=true'),
+                         cmr_cache.normalize_url('https://cmr/search/granules.json?a=1&b=2'))
+        self.assertNotEqual(cmr_cache.normalize_url('https://cmr/search/granules.json?a=1'),
+                            cmr_cache.normalize_url('https://cmr/search/granules.json?a=1', '["x"]'))
+
+    def test_endpoint(self):
+        self.assertEqual('granules', cmr_cache.endpoint('https://cmr/search/granules.umm_json_v1_4?a=1'))
+        self.assertEqual('collections', cmr_cache.endpoint('https://cmr/search/collections.json?a=1'))
+
+    def test_put_get(self):
+        cache = cmr_cache.ResponseCache(self.path)
+        self.assertIsNone(cache.get('https://cmr/search/granules.json?a=1'))
+        cache.put('https://cmr/search/granules.json?a=1', '', b'{"feed": {}}', {'CMR-Hits': '7', 'Other': 'x'})
+
+        cached = cmr_cache.ResponseCache(self.path).get('https://cmr/search/granules.json?a=1')  # persisted
+        self.assertTrue(cached.fresh)
+        self.assertEqual(b'{"feed": {}}', cached.body)
+        self.assertEqual({'CMR-Hits': '7'}, cached.headers)
+
+    def test_ttl(self):
+        cache = cmr_cache.ResponseCache(self.path, ttls={'granules': 0})
+        cache.put('https://cmr/search/granules.json?a=1', '', b'{}', {})
+        cache.put('https://cmr/search/collections.json?a=1', '', b'{}', {})
+        self.assertFalse(cache.get('https://cmr/search/granules.json?a=1').fresh)
+        self.assertTrue(cache.get('https://cmr/search/collections.json?a=1').fresh)
+
+    def test_lru_eviction(self):
+        body = os.urandom(1000)  # does not compress
+        cache = cmr_cache.ResponseCache(self.path, max_bytes=3500)
+        for n in range(3):
+            cache.put(f'https://cmr/search/granules.json?n={n}', '', body, {})
+        cache.get('https://cmr/search/granules.json?n=0')  # now n=1 is the least recently used
+        cache.put('https://cmr/search/granules.json?n=3', '', body, {})
+
+        self.assertLessEqual(cache.size, 3500)
+        self.assertIsNone(cache.get('https://cmr/search/granules.json?n=1'))
+        self.assertIsNotNone(cache.get('https://cmr/search/granules.json?n=0'))
+
+    def test_get_page_uses_cache(self):
+        opendap_cmr.response_cache = cmr_cache.ResponseCache(self.path)
+        first = opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=self.standin.url)
+        requests_before = self.standin.requests
+        second = opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=self.standin.url)
+        self.assertEqual(0, self.standin.requests - requests_before)
+        self.assertEqual(first, second)
+        self.assertEqual(25, len(second))
+
+    def test_revalidate(self):
+        """Expired responses that CMR says have not changed are used, at the cost of two hits-only queries"""
+        opendap_cmr.response_cache = cmr_cache.ResponseCache(self.path, ttls={'granules': 0}, revalidate=True)
+        first = opendap_cmr.get_collection_granules('C2-POCLOUD', service=self.standin.url)
+        requests_before = self.standin.requests
+        second = opendap_cmr.get_collection_granules('C2-POCLOUD', service=self.standin.url)
+        self.assertEqual(2, self.standin.requests - requests_before)
+        self.assertEqual(1, opendap_cmr.response_cache.revalidated)
+        self.assertEqual(first, second)
+
+    def test_revalidate_once_per_query(self):
+        """The verdict for the first page of a query is used for the others"""
+        standin = CMRStandIn(collections=1, granules=250).start()
+        self.addCleanup(standin.stop)
+        url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        opendap_cmr.response_cache = cmr_cache.ResponseCache(self.path, ttls={'granules': 0}, revalidate=True)
+        first = opendap_cmr.process_request(url, opendap_cmr.collection_granules_dict, opendap_cmr.get_session(),
+                                            page_size=100)
+        requests_before = standin.requests
+        second = opendap_cmr.process_request(url, opendap_cmr.collection_granules_dict, opendap_cmr.get_session(),
+                                             page_size=100)
+        self.assertEqual(2, standin.requests - requests_before)  # not 2 for each of the 3 pages
+        self.assertEqual(3, opendap_cmr.response_cache.revalidated)
+        self.assertEqual(first, second)
+
+    def test_small_pages_are_not_revalidated(self):
+        """Getting a page_size=1 lookup again costs less than revalidating it"""
+        opendap_cmr.response_cache = cmr_cache.ResponseCache(self.path, ttls={'granules': 0}, revalidate=True)
+        first = opendap_cmr.collection_has_opendap('C2-POCLOUD', service=self.standin.url)
+        requests_before = self.standin.requests
+        second = opendap_cmr.collection_has_opendap('C2-POCLOUD', service=self.standin.url)
+        self.assertEqual(1, self.standin.requests - requests_before)
+        self.assertEqual(0, opendap_cmr.response_cache.revalidated)
+        self.assertEqual(first, second)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Test recording HTTP exchanges to a cassette and playing them back without the network.
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import requests
+
+import cmr_cassette
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cassette.jsonl.gz')
+        opendap_cmr.close_sessions()
+
+    def tearDown(self):
+        if opendap_cmr.cassette is not None:
+            opendap_cmr.cassette.close()
+        opendap_cmr.cassette = None
+        opendap_cmr.close_sessions()
+        shutil.rmtree(self.dir)
+
+    def use(self, cassette: cmr_cassette.Cassette):
+        opendap_cmr.close_sessions()
+        opendap_cmr.cassette = cassette
+
+    def test_record_replay(self):
+        """Paged searches (with CMR-Search-After) are played back without the server"""
+        with CMRStandIn(collections=1, granules=1200) as standin:
+            self.use(cmr_cassette.Cassette(self.path, 'record'))
+            recorded = opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=standin.url)
+            hits = opendap_cmr.get_collection_granule_hits('C1-POCLOUD', service=standin.url)
+            opendap_cmr.cassette.close()
+            requests_made = standin.requests
+        self.assertEqual(requests_made, opendap_cmr.cassette.recorded)
+
+        # The stand-in is stopped, so only the cassette can answer
+        self.use(cmr_cassette.Cassette(self.path, 'replay'))
+        self.assertEqual(recorded, opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=standin.url))
+        self.assertEqual(hits, opendap_cmr.get_collection_granule_hits('C1-POCLOUD', service=standin.url))
+        self.assertEqual(1200, len(recorded))
+        self.assertEqual(requests_made, opendap_cmr.cassette.played)
+
+        with self.assertRaises(cmr_cassette.CassetteMiss):
+            opendap_cmr.get_collection_granule_ids('C2-POCLOUD', service=standin.url)
+        self.assertEqual(1, opendap_cmr.cassette.missed)
+
+    def test_download(self):
+        """Streamed downloads can still be read when recorded, and are played back byte for byte"""
+        cassette = cmr_cassette.Cassette(self.path, 'record')
+        with CMRStandIn(collections=1, granules=3) as standin:
+            url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+            session = cassette.mount(requests.Session())
+            with session.get(url, stream=True) as r:
+                recorded = io.BytesIO()
+                shutil.copyfileobj(r.raw, recorded, length=1024)
+        cassette.close()
+        self.assertGreater(len(recorded.getvalue()), 0)
+
+        cassette = cmr_cassette.Cassette(self.path, 'replay', timing=1.0)
+        session = cassette.mount(requests.Session())
+        with session.get(url, stream=True) as r:
+            played = io.BytesIO()
+            shutil.copyfileobj(r.raw, played, length=1024)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(recorded.getvalue(), played.getvalue())
+        self.assertEqual(str(len(played.getvalue())), r.headers['Content-Length'])
+
+    def test_truncated_cassette(self):
+        """A cassette whose recording was cut short is read up to its last whole exchange"""
+        cassette = cmr_cassette.Cassette(self.path, 'record')
+        with CMRStandIn(collections=1, granules=3) as standin:
+            session = cassette.mount(requests.Session())
+            for ccid in ('C1-POCLOUD', 'C2-POCLOUD'):
+                session.get(f'{standin.url}/search/granules.json?collection_concept_id={ccid}')
+        cassette.close()
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-20])
+        self.assertLessEqual(len(cmr_cassette.Cassette.load(self.path)), 2)
+
+    def test_credentials_not_recorded(self):
+        """Cookies, tokens and OAuth codes are left out of the cassette, as is Earthdata Login"""
+        cassette = cmr_cassette.Cassette(self.path, 'record')
+        exchanges = (('https://data.example/granule.nc?code=abc123&state=1', 'https://data.example/?token=abc123', b''),
+                     ('https://urs.earthdata.nasa.gov/oauth/authorize?client_id=x',
+                      'https://data.example/login?code=abc123', b'{"access_token": "abc123"}'))
+        for url, location, body in exchanges:
+            r = requests.Response()
+            r.status_code, r.reason = 302, 'Found'
+            r.headers['Set-Cookie'] = 'session=abc123'
+            r.headers['Location'] = location
+            cassette.record(requests.Request('GET', url).prepare(), r, body, 0.1)
+        cassette.close()
+        self.assertEqual(1, cassette.recorded)
+
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b'abc123', gzip.decompress(f.read()))
+        exchange, = cmr_cassette.Cassette.load(self.path)
+        self.assertEqual('https://data.example/granule.nc?code=scrubbed&state=1', exchange['key'][1])
+        self.assertNotIn('Set-Cookie', exchange['response_headers'])
+
+        # A request with a different code is answered with the recorded response
+        cassette = cmr_cassette.Cassette(self.path, 'replay')
+        request = requests.Request('GET', 'https://data.example/granule.nc?code=xyz&state=1').prepare()
+        self.assertEqual(302, cassette.play(request)['status'])
+
+    def test_mode(self):
+        with self.assertRaises(ValueError):
+            cmr_cassette.Cassette(self.path, 'rewind')
+
+
+if __name__ == '__main__':
+    unittest.main()
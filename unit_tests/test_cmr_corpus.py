@@ -0,0 +1,86 @@
+"""
+Test the synthetic CMR corpus and the stand-in serving it.
+"""
+import json
+import unittest
+
+import opendap_cmr
+import temporal_plan
+from benchmarks.cmr_corpus import Corpus, granule_counts
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestCorpus(unittest.TestCase):
+
+    def test_distributions(self):
+        import random
+        self.assertEqual([100] * 5, granule_counts(5, 100, 'even', random.Random(0)))
+        for distribution in ('zipf', 'lognormal'):
+            counts = granule_counts(200, 1000, distribution, random.Random(0))
+            self.assertAlmostEqual(200 * 1000, sum(counts), delta=200)
+            self.assertGreater(max(counts), 10 * sorted(counts)[100])  # A few collections hold most of the granules
+            self.assertGreaterEqual(min(counts), 1)
+        with self.assertRaises(ValueError):
+            granule_counts(5, 100, 'uniform', random.Random(0))
+
+    def test_deterministic(self):
+        a = Corpus(providers=('POCLOUD', 'LPCLOUD'), collections=30, granules=500, distribution='zipf', seed=4)
+        b = Corpus(providers=('POCLOUD', 'LPCLOUD'), collections=30, granules=500, distribution='zipf', seed=4)
+        self.assertEqual(a.summary(), b.summary())
+        self.assertEqual(a.page('C3-LPCLOUD', 'umm_json', 0, 5), b.page('C3-LPCLOUD', 'umm_json', 0, 5))
+
+    def test_records(self):
+        """The granule records are read by the processors like CMR's"""
+        corpus = Corpus(collections=30, granules=10, seed=2)
+        for spec in corpus.collections('POCLOUD'):
+            items = json.loads(corpus.page(spec.ccid, 'umm_json'))
+            entries = json.loads(corpus.page(spec.ccid, 'json'))
+            urls = opendap_cmr.granule_ur_dict_2(items)
+            self.assertEqual(10, len(opendap_cmr.granule_time_dict(items)))
+            self.assertEqual(10, len(opendap_cmr.collection_granules_dict(entries)))
+            self.assertEqual(10, items['hits'])
+            if spec.kind == 'none':
+                self.assertEqual({}, urls)
+            else:
+                self.assertEqual(10, len(urls))
+                url = next(iter(urls.values()))[1]
+                self.assertEqual(spec.kind == 'cloud', url.startswith(f'https://opendap.earthdata.nasa.gov/'
+                                                                      f'collections/{spec.ccid}/granules/'))
+        self.assertGreater(len(corpus.granule_item('G10000001-POCLOUD')), 3000)  # About the size of a real item
+
+
+class TestStandInCorpus(unittest.TestCase):
+
+    def test_collections(self):
+        """Brutish and UMM-S searches find the collections the corpus says they should"""
+        corpus = Corpus(providers=('POCLOUD', 'LPCLOUD'), collections=40, granules=5, seed=7)
+        with CMRStandIn(corpus=corpus) as standin:
+            brutish = opendap_cmr.get_provider_opendap_collections_brutishly('POCLOUD', workers=8,
+                                                                            service=standin.url)
+            umm_s = opendap_cmr.get_provider_collections('POCLOUD', opendap=True, service=standin.url)
+            lp = opendap_cmr.get_provider_collections('LPCLOUD', service=standin.url)
+        specs = {spec.ccid: spec for spec in corpus.collections('POCLOUD')}
+        self.assertEqual(40, len(brutish))
+        self.assertEqual({ccid for ccid, spec in specs.items() if spec.kind == 'cloud'},
+                         {ccid for ccid, (cloud, url) in brutish.items() if cloud})
+        self.assertEqual({ccid for ccid, spec in specs.items() if spec.associated}, set(umm_s))
+        self.assertEqual(40, len(lp))
+
+    def test_granules(self):
+        """Paging, temporal searches and granule UR lookups use the corpus' granules"""
+        corpus = Corpus(collections=3, granules=4000, distribution='lognormal', years=1, seed=5)
+        spec = max(corpus.collections('POCLOUD'), key=lambda s: s.granules)
+        with CMRStandIn(corpus=corpus) as standin:
+            ids = opendap_cmr.get_collection_granule_ids(spec.ccid, service=standin.url)
+            windows = temporal_plan.plan_collection(spec.ccid, target=1000, service=standin.url)
+            name = corpus.granule_fields(ids[7])['name']
+            related = opendap_cmr.get_related_urls(spec.ccid, name, service=standin.url)
+        self.assertEqual(spec.granules, len(ids))
+        self.assertEqual(spec.granules, len(set(ids)))
+        self.assertGreaterEqual(sum(hits for _, _, hits in windows), spec.granules)
+        self.assertTrue(all(hits <= 1000 for _, _, hits in windows))
+        self.assertTrue(any(name in url for url in related.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Test the pluggable JSON decoder and decoding large pages in a process pool.
+"""
+import json
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import responses
+
+import opendap_cmr
+from unit_tests import CMR_Responses
+
+URL = 'http://testcmr.com/search/granules.json?collection_concept_id=C1'
+
+
+class TestCMRDecode(unittest.TestCase):
+
+    def setUp(self):
+        opendap_cmr.use_search_after = False
+        self.decoder = opendap_cmr.json_decoder
+
+    def tearDown(self):
+        opendap_cmr.use_search_after = True
+        opendap_cmr.json_decoder = self.decoder
+        opendap_cmr.offload_bytes = 1024 * 1024
+        if opendap_cmr.decode_pool:
+            opendap_cmr.decode_pool.shutdown()
+            opendap_cmr.decode_pool = None
+
+    def test_decode_and_process(self):
+        body = json.dumps(CMR_Responses.g1).encode()
+        entries_num, urls = opendap_cmr.decode_and_process(body, opendap_cmr.granule_data_url_dict)
+        self.assertEqual(1, entries_num)
+        self.assertEqual(opendap_cmr.granule_data_url_dict(CMR_Responses.g1), urls)
+
+        empty = json.dumps({'feed': {'entry': []}}).encode()
+        self.assertEqual((0, None), opendap_cmr.decode_and_process(empty, opendap_cmr.collection_granules_dict))
+
+    @responses.activate
+    def test_json_decoder(self):
+        """The decoder is given the body of the response, as bytes"""
+        bodies = []
+
+        def decoder(body: bytes):
+            bodies.append(body)
+            return json.loads(body)
+
+        opendap_cmr.json_decoder = decoder
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json=CMR_Responses.g2)
+        granules = opendap_cmr.process_request(URL, opendap_cmr.collection_granules_dict, opendap_cmr.get_session())
+        self.assertEqual(opendap_cmr.collection_granules_dict(CMR_Responses.g2), granules)
+        self.assertEqual(1, len(bodies))
+        self.assertIsInstance(bodies[0], bytes)
+
+    @responses.activate
+    def test_decode_pool(self):
+        opendap_cmr.decode_pool = ProcessPoolExecutor(max_workers=1)
+        opendap_cmr.offload_bytes = 0
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json=CMR_Responses.g3)
+        granules = opendap_cmr.process_request(URL, opendap_cmr.collection_granules_dict, opendap_cmr.get_session())
+        self.assertEqual(opendap_cmr.collection_granules_dict(CMR_Responses.g3), granules)
+
+    @responses.activate
+    def test_decode_pool_lambda(self):
+        """A processor that cannot be sent to another process runs in this one"""
+        opendap_cmr.decode_pool = ProcessPoolExecutor(max_workers=1)
+        opendap_cmr.offload_bytes = 0
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json=CMR_Responses.g2)
+        titles = opendap_cmr.process_request_list(URL, lambda j: [e['title'] for e in j['feed']['entry']],
+                                                  opendap_cmr.get_session())
+        self.assertEqual([CMR_Responses.g2['feed']['entry'][0]['title']], titles)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Test sharing concurrent identical CMR queries.
+"""
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cmr_flight
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_share(self):
+        flights = cmr_flight.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            release.wait()
+            return {'C1': ('title',)}
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(flights.do, 'key', slow) for _ in range(4)]
+            while flights.shared < 3:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual((1, 3), (flights.calls, flights.shared))
+        self.assertEqual(0, flights.in_flight)
+        self.assertTrue(all(result == {'C1': ('title',)} for result in results))
+        self.assertEqual(4, len({id(result) for result in results}))  # Each caller can change its own copy
+
+        # A call after the first is done is a new call
+        self.assertEqual({'C1': ('title',)}, flights.do('key', slow))
+        self.assertEqual(2, len(calls))
+
+    def test_error(self):
+        flights = cmr_flight.SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait()
+            e = opendap_cmr.CMRIncompleteResult('url', [(3, 3)], 10, opendap_cmr.CMRException(503, 'Unavailable'))
+            e.partial = ['G1', 'G2']
+            raise e
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(flights.do, 'key', fail) for _ in range(3)]
+            while flights.shared < 2:
+                time.sleep(0.01)
+            release.set()
+            errors = [future.exception() for future in futures]
+        self.assertEqual(0, flights.in_flight)
+        self.assertTrue(all(isinstance(e, opendap_cmr.CMRIncompleteResult) for e in errors))
+        self.assertEqual(3, len({id(e) for e in errors}))  # Each thread raises its own
+        self.assertEqual(3, len({id(e.partial) for e in errors}))
+        self.assertTrue(all(e.partial == ['G1', 'G2'] and e.missing == [(3, 3)] and e.message == errors[0].message
+                            for e in errors))
+
+
+class TestSharedRequests(unittest.TestCase):
+
+    def setUp(self):
+        self.flights = opendap_cmr.flights
+        opendap_cmr.flights = cmr_flight.SingleFlight()
+
+    def tearDown(self):
+        opendap_cmr.flights = self.flights
+
+    def test_first_last(self):
+        """Threads asking for the same collection's first and last granules share the requests"""
+        with CMRStandIn(collections=1, granules=10, latency=0.2) as standin:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                results = list(executor.map(
+                    lambda _: opendap_cmr.get_collection_granules_umm_first_last('C1-POCLOUD', service=standin.url),
+                    range(8)))
+        self.assertEqual(2, standin.requests)
+        self.assertEqual(2, opendap_cmr.flights.calls)
+        self.assertEqual(14, opendap_cmr.flights.shared)
+        self.assertTrue(all(result == results[0] for result in results))
+
+    def test_keyword_arguments(self):
+        """Calls that pass the same values by position and by keyword are the same query"""
+        with CMRStandIn(collections=1, granules=3, latency=0.2) as standin:
+            url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                a = executor.submit(opendap_cmr.process_request, url, opendap_cmr.collection_granules_dict,
+                                    opendap_cmr.get_session(), 10)
+                b = executor.submit(opendap_cmr.process_request, url, opendap_cmr.collection_granules_dict,
+                                    opendap_cmr.get_session(), page_size=10, page_num=0)
+                self.assertEqual(a.result(), b.result())
+        self.assertEqual(1, standin.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
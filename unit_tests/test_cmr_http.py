@@ -0,0 +1,83 @@
+"""
+Test the connection pools shared by the opendap_cmr sessions.
+"""
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import cmr_limiter
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestSharedPools(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections=32, granules=5, latency=0.01).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def setUp(self):
+        opendap_cmr.close_sessions()
+
+    def tearDown(self):
+        opendap_cmr.pool_size = 64
+        opendap_cmr.close_sessions()
+
+    def scan(self, workers: int):
+        check = partial(opendap_cmr.collection_has_opendap, service=self.standin.url)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(check, [f'C{n}-POCLOUD' for n in range(1, 33)]))
+
+    def test_sessions_share_pools(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(opendap_cmr.get_session()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(sessions[0], opendap_cmr.get_session())
+        self.assertIs(sessions[0].get_adapter('https://'), opendap_cmr.get_session().get_adapter('https://'))
+        self.assertIs(opendap_cmr.get_session(), opendap_cmr.get_session())
+
+    def test_reuse_across_executors(self):
+        """Connections opened by one executor's threads are used by the next executor"""
+        self.scan(8)
+        opened = opendap_cmr.pool_stats().opened
+        self.assertLessEqual(opened, 8)
+        self.scan(8)
+        stats = opendap_cmr.pool_stats()
+        self.assertEqual(opened, stats.opened)
+        self.assertEqual(64, stats.requests)
+        self.assertEqual(64 - opened, stats.reused)
+
+    def test_pool_size_limits_connections(self):
+        opendap_cmr.pool_size = 2
+        opendap_cmr.close_sessions()
+        self.assertEqual(32, len(self.scan(8)))
+        stats = opendap_cmr.pool_stats()
+        self.assertLessEqual(stats.opened, 2)
+        self.assertGreater(stats.waited, 0)
+
+    def test_set_pool_size(self):
+        opendap_cmr.set_pool_size(8)
+        self.assertEqual(8, opendap_cmr.pool_size)
+        opendap_cmr.limiter = cmr_limiter.AIMDLimiter(maximum=4)
+        try:
+            opendap_cmr.set_pool_size(8)
+        finally:
+            opendap_cmr.limiter = None
+        self.assertEqual(4, opendap_cmr.pool_size)
+
+    def test_close_sessions(self):
+        session = opendap_cmr.get_session()
+        self.scan(2)
+        opendap_cmr.close_sessions()
+        self.assertIsNot(session, opendap_cmr.get_session())
+        self.assertEqual(0, opendap_cmr.pool_stats().opened)
+
+
+if __name__ == '__main__':
+    unittest.main()
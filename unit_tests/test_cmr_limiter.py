@@ -0,0 +1,116 @@
+"""
+Test the adaptive concurrency limiter.
+"""
+import threading
+import time
+import unittest
+
+import cmr_limiter
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestAIMDLimiter(unittest.TestCase):
+
+    def test_slow_start(self):
+        limiter = cmr_limiter.AIMDLimiter(initial=4)
+        for _ in range(3):
+            limiter.release(limiter.acquire())
+        self.assertEqual(7, limiter.limit)
+
+    def test_one_cut_per_round(self):
+        """Throttled requests that were in flight together cut the limit once"""
+        limiter = cmr_limiter.AIMDLimiter(initial=8)
+        starts = [limiter.acquire() for _ in range(4)]
+        for start in starts:
+            limiter.release(start, throttled=True)
+        self.assertEqual(4, limiter.limit)
+        self.assertEqual(4, limiter.throttled)
+        self.assertFalse(limiter.slow_start)
+
+        # A request made after the cut can cut again
+        limiter.release(limiter.acquire(), throttled=True)
+        self.assertEqual(2, limiter.limit)
+
+    def test_additive_increase(self):
+        limiter = cmr_limiter.AIMDLimiter(initial=8)
+        limiter.release(limiter.acquire(), throttled=True)
+        for _ in range(4):
+            limiter.release(limiter.acquire())
+        self.assertAlmostEqual(4.92, limiter.limit, places=2)  # about one more for each limit's worth
+
+    def test_latency_cut(self):
+        """An average latency well above the lowest seen is treated as overload"""
+        limiter = cmr_limiter.AIMDLimiter(initial=8, maximum=8)
+        limiter.release(limiter.acquire())
+        limiter.release(limiter.acquire() - 1.0)  # A request that took a second
+        self.assertEqual(4, limiter.limit)
+
+    def test_mixed_sizes(self):
+        """Large pages are compared with large pages, not with the hits-only queries that are much faster"""
+        limiter = cmr_limiter.AIMDLimiter(initial=8, maximum=8)
+        hits = cmr_limiter.request_kind('https://cmr/search/granules.json?collection_concept_id=C1&page_size=0')
+        pages = cmr_limiter.request_kind('https://cmr/search/granules.json?collection_concept_id=C1&page_size=2000')
+        self.assertNotEqual(hits, pages)
+        for _ in range(10):
+            limiter.release(limiter.acquire() - 0.01, kind=hits)
+            limiter.release(limiter.acquire() - 0.5, kind=pages)
+        self.assertEqual(8, limiter.limit)
+
+        # A large page that takes much longer than the others is still a sign of overload
+        limiter.release(limiter.acquire() - 10.0, kind=pages)
+        self.assertEqual(4, limiter.limit)
+
+    def test_limits(self):
+        limiter = cmr_limiter.AIMDLimiter(initial=2, minimum=2, maximum=3)
+        for _ in range(3):
+            limiter.release(limiter.acquire())
+        self.assertEqual(3, limiter.limit)
+        limiter.release(limiter.acquire(), throttled=True)
+        self.assertEqual(2, limiter.limit)
+        self.assertEqual(3, limiter.peak)
+
+    def test_acquire_waits(self):
+        limiter = cmr_limiter.AIMDLimiter(initial=1)
+        start = limiter.acquire()
+        acquired = threading.Event()
+        thread = threading.Thread(target=lambda: (limiter.acquire(), acquired.set()))
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        limiter.release(start)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+
+
+class TestLimitedRequests(unittest.TestCase):
+
+    def tearDown(self):
+        opendap_cmr.limiter = None
+
+    def test_limiter_backs_off(self):
+        """The limiter keeps the requests below the stand-in's throttle"""
+        with CMRStandIn(collections=64, granules=1, latency=0.02, throttle=6) as standin:
+            opendap_cmr.limiter = cmr_limiter.AIMDLimiter(initial=16, latency_tolerance=100)
+
+            def check(ccid: str):
+                try:
+                    opendap_cmr.collection_has_opendap(ccid, service=standin.url)
+                except opendap_cmr.CMRException:
+                    pass
+
+            threads = [threading.Thread(target=check, args=(f'C{n}-POCLOUD',)) for n in range(1, 65)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            limiter = opendap_cmr.limiter
+            self.assertEqual(64 + limiter.throttled, limiter.requests)  # The throttled requests are retried
+            self.assertEqual(standin.throttled, limiter.throttled)
+            self.assertGreater(limiter.throttled, 0)
+            self.assertLess(limiter.limit, 16)
+            self.assertEqual(0, limiter.in_flight)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Test recording the requests made to CMR and exporting the metrics.
+"""
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import responses
+
+import cmr_limiter
+import cmr_metrics
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+URL = 'http://testcmr.com/search/granules.json?collection_concept_id=C1'
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_quantile(self):
+        histogram = cmr_metrics.Histogram((1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3, 10):
+            histogram.observe(value)
+        self.assertEqual([1, 2, 1, 1], histogram.counts)
+        self.assertEqual([(1, 1), (2, 3), (4, 4), ('+Inf', 5)], histogram.cumulative())
+        self.assertEqual(1.75, histogram.quantile(0.5))  # The middle of the three in the bucket (1, 2]
+        self.assertEqual(10, histogram.quantile(0.99))  # In the +Inf bucket, the largest value seen
+        self.assertEqual(0.0, cmr_metrics.Histogram((1,)).quantile(0.5))
+
+    def test_endpoint(self):
+        self.assertEqual('/search/granules.json', cmr_metrics.endpoint(URL))
+        self.assertEqual('bucket.s3.amazonaws.com',
+                         cmr_metrics.endpoint('https://bucket.s3.amazonaws.com/path/granule.nc.dmrpp'))
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        opendap_cmr.metrics = cmr_metrics.Metrics()
+        opendap_cmr.retry_backoff = 0
+        opendap_cmr.use_search_after = False
+
+    def tearDown(self):
+        opendap_cmr.metrics = None
+        opendap_cmr.retry_backoff = 0.5
+        opendap_cmr.use_search_after = True
+
+    @responses.activate
+    def test_requests_and_retries(self):
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', status=503, body='Service Unavailable')
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', body=requests.exceptions.ConnectionError())
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json={'feed': {'entry': [{'id': 'G1'}]}})
+        opendap_cmr.process_request_list(URL, opendap_cmr.collection_granules_list, opendap_cmr.get_session())
+
+        report = opendap_cmr.metrics.report()['endpoints']['/search/granules.json']
+        self.assertEqual(3, report['requests'])
+        self.assertEqual({'0': 1, '200': 1, '503': 1}, report['status'])
+        self.assertEqual(2, report['retries'])
+        self.assertEqual(len(b'Service Unavailable') + len(b'{"feed": {"entry": [{"id": "G1"}]}}'), report['bytes'])
+
+    def test_limiter_wait_not_counted(self):
+        """The latency recorded is the request's, not the time it waited for the limiter"""
+        opendap_cmr.limiter = cmr_limiter.AIMDLimiter(initial=1, maximum=1)
+        try:
+            with CMRStandIn(collections=4, granules=1, latency=0.1) as standin:
+                start = time.monotonic()
+                with ThreadPoolExecutor(max_workers=4) as executor:
+                    list(executor.map(lambda n: opendap_cmr.get_collection_granule_hits(f'C{n}-POCLOUD',
+                                                                                         service=standin.url),
+                                      range(1, 5)))
+                elapsed = time.monotonic() - start
+        finally:
+            opendap_cmr.limiter = None
+
+        seconds = opendap_cmr.metrics.report()['endpoints']['/search/granules.json']['seconds']
+        self.assertGreater(elapsed, 0.4)  # One request at a time
+        self.assertLess(seconds['max'], 0.25)
+
+    def test_write(self):
+        metrics = cmr_metrics.Metrics()
+        metrics.record('/search/granules.json', 200, 0.03, 2048)
+        metrics.record('/search/granules.json', 200, 0.2, 4096)
+        metrics.record('download', 404, 0.01)
+        metrics.retry('download')
+
+        with tempfile.TemporaryDirectory() as directory:
+            prefix = os.path.join(directory, 'metrics')
+            metrics.write(prefix)
+            with open(f'{prefix}.prom') as f:
+                prom = f.read().splitlines()
+            with open(f'{prefix}.json') as f:
+                report = json.load(f)
+
+        self.assertIn('pydmr_requests_total{endpoint="/search/granules.json",status="200"} 2', prom)
+        self.assertIn('pydmr_retries_total{endpoint="download"} 1', prom)
+        self.assertIn('pydmr_request_seconds_bucket{endpoint="/search/granules.json",le="0.05"} 1', prom)
+        self.assertIn('pydmr_request_seconds_bucket{endpoint="/search/granules.json",le="+Inf"} 2', prom)
+        self.assertIn('pydmr_response_bytes_sum{endpoint="/search/granules.json"} 6144.000000', prom)
+        self.assertEqual({'404': 1}, report['endpoints']['download']['status'])
+        self.assertEqual(6144, report['endpoints']['/search/granules.json']['bytes'])
+        self.assertEqual(0.23, report['endpoints']['/search/granules.json']['seconds']['total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
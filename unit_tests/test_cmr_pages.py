@@ -0,0 +1,154 @@
+"""
+Test the paging engine, cmr_pages(), in the opendap_cmr module.
+"""
+import time
+import unittest
+from unittest.mock import patch
+
+import responses
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestCMRPages(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections=1, granules=25).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def tearDown(self):
+        opendap_cmr.use_search_after = True
+
+    def granule_ids(self, page_size, num_responses=-1):
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        return opendap_cmr.process_request_list(url, opendap_cmr.collection_granules_list,
+                                                opendap_cmr.get_session(), num_responses, page_size=page_size)
+
+    def test_search_after(self):
+        """The stand-in rejects page_num with CMR-Search-After, so all the pages after the first use the header"""
+        ids = self.granule_ids(10)
+        self.assertEqual([f'G1{n:07d}-POCLOUD' for n in range(1, 26)], ids)
+
+    def test_page_num(self):
+        opendap_cmr.use_search_after = False
+        self.assertEqual(self.granule_ids(10), self.granule_ids(7))
+
+    def test_num_responses(self):
+        self.assertEqual(12, len(self.granule_ids(6, num_responses=12)))
+
+    def test_explicit_page(self):
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        pages = list(opendap_cmr.cmr_pages(url, opendap_cmr.get_session(), page_size=10, page_num=3))
+        self.assertEqual(1, len(pages))
+        self.assertEqual(['G10000021-POCLOUD', 'G10000025-POCLOUD'],
+                         [pages[0]['feed']['entry'][i]['id'] for i in (0, -1)])
+
+    def test_fan_out(self):
+        """With a fan-out, the pages after the first are sized using the hits and the result is the same"""
+        opendap_cmr.page_fan_out = 4
+        try:
+            requests_before = self.standin.requests
+            ids = self.granule_ids(10)
+            self.assertEqual(3, self.standin.requests - requests_before)  # 10, then 10 at 10 and 10 at 20
+            self.assertEqual(self.granule_ids(10, num_responses=12), ids[:12])
+        finally:
+            opendap_cmr.page_fan_out = 0
+        self.assertEqual(self.granule_ids(10), ids)
+
+    def test_page_blocks(self):
+        self.assertEqual([(2, 500), (2, 1000), (2, 2000), (9, 500)], opendap_cmr.page_blocks(500, 4500, 500))
+        self.assertEqual([(2, 500), (2, 1000), (5, 500)], opendap_cmr.page_blocks(500, 2100, 500))
+        self.assertEqual([(2, 10), (2, 20)], opendap_cmr.page_blocks(10, 35, 10))
+        self.assertEqual([], opendap_cmr.page_blocks(10, 10, 10))
+
+    def test_fan_out_many_pages(self):
+        with CMRStandIn(collections=1, granules=4500) as standin:
+            url = f'{standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+            pages = list(opendap_cmr.cmr_pages(url, opendap_cmr.get_session(), 500, fan_out=3))
+            self.assertEqual(5, standin.requests)
+            self.assertEqual([500, 500, 1000, 2000, 500], [len(page['feed']['entry']) for page in pages])
+            self.assertEqual('G10002001-POCLOUD', pages[3]['feed']['entry'][0]['id'])
+
+            opendap_cmr.page_fan_out = 3
+            try:
+                ids = opendap_cmr.process_request_list(url, opendap_cmr.collection_granules_list,
+                                                       opendap_cmr.get_session(), 2100, page_size=500)
+            finally:
+                opendap_cmr.page_fan_out = 0
+            self.assertEqual(2100, len(ids))
+            self.assertEqual('G10002100-POCLOUD', ids[-1])
+            self.assertEqual(9, standin.requests)  # 500, 500, 1000, then the page of 500 holding the last 100
+
+    def test_iter_collection_granules(self):
+        """The streamed granules are the same as the listed granules"""
+        granules = opendap_cmr.iter_collection_granules('C1-POCLOUD', service=self.standin.url)
+        self.assertNotIsInstance(granules, list)
+        self.assertEqual(self.granule_ids(500), list(granules))
+
+    def test_iter_collection_granules_pretty(self):
+        with patch('opendap_cmr.get_page', wraps=opendap_cmr.get_page) as get_page:
+            granules = list(opendap_cmr.iter_collection_granules('C1-POCLOUD', pretty=True, service=self.standin.url))
+        self.assertEqual(self.granule_ids(500), granules)
+        self.assertIn('&pretty=true', get_page.call_args[0][0])
+
+    def test_iter_collection_granules_dict(self):
+        granules = opendap_cmr.iter_collection_granules('C1-POCLOUD', num=2, descending=True,
+                                                        json_processor=opendap_cmr.collection_granules_dict,
+                                                        service=self.standin.url)
+        self.assertEqual([('G10000025-POCLOUD', ('granule_G10000025-POCLOUD', 'granule_G10000025-POCLOUD.nc')),
+                          ('G10000024-POCLOUD', ('granule_G10000024-POCLOUD', 'granule_G10000024-POCLOUD.nc'))],
+                         list(granules))
+
+    def test_iter_collection_granules_store(self):
+        """The compact processors yield the same (ID, values) pairs as the dict ones"""
+        granules = opendap_cmr.iter_collection_granules('C1-POCLOUD', num=2, descending=True,
+                                                        json_processor=opendap_cmr.collection_granules_store,
+                                                        service=self.standin.url)
+        self.assertEqual([('G10000025-POCLOUD', ('granule_G10000025-POCLOUD', 'granule_G10000025-POCLOUD.nc')),
+                          ('G10000024-POCLOUD', ('granule_G10000024-POCLOUD', 'granule_G10000024-POCLOUD.nc'))],
+                         list(granules))
+
+    def test_iter_request_prefetch(self):
+        """The next page is requested before the current page is used; abandoning the generator is safe"""
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        granules = opendap_cmr.iter_request(url, opendap_cmr.collection_granules_list, page_size=5)
+        requests_before = self.standin.requests
+        self.assertEqual('G10000001-POCLOUD', next(granules))
+        for _ in range(50):  # wait for the background thread
+            if self.standin.requests - requests_before >= 2:
+                break
+            time.sleep(0.01)
+        # One page is being used, one is waiting in the queue and, maybe, one is being requested
+        self.assertIn(self.standin.requests - requests_before, (2, 3))
+        granules.close()
+
+    def test_iter_request_error(self):
+        """Errors from the background thread are raised by the generator"""
+        url = f'{self.standin.url}/search/granules.json?collection_concept_id=C1-POCLOUD'
+        with self.assertRaises(opendap_cmr.CMRException):
+            list(opendap_cmr.iter_request(url, opendap_cmr.collection_granules_list, page_size=5000))
+
+    def test_get_collection_granule_hits(self):
+        self.assertEqual(25, opendap_cmr.get_collection_granule_hits('C1-POCLOUD', service=self.standin.url))
+
+    @responses.activate
+    def test_no_search_after_header(self):
+        """Without the CMR-Search-After header, page_num is incremented"""
+        responses.add(responses.GET, 'http://testcmr.com/search/granules.json?collection_concept_id=C1&page_num=1'
+                                     '&page_size=2', json={'feed': {'entry': [{'id': 'G1'}, {'id': 'G2'}]}})
+        responses.add(responses.GET, 'http://testcmr.com/search/granules.json?collection_concept_id=C1&page_num=2'
+                                     '&page_size=2', json={'feed': {'entry': [{'id': 'G3'}]}})
+
+        pages = list(opendap_cmr.cmr_pages('http://testcmr.com/search/granules.json?collection_concept_id=C1',
+                                           opendap_cmr.get_session(), page_size=2))
+        self.assertEqual(2, len(pages))
+        self.assertNotIn('CMR-Search-After', responses.calls[1].request.headers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""
+Test profiling a run in stages with cmr_profile.StageProfiler.
+"""
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import unittest
+
+import cmr_profile
+import opendap_cmr
+
+
+def busy(n=20000):
+    return sum(i * i for i in range(n))
+
+
+def functions(stats) -> set:
+    return {function for _, _, function in stats.stats}
+
+
+class TestStageProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        opendap_cmr.profiler = cmr_profile.StageProfiler()
+
+    def tearDown(self):
+        opendap_cmr.profiler = None
+        shutil.rmtree(self.dir)
+
+    def test_stages(self):
+        """Work done in trace spans that are stages is profiled in those stages, on any thread"""
+        def listing():
+            with opendap_cmr.trace_span('listing', provider='POCLOUD'):
+                busy()
+
+        def resolve():
+            with opendap_cmr.trace_span('resolve'):
+                with opendap_cmr.trace_span('cmr'):  # Not a stage
+                    busy()
+
+        profiler = opendap_cmr.profiler
+        profiler.start()
+        listing()
+        thread = threading.Thread(target=resolve)
+        thread.start()
+        thread.join()
+        profiler.stop()
+
+        self.assertIn('busy', functions(profiler.stats('listing')))
+        self.assertNotIn('busy', functions(profiler.stats('main')))
+        if profiler.stats('resolve') is not None:  # Python 3.12+ profiles only one thread at a time
+            self.assertIn('busy', functions(profiler.stats('resolve')))
+        self.assertIsNone(profiler.stats('download'))
+
+    def test_nested(self):
+        """A span in the stage it is already in, or that is not a stage, does not end the stage"""
+        profiler = opendap_cmr.profiler
+        profiler.start()
+        with opendap_cmr.trace_span('window'):
+            with opendap_cmr.trace_span('search'):
+                busy()
+            with opendap_cmr.trace_span('granule'):
+                busy(10)
+            busy(30)
+        profiler.stop()
+        self.assertIn('busy', functions(profiler.stats('listing')))
+        self.assertNotIn('busy', functions(profiler.stats('main')))
+
+    def test_write(self):
+        profiler = opendap_cmr.profiler
+        profiler.start()
+        with opendap_cmr.trace_span('download'):
+            busy()
+        profiler.stop()
+        prefix = os.path.join(self.dir, 'profile')
+        paths = profiler.write(prefix)
+        self.assertEqual([f'{prefix}-download.prof', f'{prefix}-main.prof'], paths)
+        self.assertIn('busy', functions(pstats.Stats(paths[0])))
+        summary = profiler.summary(top=5)
+        self.assertIn('download:', summary)
+        self.assertIn('test_cmr_profile.py', summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
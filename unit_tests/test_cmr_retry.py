@@ -0,0 +1,127 @@
+"""
+Test retrying failed pages and reporting incomplete results.
+"""
+import email.utils
+import time
+import unittest
+from unittest.mock import patch
+
+import requests
+import responses
+
+import opendap_cmr
+
+URL = 'http://testcmr.com/search/granules.json?collection_concept_id=C1'
+
+
+def page(first: int, count: int) -> dict:
+    return {'feed': {'entry': [{'id': f'G{n}', 'title': f'granule_{n}'} for n in range(first, first + count)]}}
+
+
+class TestCMRRetry(unittest.TestCase):
+
+    def setUp(self):
+        opendap_cmr.retry_backoff = 0
+        opendap_cmr.use_search_after = False
+        errlog = patch('errLog.output_errlog')  # The incomplete results are logged; keep them out of logs/
+        self.errlog = errlog.start()
+        self.addCleanup(errlog.stop)
+
+    def tearDown(self):
+        opendap_cmr.retry_backoff = 0.5
+        opendap_cmr.max_retries = 4
+        opendap_cmr.use_search_after = True
+        opendap_cmr.page_fan_out = 0
+
+    def test_retry_delay(self):
+        self.assertEqual(3, opendap_cmr.retry_delay(0, '3'))
+        self.assertEqual(opendap_cmr.RETRY_MAX_DELAY, opendap_cmr.retry_delay(0, '3600'))
+        self.assertEqual(0, opendap_cmr.retry_delay(0, email.utils.formatdate(time.time() - 60, usegmt=True)))
+        later = opendap_cmr.retry_delay(0, email.utils.formatdate(time.time() + 10, usegmt=True))
+        self.assertTrue(8 < later <= 10)
+
+        opendap_cmr.retry_backoff = 0.5
+        for attempt in range(4):
+            self.assertTrue(0 <= opendap_cmr.retry_delay(attempt) <= 0.5 * 2 ** attempt)
+        self.assertTrue(0 <= opendap_cmr.retry_delay(0, 'not a date') <= 0.5)
+
+    def test_page_ranges(self):
+        self.assertEqual([(2, 4), (7, 7)], opendap_cmr.page_ranges([2, 3, 4, 7]))
+        self.assertEqual([], opendap_cmr.page_ranges([]))
+
+    @responses.activate
+    def test_retry_server_error(self):
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', status=503, body='Service Unavailable')
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', status=429, json={'errors': ['Slow down']},
+                      headers={'Retry-After': '0'})
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json=page(1, 3))
+        self.assertEqual(['G1', 'G2', 'G3'], opendap_cmr.process_request_list(URL, opendap_cmr.collection_granules_list,
+                                                                            opendap_cmr.get_session()))
+        self.assertEqual(3, len(responses.calls))
+
+    @responses.activate
+    def test_retry_connection_error(self):
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', body=requests.exceptions.ConnectionError())
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', body='{"feed": {"entr')  # cut short
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', json=page(1, 3))
+        self.assertEqual(3, len(opendap_cmr.process_request_list(URL, opendap_cmr.collection_granules_list,
+                                                                 opendap_cmr.get_session())))
+
+    @responses.activate
+    def test_no_retry_client_error(self):
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', status=400,
+                      json={'errors': ['Collection-concept-id [C1] is not valid']})
+        with self.assertRaises(opendap_cmr.CMRException) as cm:
+            opendap_cmr.process_request_list(URL, opendap_cmr.collection_granules_list, opendap_cmr.get_session())
+        self.assertNotIsInstance(cm.exception, opendap_cmr.CMRIncompleteResult)
+        self.assertEqual(400, cm.exception.status)
+        self.assertEqual(1, len(responses.calls))
+
+    @responses.activate
+    def test_incomplete_walk(self):
+        """A page that fails every retry stops the walk; the missing pages and the partial result are reported"""
+        opendap_cmr.max_retries = 2
+        for n in (1, 2):
+            responses.add(responses.GET, f'{URL}&page_num={n}&page_size=10', json=page(n * 10 - 9, 10),
+                          headers={'CMR-Hits': '45'})
+        responses.add(responses.GET, f'{URL}&page_num=3&page_size=10', status=502, body='Bad Gateway')
+
+        with self.assertRaises(opendap_cmr.CMRIncompleteResult) as cm:
+            opendap_cmr.process_request_list(URL, opendap_cmr.collection_granules_list, opendap_cmr.get_session())
+        self.assertEqual([(3, 5)], cm.exception.missing)
+        self.assertEqual(502, cm.exception.status)
+        self.assertEqual(20, len(cm.exception.partial))
+        self.assertIn('missing pages 3-5 (page size 10)', str(cm.exception))
+        self.assertIn('missing pages 3-5', self.errlog.call_args[0][0])
+        self.assertEqual(5, len(responses.calls))  # pages 1, 2 and three tries of page 3
+
+    @responses.activate
+    def test_incomplete_fan_out(self):
+        """With concurrent pages, the other pages are still read"""
+        opendap_cmr.max_retries = 1
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=2000', json=page(1, 2000),
+                      headers={'CMR-Hits': '9000'})
+        for n in (2, 4, 5):
+            responses.add(responses.GET, f'{URL}&page_num={n}&page_size=2000', json=page(n * 2000 - 1999, 2000))
+        responses.add(responses.GET, f'{URL}&page_num=3&page_size=2000', body=requests.exceptions.ConnectionError())
+
+        pages = []
+        with self.assertRaises(opendap_cmr.CMRIncompleteResult) as cm:
+            for json_resp in opendap_cmr.cmr_pages(URL, opendap_cmr.get_session(), page_size=2000, fan_out=4):
+                pages.append(json_resp)
+        self.assertEqual([(3, 3)], cm.exception.missing)
+        self.assertEqual(['G1', 'G2001', 'G6001', 'G8001'], [p['feed']['entry'][0]['id'] for p in pages])
+
+    @responses.activate
+    def test_incomplete_first_page(self):
+        opendap_cmr.max_retries = 0
+        responses.add(responses.GET, f'{URL}&page_num=1&page_size=10', body=requests.exceptions.ConnectionError())
+        with self.assertRaises(opendap_cmr.CMRIncompleteResult) as cm:
+            opendap_cmr.process_request(URL, opendap_cmr.collection_granules_dict, opendap_cmr.get_session())
+        self.assertEqual([(1, -1)], cm.exception.missing)
+        self.assertEqual({}, cm.exception.partial)
+        self.assertIn('missing pages 1-end', str(cm.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Test the sampling profiler and its collapsed stack files.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import cmr_sampler
+
+
+def spin(stop: threading.Event):
+    while not stop.is_set():
+        sum(i for i in range(1000))
+
+
+class TestSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.dir, 'samples')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_sample_threads(self):
+        """The worker threads' stacks are sampled and written, now and then and when stopped"""
+        stop = threading.Event()
+        worker = threading.Thread(target=spin, args=(stop,), name='worker_1')
+        worker.start()
+        sampler = cmr_sampler.Sampler(self.prefix, rate=200, flush=0.05).start()
+        time.sleep(0.3)
+        self.assertTrue(os.path.exists(f'{self.prefix}.collapsed'))  # Written before it was stopped
+        paths = sampler.stop()
+        stop.set()
+        worker.join()
+
+        self.assertEqual([f'{self.prefix}.collapsed', f'{self.prefix}-recent.collapsed'], paths)
+        counts = cmr_sampler.load(paths[0])
+        spinning = [stack for stack in counts if stack.startswith('worker;') and 'spin (test_cmr_sampler.py' in stack]
+        self.assertTrue(spinning)
+        self.assertFalse([stack for stack in counts if stack.startswith('cmr_sampler')])
+        self.assertGreater(sampler.samples, 10)
+        self.assertEqual(sum(counts.values()), sum(sampler.counts.values()))
+        # The worker's leaf is spin() or, in older Pythons, the generator expression in it
+        self.assertIn(f'{sum(counts.values())} samples', cmr_sampler.report(counts, top=50))
+        self.assertIn('(test_cmr_sampler.py:', cmr_sampler.report(counts, top=50))
+
+    def test_collapse(self):
+        def inner():
+            import sys
+            return cmr_sampler.collapse(sys._getframe(), 'MainThread')
+        stack = inner()
+        self.assertTrue(stack.startswith('MainThread;'))
+        # Before Python 3.11, there is no qualified name, just 'inner'
+        self.assertTrue(stack.endswith(f'inner (test_cmr_sampler.py:{inner.__code__.co_firstlineno})'), stack)
+        self.assertEqual('ThreadPoolExecutor-2', cmr_sampler.thread_group('ThreadPoolExecutor-2_13'))
+
+
+if __name__ == '__main__':
+    unittest.main()
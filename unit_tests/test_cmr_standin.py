@@ -0,0 +1,46 @@
+"""
+Test the CMR stand-in's realistic entries and injected errors, which the benchmarks rely on.
+"""
+import unittest
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestCMRStandIn(unittest.TestCase):
+
+    def setUp(self):
+        opendap_cmr.retry_backoff = 0
+
+    def tearDown(self):
+        opendap_cmr.retry_backoff = 0.5
+
+    def test_realistic(self):
+        """The realistic entries are read like the small ones, and like CMR's"""
+        with CMRStandIn(collections=1, granules=25, realistic=True) as standin:
+            ids = opendap_cmr.get_collection_granule_ids('C1-POCLOUD', service=standin.url)
+            first_last = opendap_cmr.get_collection_granules_umm_first_last('C1-POCLOUD', service=standin.url)
+            times = opendap_cmr.process_request(f'{standin.url}/search/granules.umm_json?collection_concept_id='
+                                                f'C1-POCLOUD', opendap_cmr.granule_time_dict,
+                                                opendap_cmr.get_session(), page_size=2)
+        self.assertEqual([f'G1{n:07d}-POCLOUD' for n in range(1, 26)], ids)
+        self.assertEqual(('granule_G10000025-POCLOUD',
+                          'https://opendap.earthdata.nasa.gov/collections/C1-POCLOUD/granules/granule_G10000025-POCLOUD'),
+                         first_last['G10000025-POCLOUD'])
+        self.assertEqual(('2000-01-02T00:00:00.000Z', '2000-01-02T01:00:00.000Z'), times['G10000002-POCLOUD'])
+        self.assertGreater(standin.bytes_sent / 25, 3000)  # About the size of a real entry
+
+    def test_injected_errors(self):
+        """Errors and cut-short responses are retried"""
+        with CMRStandIn(collections=1, granules=300, error_rate=0.3, truncate_rate=0.2, seed=3) as standin:
+            ids = opendap_cmr.process_request_list(f'{standin.url}/search/granules.json?collection_concept_id='
+                                                   f'C1-POCLOUD', opendap_cmr.collection_granules_list,
+                                                   opendap_cmr.get_session(), page_size=10)
+        self.assertEqual(300, len(ids))
+        self.assertGreater(standin.errors, 0)
+        self.assertGreater(standin.truncated, 0)
+        self.assertLessEqual(30 + standin.errors + standin.truncated, standin.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""
+Test tracing spans and the trace analyzer.
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+import cmr_trace
+import opendap_cmr
+
+
+def span(span_id: int, parent, name: str, start: float, duration: float, **attrs) -> dict:
+    return {'id': span_id, 'parent': parent, 'name': name, 'start': start, 'duration': duration,
+            'end': start + duration, 'thread': 'MainThread', 'attrs': attrs}
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'trace.jsonl')
+
+    def tearDown(self):
+        opendap_cmr.tracer = None
+        self.directory.cleanup()
+
+    def test_nesting(self):
+        tracer = cmr_trace.Tracer(self.path)
+        with tracer.span('ccid', ccid='C1-POCLOUD') as ccid:
+            with tracer.span('granule', url='s3://b/g.dmrpp') as granule:
+                with tracer.span('download') as download:
+                    download.set(size=10)
+            worker = threading.Thread(target=lambda: tracer.span('window', ccid).__enter__().__exit__(None, None, None))
+            worker.start()
+            worker.join()
+            with self.assertRaises(ValueError):
+                with tracer.span('upload'):
+                    raise ValueError('no bucket')
+        tracer.close()
+
+        spans = {s['name']: s for s in cmr_trace.load(self.path)}
+        self.assertEqual(['download', 'granule', 'window', 'upload', 'ccid'], [s['name'] for s in
+                                                                           cmr_trace.load(self.path)])
+        self.assertIsNone(spans['ccid']['parent'])
+        self.assertEqual(ccid.id, spans['granule']['parent'])
+        self.assertEqual(granule.id, spans['download']['parent'])
+        self.assertEqual(ccid.id, spans['window']['parent'])  # Given to the worker thread
+        self.assertEqual(ccid.id, spans['upload']['parent'])
+        self.assertEqual({'size': 10}, spans['download']['attrs'])
+        self.assertEqual('ValueError: no bucket', spans['upload']['attrs']['error'])
+        self.assertTrue(spans['ccid']['duration'] >= spans['granule']['duration'] >= spans['download']['duration'])
+
+    def test_trace_span(self):
+        """trace_span() does nothing without a tracer; with one, CMR requests are spans too"""
+        with opendap_cmr.trace_span('granule') as nothing:
+            self.assertIsNone(nothing)
+        opendap_cmr.tracer = cmr_trace.Tracer(self.path)
+        with opendap_cmr.trace_span('granule', url='u') as granule:
+            self.assertIs(granule, opendap_cmr.trace_parent())
+        opendap_cmr.tracer.close()
+        self.assertEqual(['granule'], [s['name'] for s in cmr_trace.load(self.path)])
+
+
+class TestAnalyzer(unittest.TestCase):
+
+    # A run with two granules processed one after the other, while a window search ran beside them
+    spans = [span(1, None, 'run', 0.0, 10.0),
+             span(2, 1, 'window', 0.0, 3.0, window='2000'),
+             span(3, 1, 'granule', 0.5, 4.0, url='g1'),
+             span(4, 3, 'download', 0.5, 1.0),
+             span(5, 3, 'upload', 1.5, 3.0),
+             span(6, 1, 'granule', 4.5, 5.0, url='g2'),
+             span(7, 6, 'download', 4.5, 4.5),
+             span(8, 6, 'upload', 9.0, 0.5)]
+
+    def test_stage_stats(self):
+        stats = cmr_trace.stage_stats(self.spans)
+        self.assertEqual((2, 5.5, 1.0, 4.5, 4.5, 4.5), stats['download'])
+        self.assertEqual(1, stats['run'][0])
+
+    def test_critical_path(self):
+        path = [(depth, s['id']) for depth, s in cmr_trace.critical_path(self.spans)]
+        self.assertEqual([(0, 1), (1, 3), (2, 4), (2, 5), (1, 6), (2, 7), (2, 8)], path)  # not the window
+
+    def test_slowest(self):
+        slowest = cmr_trace.slowest(self.spans, n=1)
+        self.assertEqual(1, len(slowest))
+        self.assertEqual('g2', slowest[0][0]['attrs']['url'])
+        self.assertEqual({'download': 4.5, 'upload': 0.5}, slowest[0][1])
+        self.assertIn('granule g2  (download 4.500s, upload 0.500s)', cmr_trace.report(self.spans))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,7 @@
 import unittest
 from unittest.mock import patch  # For mocking external dependencies
 
-import cmr
+import opendap_cmr as cmr
 
 
 # Assuming process_request and get_session are defined elsewhere
@@ -26,8 +26,8 @@ def mock_granule_ur_dict_2(data):
     return data[1]  # Assuming the URL is the second element in the granule data
 
 
-@patch('cmr.process_request', side_effect=mock_process_request)
-@patch('cmr.get_session', return_value=mock_get_session)
+@patch('opendap_cmr.process_request', side_effect=mock_process_request)
+@patch('opendap_cmr.get_session', return_value=mock_get_session)
 class TestCollectionHasOpendap(unittest.TestCase):
 
     def test_collection_has_opendap_success(self, mock_get_session, mock_process_request):
@@ -0,0 +1,57 @@
+"""
+Test find_collections.py, run against the CMR stand-in.
+"""
+import contextlib
+import csv
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import find_collections
+import opendap_cmr
+from benchmarks.cmr_corpus import Corpus
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestFindCollections(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.dir = tempfile.mkdtemp()
+        os.chdir(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+        opendap_cmr.pool_size = 64
+        opendap_cmr.close_sessions()
+
+    def test_main(self):
+        """Each provider's counts are printed and written to the stats and cloud files"""
+        corpus = Corpus(providers=('POCLOUD', 'LPCLOUD'), collections=20, granules=3, seed=3)
+        stdout = io.StringIO()
+        with CMRStandIn(corpus=corpus) as standin:
+            argv = ['find_collections.py', '-B', '-c', '-w', '8', '-S', 'stats', '--service', standin.url,
+                    'POCLOUD', 'LPCLOUD']
+            with patch.object(sys, 'argv', argv), contextlib.redirect_stdout(stdout):
+                find_collections.main()
+        self.assertEqual(8, opendap_cmr.pool_size)  # One connection for each worker
+
+        with open('stats.csv') as f:
+            rows = {row[0]: row for row in csv.reader(f)}
+        for provider in ('POCLOUD', 'LPCLOUD'):
+            specs = list(corpus.collections(provider))
+            cloud = sum(1 for spec in specs if spec.kind == 'cloud')
+            self.assertEqual([str(len(specs)), str(cloud)], rows[provider][1:3])
+            self.assertIn(f"Number of {provider} OPeNDAP-enabled cloud collections found: {cloud}, out of "
+                          f"{len(specs)}", stdout.getvalue())
+            with open(f'{provider}-cloud.csv') as f:
+                self.assertEqual(cloud, len(f.readlines()) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -11,7 +11,7 @@ AI-written unit test. Written using Gemini, 7/2/24
 import unittest
 from unittest.mock import patch  # For mocking external dependencies
 
-import cmr
+import opendap_cmr as cmr
 
 
 # Assuming process_request, get_session, and collection_has_opendap are defined elsewhere
@@ -21,7 +21,7 @@ def mock_process_request(url, data_store, session, page_size):
             'collection2': {'granule_urls2': ('title2', 'http://not_opendap.com')}}
 
 
-def mock_collection_has_opendap(ccid):
+def mock_collection_has_opendap(ccid, service='cmr.earthdata.nasa.gov'):
     # Simulate successful checks for OPeNDAP URLs
     if ccid == 'collection1':
         return ccid, True, 'cloud_storage'  # Simulate cloud storage info
@@ -29,11 +29,11 @@ def mock_collection_has_opendap(ccid):
         return ccid, False, 'non-cloud'  # Simulate non-cloud storage info
 
 
-@patch('cmr.process_request', mock_process_request)  # Patch at module level
-@patch('cmr.collection_has_opendap', mock_collection_has_opendap)
+@patch('opendap_cmr.process_request', mock_process_request)  # Patch at module level
+@patch('opendap_cmr.collection_has_opendap', mock_collection_has_opendap)
 class TestGetProviderOpendapCollectionsBrutishly(unittest.TestCase):
 
-    @patch('cmr.get_session')  # Patch within the test method for session
+    @patch('opendap_cmr.get_session')  # Patch within the test method for session
     def test_get_provider_opendap_collections_brutishly_success(self, mock_session):
         """
         Test successful retrieval of OPeNDAP collections for a provider.
@@ -47,7 +47,7 @@ class TestGetProviderOpendapCollectionsBrutishly(unittest.TestCase):
         """
         Test case where no collections have OPeNDAP URLs.
         """
-        with patch('cmr.collection_has_opendap', return_value=("no_ccid", False, None)):
+        with patch('opendap_cmr.collection_has_opendap', return_value=("no_ccid", False, None)):
             provider_id = 'NO_OPENDAP_PROVIDER'
             results = cmr.get_provider_opendap_collections_brutishly(provider_id)
 
@@ -57,7 +57,7 @@ class TestGetProviderOpendapCollectionsBrutishly(unittest.TestCase):
         """
         Test case where process_request raises an exception.
         """
-        with patch('cmr.process_request', side_effect=Exception('Request failed')):
+        with patch('opendap_cmr.process_request', side_effect=Exception('Request failed')):
             provider_id = 'ANY_PROVIDER'
             with self.assertRaises(Exception):
                 cmr.get_provider_opendap_collections_brutishly(provider_id)
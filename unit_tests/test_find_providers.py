@@ -0,0 +1,54 @@
+"""
+Test searching many providers at once for OPeNDAP collections.
+"""
+import unittest
+from unittest.mock import patch
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+
+
+class TestProvidersConcurrently(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections={'POCLOUD': 40, 'GES_DISC': 3, 'LPDAAC': 0}, granules=1,
+                                 latency=0.01).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def test_providers(self):
+        results = list(opendap_cmr.iter_providers_opendap_collections(['POCLOUD', 'GES_DISC', 'LPDAAC'], workers=8,
+                                                                      service=self.standin.url))
+        by_provider = {provider: (entries, error) for provider, entries, _, error in results}
+        self.assertEqual({'POCLOUD', 'GES_DISC', 'LPDAAC'}, set(by_provider))
+
+        entries, error = by_provider['POCLOUD']
+        self.assertIsNone(error)
+        self.assertEqual([f'C{n}-POCLOUD' for n in range(1, 41)], list(entries))  # In the order CMR listed them
+        self.assertEqual(opendap_cmr.get_provider_opendap_collections_brutishly('POCLOUD', service=self.standin.url),
+                         entries)
+        self.assertEqual(({}, None), by_provider['LPDAAC'])
+
+    def test_errors(self):
+        """A failed collection check is reported with the provider; the other providers are not affected"""
+        def check(ccid: str, service: str):
+            if ccid == 'C2-GES_DISC':
+                raise opendap_cmr.CMRException(400, 'Bad collection')
+            return ccid, False, ''
+
+        with patch('opendap_cmr.collection_has_opendap', check):
+            results = {provider: (entries, error) for provider, entries, _, error in
+                       opendap_cmr.iter_providers_opendap_collections(['GES_DISC', 'POCLOUD'], workers=4,
+                                                                      service=self.standin.url)}
+        entries, error = results['GES_DISC']
+        self.assertEqual(['C1-GES_DISC', 'C3-GES_DISC'], list(entries))
+        self.assertEqual(400, error.status)
+        self.assertEqual(40, len(results['POCLOUD'][0]))
+        self.assertIsNone(results['POCLOUD'][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
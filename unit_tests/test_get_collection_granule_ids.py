@@ -1,13 +1,13 @@
 import unittest
 from unittest.mock import patch, MagicMock
-import cmr
+import opendap_cmr as cmr
 
 
 # Unit test class
 class TestGetCollectionGranuleIds(unittest.TestCase):
 
-    @patch('cmr.process_request_list')
-    @patch('cmr.get_session')
+    @patch('opendap_cmr.process_request_list')
+    @patch('opendap_cmr.get_session')
     def test_valid_response(self, mock_get_session, mock_process_request_list):
         """Test with a valid response."""
         mock_session = MagicMock()
@@ -26,8 +26,8 @@ class TestGetCollectionGranuleIds(unittest.TestCase):
         )
         self.assertEqual(result, ["G123", "G124"])
 
-    @patch('cmr.process_request_list')
-    @patch('cmr.get_session')
+    @patch('opendap_cmr.process_request_list')
+    @patch('opendap_cmr.get_session')
     def test_limit_num_results(self, mock_get_session, mock_process_request_list):
         """Test with a limit on the number of results."""
         mock_session = MagicMock()
@@ -47,8 +47,8 @@ class TestGetCollectionGranuleIds(unittest.TestCase):
         )
         self.assertEqual(result, ["G123"])
 
-    @patch('cmr.process_request_list')
-    @patch('cmr.get_session')
+    @patch('opendap_cmr.process_request_list')
+    @patch('opendap_cmr.get_session')
     def test_descending_order(self, mock_get_session, mock_process_request_list):
         """Test with descending order."""
         mock_session = MagicMock()
@@ -67,8 +67,8 @@ class TestGetCollectionGranuleIds(unittest.TestCase):
         )
         self.assertEqual(result, ["G124", "G123"])
 
-    @patch('cmr.process_request_list')
-    @patch('cmr.get_session')
+    @patch('opendap_cmr.process_request_list')
+    @patch('opendap_cmr.get_session')
     def test_custom_service_url(self, mock_get_session, mock_process_request_list):
         """Test with a custom service URL."""
         mock_session = MagicMock()
@@ -88,8 +88,8 @@ class TestGetCollectionGranuleIds(unittest.TestCase):
         )
         self.assertEqual(result, ["G123", "G124"])
 
-    @patch('cmr.process_request_list')
-    @patch('cmr.get_session')
+    @patch('opendap_cmr.process_request_list')
+    @patch('opendap_cmr.get_session')
     def test_no_results(self, mock_get_session, mock_process_request_list):
         """Test when no granules are returned."""
         mock_session = MagicMock()
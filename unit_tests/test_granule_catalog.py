@@ -0,0 +1,90 @@
+"""
+Test the granule catalog, using the CMR stand-in.
+"""
+import os
+import tempfile
+import unittest
+
+import granule_catalog
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+from unit_tests import CMR_Responses
+
+
+class TestGranuleCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.standin = CMRStandIn(collections=1, granules=2500).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.catalog = granule_catalog.GranuleCatalog(os.path.join(self.tmp.name, 'catalog.sqlite'),
+                                                      service=self.standin.url)
+
+    def tearDown(self):
+        opendap_cmr.catalog = None
+        self.catalog.close()
+        self.tmp.cleanup()
+        self.standin.stop()
+
+    def test_catalog_records(self):
+        granule, urls = granule_catalog.catalog_records(CMR_Responses.g1)[0]
+        self.assertEqual('G2081588885-POCLOUD', granule[0])
+        self.assertEqual('ascat_20121029_010001_metopb_00588_eps_o_250_2101_ovw.l2', granule[1])
+        self.assertEqual(4, granule[3])
+        self.assertEqual(len(CMR_Responses.g1['items'][0]['umm']['RelatedUrls']), len(urls))
+        self.assertEqual([], granule_catalog.catalog_records({'feed': {}}))
+
+    def test_url_kind(self):
+        self.assertEqual('s3', granule_catalog.url_kind({'URL': 's3://bucket/granule.nc', 'Type': 'GET DATA'}))
+        self.assertEqual('https', granule_catalog.url_kind({'URL': 'https://host/granule.nc', 'Type': 'GET DATA'}))
+        self.assertEqual('opendap', granule_catalog.url_kind({'URL': 'https://opendap.host/granule',
+                                                              'Type': 'USE SERVICE API', 'Subtype': 'OPENDAP DATA'}))
+
+    def test_sync(self):
+        self.assertEqual((2500, 0), self.catalog.sync('C1-POCLOUD'))
+        self.assertEqual(2500, self.catalog.granule_count('C1-POCLOUD'))
+        self.assertEqual('G10000001-POCLOUD', self.catalog.granule_ids('C1-POCLOUD')[0])
+        self.assertEqual('G10002500-POCLOUD', self.catalog.granule_ids('C1-POCLOUD', descending=True)[0])
+        self.assertEqual(['s3://pocloud-protected/SYNTHETIC/granule_G10000001-POCLOUD.nc'],
+                         self.catalog.urls('G10000001-POCLOUD', kind='s3'))
+
+    def test_incremental_sync(self):
+        """The second sync asks only for the changes, one request for each"""
+        self.catalog.sync('C1-POCLOUD')
+        self.standin.revise_granule('G10000007-POCLOUD')
+        self.standin.delete_granule('G10000009-POCLOUD')
+        requests_before = self.standin.requests
+        self.assertEqual((1, 1), self.catalog.sync('C1-POCLOUD'))
+        self.assertEqual(2, self.standin.requests - requests_before)
+        self.assertEqual(2499, self.catalog.granule_count('C1-POCLOUD'))
+        self.assertEqual([], self.catalog.urls('G10000009-POCLOUD'))
+
+    def test_many_deletions(self):
+        """The deleted granules are found by parent_collection_id, a page at a time"""
+        self.catalog.sync('C1-POCLOUD')
+        for number in range(1, 2002):
+            self.standin.delete_granule(f'G1{number:07}-POCLOUD')
+        self.assertEqual((0, 2001), self.catalog.sync('C1-POCLOUD'))
+        self.assertEqual(499, self.catalog.granule_count('C1-POCLOUD'))
+        self.assertEqual('G10002002-POCLOUD', self.catalog.granule_ids('C1-POCLOUD')[0])
+
+    def test_related_urls_from_catalog(self):
+        """With opendap_cmr.catalog set, the URLs of synced granules do not need a request"""
+        expected = opendap_cmr.get_related_urls('C1-POCLOUD', 'granule_G10000005-POCLOUD', service=self.standin.url)
+        self.catalog.sync('C1-POCLOUD')
+        opendap_cmr.catalog = self.catalog
+        requests_before = self.standin.requests
+        self.assertEqual(expected, opendap_cmr.get_related_urls('C1-POCLOUD', 'granule_G10000005-POCLOUD',
+                                                                service=self.standin.url))
+        self.assertEqual(expected, opendap_cmr.get_related_urls_from_granule_id('C1-POCLOUD', 'G10000005-POCLOUD',
+                                                                                service=self.standin.url))
+        granules = list(opendap_cmr.iter_collection_granule_urls('C1-POCLOUD', 10, service=self.standin.url))
+        self.assertEqual(10, len(granules))
+        self.assertEqual(0, self.standin.requests - requests_before)
+
+        # A granule the catalog does not have is looked up in CMR
+        self.assertEqual({}, opendap_cmr.get_related_urls('C1-POCLOUD', 'no-such-granule', service=self.standin.url))
+        self.assertEqual(1, self.standin.requests - requests_before)
+
+
+if __name__ == '__main__':
+    unittest.main()
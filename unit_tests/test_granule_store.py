@@ -0,0 +1,101 @@
+"""
+Test the compact granule store.
+"""
+import pickle
+import unittest
+
+import opendap_cmr
+from granule_store import GranuleStore
+from unit_tests import CMR_Responses
+
+
+class TestGranuleStore(unittest.TestCase):
+
+    def setUp(self):
+        self.records = {'G2081588885-POCLOUD': ('ascat_20121029_010001', 'ascat_20121029_010001.nc'),
+                        'G2081588886-POCLOUD': ('ascat_20121029_024501',),
+                        'G1000-GES_DISC': ('AIRS.2023.01.22', 'AIRS.2023.01.22.hdf')}
+        self.store = GranuleStore(records=self.records)
+
+    def test_mapping(self):
+        self.assertEqual(3, len(self.store))
+        self.assertEqual(list(self.records), list(self.store))
+        self.assertEqual(self.records, self.store)
+        self.assertEqual(self.store, self.records)
+        self.assertIn('G1000-GES_DISC', self.store)
+        self.assertNotIn('G1001-GES_DISC', self.store)
+        self.assertNotIn('G2081588885-LPDAAC', self.store)
+        self.assertNotIn(1000, self.store)
+        with self.assertRaises(KeyError):
+            self.store['G1001-GES_DISC']
+
+    def test_record(self):
+        record = self.store['G2081588885-POCLOUD']
+        self.assertEqual(('ascat_20121029_010001', 'ascat_20121029_010001.nc'), record)
+        self.assertEqual('ascat_20121029_010001', record[0])
+        self.assertEqual('ascat_20121029_010001.nc', record.producer_granule_id)
+        self.assertEqual('G2081588885-POCLOUD', record.concept_id)
+        self.assertEqual("('ascat_20121029_010001', 'ascat_20121029_010001.nc')", repr(record))
+
+        short = self.store['G2081588886-POCLOUD']
+        self.assertEqual(1, len(short))
+        with self.assertRaises(AttributeError):
+            short.producer_granule_id
+        with self.assertRaises(AttributeError):
+            record.size  # Records are views with __slots__, not objects with a __dict__
+
+    def test_replace_and_delete(self):
+        """A replaced key keeps its place, as with a dict"""
+        self.store['G2081588885-POCLOUD'] = ('new title',)
+        self.assertEqual(('new title',), self.store['G2081588885-POCLOUD'])
+        self.assertEqual(list(self.records), list(self.store))
+
+        del self.store['G2081588886-POCLOUD']
+        self.assertEqual(2, len(self.store))
+        self.assertNotIn('G2081588886-POCLOUD', self.store)
+        self.store['G2081588886-POCLOUD'] = ('back',)
+        self.assertEqual(['G2081588885-POCLOUD', 'G1000-GES_DISC', 'G2081588886-POCLOUD'], list(self.store))
+
+    def test_odd_keys(self):
+        """Keys that are not concept ids are stored whole"""
+        self.store['granule_0001'] = ('zero padded',)
+        self.store['G007-POCLOUD'] = ('leading zeros',)
+        self.assertEqual(('zero padded',), self.store['granule_0001'])
+        self.assertEqual(('leading zeros',), self.store['G007-POCLOUD'])
+        self.assertNotIn('G7-POCLOUD', self.store)
+
+    def test_values(self):
+        with self.assertRaises(TypeError):
+            self.store['G1-POCLOUD'] = 'a title'
+        with self.assertRaises(ValueError):
+            self.store['G1-POCLOUD'] = ('one', 'two', 'three')
+
+    def test_urls(self):
+        store = GranuleStore(('native_id', 'url'))
+        for n in range(1000):
+            store[f'G{n + 1}-POCLOUD'] = (f'granule_{n}', f'https://opendap.earthdata.nasa.gov/collections/C1/granules/granule_{n}')
+        store['G1001-POCLOUD'] = ('no slash', 'granule.nc')
+        store['G1002-POCLOUD'] = ('root', '/granule.nc')
+        self.assertEqual('https://opendap.earthdata.nasa.gov/collections/C1/granules/granule_9', store['G10-POCLOUD'].url)
+        self.assertEqual('granule.nc', store['G1001-POCLOUD'][1])
+        self.assertEqual('/granule.nc', store['G1002-POCLOUD'][1])
+        self.assertLess(store.nbytes, sum(len(n) + len(u) for n, u in store.values()))
+
+    def test_pickle(self):
+        self.assertEqual(self.records, pickle.loads(pickle.dumps(self.store)))
+
+    def test_processors(self):
+        self.assertEqual(opendap_cmr.collection_granules_dict(CMR_Responses.g2),
+                         opendap_cmr.collection_granules_store(CMR_Responses.g2))
+        self.assertEqual({}, opendap_cmr.collection_granules_store({}))
+
+    def test_merge_dict(self):
+        merged = opendap_cmr.merge_dict(GranuleStore(), self.store)
+        self.assertIs(self.store, merged)
+        merged = opendap_cmr.merge_dict(self.store, GranuleStore(records={'G5-POCLOUD': ('five',)}))
+        self.assertEqual(4, len(merged))
+        self.assertEqual(('five',), merged['G5-POCLOUD'])
+
+
+if __name__ == '__main__':
+    unittest.main()
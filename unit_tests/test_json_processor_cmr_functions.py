@@ -1,6 +1,6 @@
 
 import unittest
-import cmr
+import opendap_cmr as cmr
 
 
 # Unit tests
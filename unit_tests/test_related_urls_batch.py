@@ -0,0 +1,58 @@
+"""
+Test the bulk Related URL lookups in the opendap_cmr module.
+"""
+import unittest
+
+import opendap_cmr
+from benchmarks.cmr_standin import CMRStandIn
+from unit_tests import CMR_Responses
+
+
+class TestRelatedUrlsBatch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.standin = CMRStandIn(collections=1, granules=250).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.standin.stop()
+
+    def test_granule_data_urls_by_id(self):
+        """Each granule gets what granule_data_url_dict() returns for it"""
+        self.assertEqual({'G2081588885-POCLOUD': opendap_cmr.granule_data_url_dict(CMR_Responses.g1)},
+                         opendap_cmr.granule_data_urls_by_id(CMR_Responses.g1))
+        self.assertEqual({}, opendap_cmr.granule_data_urls_by_id({'feed': {}}))
+        self.assertEqual({}, opendap_cmr.granule_data_urls_by_id({'items': [{'umm': {}}]}))
+
+    def test_get_related_urls_from_granule_ids(self):
+        ids = [f'G1{n:07d}-POCLOUD' for n in range(1, 251, 2)]  # 125 granules
+        requests_before = self.standin.requests
+        urls = opendap_cmr.get_related_urls_from_granule_ids('C1-POCLOUD', ids, batch_size=50,
+                                                             service=self.standin.url)
+        self.assertEqual(3, self.standin.requests - requests_before)
+        self.assertEqual(ids, list(urls.keys()))
+        self.assertEqual(opendap_cmr.get_related_urls_from_granule_id('C1-POCLOUD', ids[0], service=self.standin.url),
+                         urls[ids[0]])
+
+    def test_batch_size_limit(self):
+        """The batches are kept small enough that the URLs fit in a request line"""
+        ids = [f'G1{n:07d}-POCLOUD' for n in range(1, 251)]
+        requests_before = self.standin.requests
+        urls = opendap_cmr.get_related_urls_from_granule_ids('C1-POCLOUD', ids, batch_size=2000,
+                                                             service=self.standin.url)
+        self.assertEqual(3, self.standin.requests - requests_before)  # 100, 100, 50
+        self.assertEqual(250, len(urls))
+
+    def test_iter_collection_granule_urls(self):
+        requests_before = self.standin.requests
+        granules = list(opendap_cmr.iter_collection_granule_urls('C1-POCLOUD', service=self.standin.url))
+        self.assertEqual(1, self.standin.requests - requests_before)
+        self.assertEqual(250, len(granules))
+        granule_id, urls = granules[0]
+        self.assertEqual('G10000001-POCLOUD', granule_id)
+        self.assertEqual('s3://pocloud-protected/SYNTHETIC/granule_G10000001-POCLOUD.nc', urls['URL1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import os
 import tempfile
 import unittest
 from unittest.mock import patch  # For mocking external dependencies
+import cmr_metrics
 import s3_driver as s3
 
 #unused
@@ -106,6 +107,18 @@ class MyTestCase(unittest.TestCase):
         self.assertNotEqual(local_path, "Imports/DACC/dmrrp-file.ext")
         self.assertNotEqual(file, "dmrrp-file.ext")
 
+    def test_copy_file_to_s3_error(self):
+        """The upload's own error is raised, and recorded, when the file is gone"""
+        error = RuntimeError('upload failed')
+        s3.opendap_cmr.metrics = cmr_metrics.Metrics()
+        self.addCleanup(setattr, s3.opendap_cmr, 'metrics', None)
+        with patch('s3_driver.get_s3_client') as client:
+            client.return_value.upload_file.side_effect = error
+            with self.assertRaises(RuntimeError) as raised:
+                s3.copy_file_to_s3(os.path.join(self.temp_dir, 'missing.dmrpp'), 'bucket', 'missing.dmrpp')
+        self.assertIs(error, raised.exception)
+        self.assertEqual({'0': 1}, s3.opendap_cmr.metrics.report()['endpoints']['upload']['status'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-import cmr
+import opendap_cmr as cmr
 
 
 class TestSimpleCMR(unittest.TestCase):
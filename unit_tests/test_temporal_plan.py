@@ -0,0 +1,123 @@
+"""
+Test splitting a collection's temporal extent into windows of about the same number of granules.
+"""
+import datetime
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import fileOutput
+import opendap_cmr
+import temporal_plan
+from benchmarks.cmr_standin import CMRStandIn
+from unit_tests import CMR_Responses
+
+
+class TestTemporalPlan(unittest.TestCase):
+
+    def test_granule_time_dict(self):
+        times = opendap_cmr.granule_time_dict(CMR_Responses.g1)
+        self.assertEqual({'G2081588885-POCLOUD': ('2012-10-29T01:00:01.000Z', '2012-10-29T02:41:59.000Z')}, times)
+        self.assertEqual({}, opendap_cmr.granule_time_dict(CMR_Responses.g2))
+
+    def test_parse_time(self):
+        expected = datetime.datetime(2012, 10, 29, 1, 0, 1)
+        self.assertEqual(expected, temporal_plan.parse_time('2012-10-29T01:00:01.000Z'))
+        self.assertEqual(expected, temporal_plan.parse_time('2012-10-29T01:00:01Z'))
+        self.assertEqual(expected, temporal_plan.parse_time('2012-10-29T03:00:01+02:00'))
+        self.assertEqual(expected, temporal_plan.parse_time('2012-10-28T23:30:01-0130'))
+        self.assertEqual(expected.replace(microsecond=500000), temporal_plan.parse_time('2012-10-29T01:00:01.5Z'))
+        self.assertEqual(expected.replace(microsecond=123456), temporal_plan.parse_time('2012-10-29T01:00:01.1234567Z'))
+        self.assertEqual(datetime.datetime(2012, 10, 29), temporal_plan.parse_time('2012-10-29'))
+        with self.assertRaises(ValueError):
+            temporal_plan.parse_time('10/29/2012')
+        self.assertEqual('2012-10-29T01:00:01Z,2012-10-29T01:00:01Z', temporal_plan.cmr_range(expected, expected))
+
+    def test_plan(self):
+        with CMRStandIn(collections=1, granules=5000) as standin:
+            self.assertEqual((datetime.datetime(2000, 1, 1), datetime.datetime(2013, 9, 8)),
+                             temporal_plan.collection_extent('C1-POCLOUD', service=standin.url))
+            windows = temporal_plan.plan_collection('C1-POCLOUD', target=1000, service=standin.url)
+
+        self.assertTrue(all(0 < hits <= 1000 for _, _, hits in windows))
+        self.assertEqual(datetime.datetime(2000, 1, 1), windows[0][0])
+        self.assertEqual(datetime.datetime(2013, 9, 8), windows[-1][1])
+        for (_, end, _), (start, _, _) in zip(windows, windows[1:]):
+            self.assertEqual(end, start)
+        self.assertTrue(5000 <= sum(hits for _, _, hits in windows) < 5000 + len(windows))
+
+    def test_small_collection(self):
+        """A collection smaller than the target is one window, found with three requests"""
+        with CMRStandIn(collections=1, granules=40) as standin:
+            windows = temporal_plan.plan_collection('C1-POCLOUD', target=2000, service=standin.url)
+        self.assertEqual([(datetime.datetime(2000, 1, 1), datetime.datetime(2000, 2, 9), 40)], windows)
+        self.assertEqual(3, standin.requests)
+
+    def test_monthly_hits(self):
+        """The stand-in's granules are one a day from 2000-01-01"""
+        with CMRStandIn(collections=1, granules=800) as standin:
+            months = temporal_plan.collection_monthly_hits('C1-POCLOUD', service=standin.url)
+        self.assertEqual(2 + 3 + 36, standin.requests)  # first/last, the years, the months of those years
+        self.assertEqual(36, len(months))
+        self.assertEqual((31, 29, 0), (months[(2000, 1)], months[(2000, 2)], months[(2002, 12)]))
+        self.assertEqual(800, sum(months.values()))
+
+    def test_summary_paths_agree(self):
+        """Counting the granules found and counting with hits queries write the same summary table"""
+        with CMRStandIn(collections=1, granules=500, duration=36) as standin:  # Granules span two days
+            hits = temporal_plan.collection_monthly_hits('C1-POCLOUD', service=standin.url)
+            extents = opendap_cmr.process_request(f'{standin.url}/search/granules.umm_json?'
+                                                  f'collection_concept_id=C1-POCLOUD',
+                                                  opendap_cmr.granule_time_dict, opendap_cmr.get_session(),
+                                                  page_size=2000)
+        found = temporal_plan.count_months(extents.values())
+        self.assertEqual((31, 30), (found[(2000, 1)], found[(2000, 2)]))  # 29 days, and the granule of Jan 31
+        self.assertEqual({month: count for month, count in hits.items() if count}, dict(found))
+
+        tables = []
+        for months in (hits, found):
+            rows = []
+            with patch('fileOutput.update_summary', rows.append):
+                fileOutput.update_summary_months(months)
+            tables.append(rows)
+        self.assertEqual(tables[0], tables[1])
+
+    def test_update_summary_months(self):
+        """As when each month was searched, a table for each year from the first with granules to this one"""
+        rows = []
+        with patch('fileOutput.update_summary', rows.append):
+            fileOutput.update_summary_months({(2001, 2): 5, (2003, 12): 1})
+        this_year = datetime.date.today().year
+        self.assertEqual([(2001, 5), (2002, 5)] + [(year, 6) for year in range(2003, this_year + 1)],
+                         [row[-1] for row in rows])
+        self.assertEqual([0, 5] + [0] * 10, [count for _, count in rows[0][:12]])
+
+    def test_summary_table(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch('fileOutput.local_path', os.path.join(tmp, 'summary.txt')):
+                fileOutput.update_summary_months({(2001, 2): 5, (2001, 3): 12})
+                with open(fileOutput.local_path) as f:
+                    table = f.read().splitlines()
+        self.assertEqual('2001: 17', table[0])
+        self.assertEqual('| Feb  |', table[2][8:16])
+        self.assertEqual('|  5   |', table[4][8:16])
+        self.assertEqual('|  12  |', table[4][16:24])
+
+    def test_count_months(self):
+        """A granule is counted in every month its temporal extent overlaps"""
+        self.assertEqual([(2020, 1)], temporal_plan.granule_months('2020-01-05T00:00:00Z', ''))
+        self.assertEqual([(2019, 12), (2020, 1), (2020, 2)],
+                         temporal_plan.granule_months('2019-12-31T23:00:00.000Z', '2020-02-01T00:00:00.000Z'))
+        months = temporal_plan.count_months([('2020-01-05T00:00:00Z', '2020-01-06T00:00:00Z'),
+                                             ('2020-01-31T12:00:00Z', '2020-02-01T12:00:00Z')])
+        self.assertEqual({(2020, 1): 2, (2020, 2): 1}, months)
+
+    def test_no_granules(self):
+        with CMRStandIn(collections=1, granules=0) as standin:
+            with self.assertRaises(opendap_cmr.CMRException):
+                temporal_plan.plan_collection('C1-POCLOUD', service=standin.url)
+
+
+if __name__ == '__main__':
+    unittest.main()
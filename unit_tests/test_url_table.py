@@ -0,0 +1,72 @@
+"""
+Test the prefix-compressed URL table.
+"""
+import os
+import tempfile
+import unittest
+
+from url_table import URLTable
+
+S3 = 's3://podaac-ops-cumulus-protected/ASCATB-L2-25km'
+
+
+class TestURLTable(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [(f'G{2081588885 + n}-POCLOUD', f'{S3}/ascat_201210{n // 10 + 10}_0{n % 10}0001_metopb_ovw.l2.nc')
+                     for n in range(40)]
+        self.rows.append(('G2081588885-POCLOUD', 'https://archive.podaac.earthdata.nasa.gov/ascat_20121010_000001.nc'))
+        self.rows.append(('', 'no-prefix.nc'))
+        self.table = URLTable()
+        self.table.extend(self.rows)
+
+    def test_iterate(self):
+        self.assertEqual(len(self.rows), len(self.table))
+        self.assertEqual([url for _, url in self.rows], list(self.table))
+        self.assertEqual(self.rows, list(self.table.items()))
+        self.assertEqual(self.rows[-1][1], self.table[-1])
+        self.assertEqual(self.rows[37][1], self.table[37])
+        with self.assertRaises(IndexError):
+            self.table[len(self.rows)]
+
+    def test_prefixes(self):
+        self.assertEqual([f'{S3}/', 'https://archive.podaac.earthdata.nasa.gov/', ''], self.table.prefixes)
+        self.assertLess(self.table.nbytes, sum(len(g) + len(u) for g, u in self.rows) / 2)
+
+    def test_lookup(self):
+        self.assertEqual([self.rows[0][1], self.rows[40][1]], self.table.urls('G2081588885-POCLOUD'))
+        self.assertEqual([self.rows[17][1]], self.table.urls('G2081588902-POCLOUD'))
+        self.assertEqual([], self.table.urls('G1-POCLOUD'))
+        self.assertIn('G2081588924-POCLOUD', self.table)
+        self.assertNotIn('G2081588925-POCLOUD', self.table)
+
+        self.table.add(f'{S3}/late.nc', 'G1-POCLOUD')
+        self.assertEqual([f'{S3}/late.nc'], self.table.urls('G1-POCLOUD'))
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'urls')
+            self.table.save(path)
+            loaded = URLTable.load(path)
+            self.assertEqual(self.rows, list(loaded.items()))
+            self.assertEqual([self.rows[3][1]], loaded.urls('G2081588888-POCLOUD'))
+
+            # A loaded table can be added to
+            loaded.add(f'{S3}/more.nc', 'G2-POCLOUD')
+            self.assertEqual(f'{S3}/more.nc', loaded[-1])
+            self.assertEqual(3, len(loaded.prefixes))
+
+            empty = os.path.join(tmp, 'empty')
+            URLTable().save(empty)
+            self.assertEqual(0, len(URLTable.load(empty)))
+
+            with open(path, 'r+b') as f:
+                f.truncate(100)
+            with self.assertRaises(ValueError):
+                URLTable.load(path)
+            with self.assertRaises(ValueError):
+                URLTable.load(__file__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+"""
+A compact table of granule URLs, like the ones s3_driver harvests.
+
+The URLs of a collection's granules repeat the same long bucket and path
+(e.g., 's3://podaac-ops-cumulus-protected/ASCATB-L2-25km/') and the names of
+neighbouring granules differ only in their last few characters. A URLTable
+stores each distinct prefix (the part of a URL up to the last '/') once, and the
+rest of each URL, and each granule id, front coded: a row stores only the part
+that differs from the row before it, with a full value every BLOCK rows so
+any row can be read without reading all the ones before it.
+
+A table can be saved to a file and loaded again. The file holds the arrays
+as they are in memory, so loading a million URLs takes a few tens of
+milliseconds:
+
+    table = url_table.URLTable()
+    table.add('s3://podaac-ops-cumulus-protected/ASCATB-L2-25km/ascat_20121029_010001.nc', 'G2081588885-POCLOUD')
+    table.save('logs/C2036877806-POCLOUD.urls')
+    table = url_table.URLTable.load('logs/C2036877806-POCLOUD.urls')
+    table.urls('G2081588885-POCLOUD')
+
+Example usage:
+    ./url_table.py logs/C2036877806-POCLOUD.urls                       # print a summary
+    ./url_table.py -g G2081588885-POCLOUD logs/C2036877806-POCLOUD.urls
+"""
+import os
+import struct
+import sys
+from array import array
+
+BLOCK = 16          # Store a full value every BLOCK rows
+MAGIC = b'URLTABLE 1 '
+
+
+class FrontCodedColumn:
+    """
+    A column of strings stored as UTF-8 bytes. Each value is stored as the lengths
+    of the start and the end it shares with the value before it, and the part in
+    between (for granule names, often a date or an orbit number). The offset of
+    the first value of each block is kept; the other values are found from the
+    lengths of the ones before them in the block.
+    """
+
+    def __init__(self):
+        self.data = bytearray()
+        self.starts = array('Q')
+        self.lengths = array('H')
+        self.shared = array('B')
+        self.tails = array('B')
+        self._last = ''
+
+    def append(self, value: str):
+        shared = tail = 0
+        if len(self.lengths) % BLOCK == 0:
+            self.starts.append(len(self.data))
+        else:
+            last = self._last
+            shared = len(last) if value.startswith(last) else len(os.path.commonprefix((value, last)))
+            shared = min(shared, 255)
+            tail = len(os.path.commonprefix((value[shared:][::-1], last[shared:][::-1])))
+            tail = min(tail, 255)
+        rest = value[shared:len(value) - tail].encode()
+        if len(rest) > 0xFFFF:
+            raise ValueError(f'Values longer than 64k bytes cannot be stored ({value[:64]}...)')
+        self.data += rest
+        self.lengths.append(len(rest))
+        self.shared.append(shared)
+        self.tails.append(tail)
+        self._last = value
+
+    def get(self, i: int) -> str:
+        first = i - i % BLOCK
+        start = self.starts[i // BLOCK]
+        value = ''
+        for j in range(first, i + 1):
+            end = start + self.lengths[j]
+            tail = self.tails[j]
+            value = value[:self.shared[j]] + self.data[start:end].decode() + (value[-tail:] if tail else '')
+            start = end
+        return value
+
+    def __iter__(self):
+        value = ''
+        start = 0
+        data = self.data
+        for shared, tail, length in zip(self.shared, self.tails, self.lengths):
+            end = start + length
+            value = value[:shared] + data[start:end].decode() + (value[-tail:] if tail else '')
+            start = end
+            yield value
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self.data) + self.starts.itemsize * len(self.starts)
+                + self.lengths.itemsize * len(self.lengths) + len(self.shared) + len(self.tails))
+
+
+class URLTable:
+    """
+    A list of (granule id, URL) rows. The URLs can be iterated over in the order
+    they were added and looked up by granule id.
+    """
+
+    def __init__(self):
+        self._prefixes = []
+        self._prefix_ids = {}
+        self._prefix = array('I')
+        self._rests = FrontCodedColumn()
+        self._granules = FrontCodedColumn()
+        self._order = None  # The rows sorted by granule id, made when a granule is first looked up
+
+    def add(self, url: str, granule_id=''):
+        """
+        Add a URL to the end of the table.
+
+        :param url: The URL
+        :param granule_id: The granule the URL belongs to, if known
+        """
+        prefix, slash, rest = url.rpartition('/')
+        prefix = prefix + slash
+        prefix_id = self._prefix_ids.get(prefix)
+        if prefix_id is None:
+            prefix_id = self._prefix_ids[prefix] = len(self._prefixes)
+            self._prefixes.append(prefix)
+        self._prefix.append(prefix_id)
+        self._rests.append(rest)
+        self._granules.append(granule_id)
+        self._order = None
+
+    def extend(self, urls):
+        """:param urls: URLs, or (granule id, URL) pairs"""
+        for url in urls:
+            if isinstance(url, str):
+                self.add(url)
+            else:
+                self.add(url[1], url[0])
+
+    def url(self, row: int) -> str:
+        return self._prefixes[self._prefix[row]] + self._rests.get(row)
+
+    def granule(self, row: int) -> str:
+        return self._granules.get(row)
+
+    def __len__(self):
+        return len(self._prefix)
+
+    def __iter__(self):
+        """Iterate over the URLs in the order they were added"""
+        prefixes = self._prefixes
+        for prefix_id, rest in zip(self._prefix, self._rests):
+            yield prefixes[prefix_id] + rest
+
+    def __getitem__(self, row: int) -> str:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('URLTable index out of range')
+        return self.url(row)
+
+    def items(self):
+        """Iterate over the (granule id, URL) rows"""
+        return zip(self._granules, self)
+
+    def _sorted(self) -> array:
+        if self._order is None:
+            granules = list(self._granules)
+            self._order = array('I', sorted(range(len(granules)), key=granules.__getitem__))
+        return self._order
+
+    def urls(self, granule_id: str) -> list:
+        """
+        :param granule_id: The granule
+        :returns: The URLs of the granule, in the order they were added. An empty list
+            if the granule is not in the table.
+        """
+        order = self._sorted()
+        # bisect_left() only takes a key in Python 3.10 and later
+        first, last = 0, len(order)
+        while first < last:
+            middle = (first + last) // 2
+            if self.granule(order[middle]) < granule_id:
+                first = middle + 1
+            else:
+                last = middle
+        rows = []
+        for i in range(first, len(order)):
+            if self.granule(order[i]) != granule_id:
+                break
+            rows.append(order[i])
+        return [self.url(row) for row in sorted(rows)]
+
+    def __contains__(self, granule_id) -> bool:
+        return isinstance(granule_id, str) and len(self.urls(granule_id)) > 0
+
+    @property
+    def prefixes(self) -> list:
+        return list(self._prefixes)
+
+    @property
+    def nbytes(self) -> int:
+        """The approximate size of the table's arrays and buffers, in bytes"""
+        return (self._rests.nbytes + self._granules.nbytes + self._prefix.itemsize * len(self._prefix)
+                + sum(len(prefix) for prefix in self._prefixes)
+                + (self._order.itemsize * len(self._order) if self._order is not None else 0))
+
+    def _sections(self) -> list:
+        return [self._prefix,
+                self._rests.data, self._rests.starts, self._rests.lengths, self._rests.shared, self._rests.tails,
+                self._granules.data, self._granules.starts, self._granules.lengths, self._granules.shared,
+                self._granules.tails,
+                self._sorted()]
+
+    def save(self, path: str):
+        """
+        Save the table. The granule index is made, if it has not been, and saved with it.
+
+        :param path: The file
+        """
+        prefixes = '\n'.join(self._prefixes).encode()
+        with open(path, 'wb') as f:
+            f.write(MAGIC + sys.byteorder.encode() + b'\n')
+            f.write(struct.pack('<Q', len(prefixes)))
+            f.write(prefixes)
+            for section in self._sections():
+                f.write(struct.pack('<Q', len(section) * (section.itemsize if isinstance(section, array) else 1)))
+                f.write(section)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Load a table saved by save().
+
+        :param path: The file
+        :returns: The URLTable
+        :raises ValueError: If the file is not a saved URLTable
+        """
+        with open(path, 'rb') as f:
+            header = f.readline()
+            if not header.startswith(MAGIC):
+                raise ValueError(f'{path} is not a URL table')
+            swap = header[len(MAGIC):].strip().decode() != sys.byteorder
+
+            def section() -> bytes:
+                size = f.read(8)
+                data = f.read(struct.unpack('<Q', size)[0]) if len(size) == 8 else b''
+                if len(size) != 8 or len(data) != struct.unpack('<Q', size)[0]:
+                    raise ValueError(f'{path} is truncated')
+                return data
+
+            table = cls()
+            prefixes = section().decode()
+            sections = table._sections()[:-1] + [array('I')]
+            for target in sections:
+                data = section()
+                if isinstance(target, array):
+                    target.frombytes(data)
+                    if swap:
+                        target.byteswap()
+                else:
+                    target += data
+
+        table._order = sections[-1]
+        table._prefixes = prefixes.split('\n') if len(table) > 0 else []
+        table._prefix_ids = {prefix: i for i, prefix in enumerate(table._prefixes)}
+        table._rests._last = table._rests.get(len(table) - 1) if len(table) > 0 else ''
+        table._granules._last = table._granules.get(len(table) - 1) if len(table) > 0 else ''
+        return table
+
+
+def main():
+    import argparse
+    import time
+    parser = argparse.ArgumentParser(description="Print the contents of a saved URL table.")
+    parser.add_argument("-g", "--granule", help="print the URLs of this granule")
+    parser.add_argument("-a", "--all", help="print every granule id and URL", action="store_true")
+    parser.add_argument("table", help="the file")
+    args = parser.parse_args()
+
+    start = time.time()
+    table = URLTable.load(args.table)
+    duration = time.time() - start
+    if args.granule:
+        for url in table.urls(args.granule):
+            print(url)
+    elif args.all:
+        for granule_id, url in table.items():
+            print(f'{granule_id}: {url}')
+    else:
+        print(f'{len(table)} URLs, {len(table.prefixes)} prefixes, {table.nbytes / 1e6:.1f}MB, '
+              f'loaded in {duration:.2f}s')
+
+
+if __name__ == "__main__":
+    main()